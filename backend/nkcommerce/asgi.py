@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nkcommerce.settings')
 
 application = get_asgi_application()
+
+# Fichiers statiques et téléversés servis avant Django (voir nkcommerce.fichiers)
+from nkcommerce.fichiers import FichiersASGI  # noqa: E402
+
+application = FichiersASGI(application)
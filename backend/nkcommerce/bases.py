@@ -0,0 +1,115 @@
+"""
+Configuration de la base `default` selon l'environnement.
+
+`DB_MOTEUR` choisit le moteur (`sqlite`, par défaut, ou `postgresql`) et
+`DB_PROFIL` ses réglages de connexion :
+
+- `developpement` (défaut) : une connexion par requête, comme Django par
+  défaut ;
+- `production` : connexions persistantes vérifiées avant réutilisation
+  (`CONN_MAX_AGE`, `CONN_HEALTH_CHECKS`). Avec PostgreSQL, pool natif de
+  Django 5 (`OPTIONS['pool']`, nécessite `psycopg[pool]`) à la place des
+  connexions persistantes. Avec SQLite, journal WAL (lectures concurrentes
+  d'une écriture), `synchronous=NORMAL`, attente des verrous
+  (`busy_timeout`) et transactions `IMMEDIATE`.
+
+Chaque réglage du profil peut être remplacé individuellement (`DB_CONN_MAX_AGE`,
+`DB_POOL`, `DB_POOL_MIN`, `DB_POOL_MAX`, `DB_POOL_TIMEOUT`, `DB_SQLITE_PRAGMAS`, `DB_SQLITE_WAL`,
+`DB_SQLITE_BUSY_TIMEOUT`, `DB_SQLITE_SYNCHRONOUS`, `DB_SQLITE_TRANSACTION_MODE`).
+La commande `benchmark_connections` compare le coût de connexion par requête
+de ces modes.
+
+`DB_REPLIQUES` déclare des répliques en lecture (`repliques`) : chemins de
+fichiers SQLite, copies de la base tenues à jour par `sync_sqlite_replicas`,
+ou hôtes PostgreSQL (`hote` ou `hote:port`) en réplication depuis la primaire.
+"""
+import copy
+import os
+
+PROFILS = ('developpement', 'production')
+
+
+def _booleen(valeur):
+    return str(valeur).strip().lower() in ('1', 'true', 'oui', 'yes', 'on')
+
+
+def _duree(valeur):
+    """`CONN_MAX_AGE` : secondes, ou `none` pour des connexions sans limite de durée."""
+    return None if str(valeur).strip().lower() == 'none' else int(valeur)
+
+
+def pragmas_sqlite(wal=True, busy_timeout=5000, synchronous='NORMAL'):
+    """Commandes exécutées à l'ouverture de chaque connexion SQLite (`OPTIONS['init_command']`)."""
+    pragmas = [f'PRAGMA busy_timeout={int(busy_timeout)}', f'PRAGMA synchronous={synchronous}']
+    if wal:
+        pragmas.insert(0, 'PRAGMA journal_mode=WAL')
+    return ';'.join(pragmas)
+
+
+def base_de_donnees(base_dir, environ=os.environ):
+    """Dictionnaire de `DATABASES['default']`."""
+    moteur = environ.get('DB_MOTEUR', 'sqlite')
+    profil = environ.get('DB_PROFIL', 'developpement')
+    if profil not in PROFILS:
+        raise ValueError(f"DB_PROFIL={profil!r} : valeurs possibles {', '.join(PROFILS)}")
+    production = profil == 'production'
+
+    if moteur == 'sqlite':
+        config = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('DB_NAME', base_dir / 'db.sqlite3'),
+            'OPTIONS': {},
+        }
+        if _booleen(environ.get('DB_SQLITE_PRAGMAS', production)):
+            config['OPTIONS']['init_command'] = pragmas_sqlite(
+                wal=_booleen(environ.get('DB_SQLITE_WAL', True)),
+                busy_timeout=environ.get('DB_SQLITE_BUSY_TIMEOUT', 5000),
+                synchronous=environ.get('DB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+            )
+            # Prendre le verrou d'écriture dès le début d'une transaction plutôt
+            # qu'échouer (database is locked) en cours de route
+            config['OPTIONS']['transaction_mode'] = environ.get('DB_SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
+    elif moteur == 'postgresql':
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('DB_NAME', 'nkcommerce'),
+            'USER': environ.get('DB_USER', ''),
+            'PASSWORD': environ.get('DB_PASSWORD', ''),
+            'HOST': environ.get('DB_HOST', ''),
+            'PORT': environ.get('DB_PORT', ''),
+            'OPTIONS': {},
+        }
+        if _booleen(environ.get('DB_POOL', production)):
+            config['OPTIONS']['pool'] = {
+                'min_size': int(environ.get('DB_POOL_MIN', 2)),
+                'max_size': int(environ.get('DB_POOL_MAX', 10)),
+                'timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+            }
+    else:
+        raise ValueError(f"DB_MOTEUR={moteur!r} : valeurs possibles sqlite, postgresql")
+
+    if config['OPTIONS'].get('pool'):
+        # Le pool remplace les connexions persistantes, que Django refuse avec lui
+        config['CONN_MAX_AGE'] = 0
+    else:
+        config['CONN_MAX_AGE'] = _duree(environ.get('DB_CONN_MAX_AGE', 600 if production else 0))
+    config['CONN_HEALTH_CHECKS'] = config['CONN_MAX_AGE'] != 0
+    return config
+
+
+def repliques(defaut, environ=os.environ):
+    """Alias `replique_<n>` de `DATABASES`, mêmes réglages que `defaut` sur une autre base."""
+    configs = {}
+    for numero, cible in enumerate(filter(None, environ.get('DB_REPLIQUES', '').split(',')), 1):
+        config = copy.deepcopy(defaut)
+        if 'sqlite' in config['ENGINE']:
+            config['NAME'] = cible.strip()
+            # Une copie ne reçoit aucune écriture : inutile de prendre le verrou d'écriture
+            config['OPTIONS'].pop('transaction_mode', None)
+        else:
+            hote, _, port = cible.strip().partition(':')
+            config.update(HOST=hote, PORT=port or config['PORT'])
+        # Sous test, les répliques lisent la base de test de la primaire
+        config['TEST'] = {'MIRROR': 'default'}
+        configs[f'replique_{numero}'] = config
+    return configs
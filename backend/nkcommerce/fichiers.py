@@ -0,0 +1,393 @@
+"""
+Service des fichiers statiques et téléversés, devant l'application Django.
+
+`FichiersWSGI` et `FichiersASGI` enveloppent les applications de `wsgi.py`
+et `asgi.py` : les requêtes sous `STATIC_URL` et `MEDIA_URL` sont servies
+directement depuis `STATIC_ROOT` et `MEDIA_ROOT`, sans traverser les
+middlewares. Un déploiement sur une seule machine n'a pas besoin d'un
+serveur web séparé pour les fichiers.
+
+- envoi sans copie : `wsgi.file_wrapper` (sendfile sous gunicorn) ou
+  l'extension ASGI `http.response.zerocopy` quand le serveur la propose,
+  lecture par blocs sinon ;
+- requêtes conditionnelles (`If-None-Match`, `If-Modified-Since`) et plages
+  d'octets (`Range`, `If-Range`) ;
+- variantes précompressées `.br` et `.gz`, écrites par `collectstatic` avec
+  `StockageStatiqueCompresse` et choisies selon `Accept-Encoding` ;
+- `Cache-Control` immuable pour les noms qui changent avec le contenu
+  (statiques du manifeste, images nommées par empreinte).
+"""
+import asyncio
+import gzip
+import mimetypes
+import os
+import re
+import stat
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.handlers.wsgi import get_path_info
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from products.stockage import CACHE_IMMUABLE, est_immuable
+
+try:
+    import brotli
+except ImportError:  # variantes .br seulement si le module est installé
+    brotli = None
+
+TAILLE_BLOC = 64 * 1024
+CACHE_REVALIDER = 'public, no-cache'
+# Variantes précompressées, par ordre de préférence
+ENCODAGES = (('br', '.br'), ('gzip', '.gz'))
+EXTENSIONS_COMPRESSIBLES = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico', '.wasm',
+}
+TAILLE_MINIMALE_COMPRESSION = 1024
+
+# `style.<12 hexa>.css` : nom produit par ManifestStaticFilesStorage
+_STATIQUE_HACHE = re.compile(r'\.[0-9a-f]{12}\.[\w]+$')
+
+
+def statique_immuable(nom):
+    return bool(_STATIQUE_HACHE.search(nom))
+
+
+class Reponse:
+    """Réponse préparée par `Fichiers.repondre`, envoyée par l'adaptateur WSGI ou ASGI."""
+
+    def __init__(self, statut, en_tetes, chemin=None, debut=0, longueur=0, corps=b''):
+        self.statut = statut
+        self.en_tetes = en_tetes
+        self.chemin = chemin
+        self.debut = debut
+        self.longueur = longueur
+        self.corps = corps
+        self.complet = False
+
+    @property
+    def ligne_statut(self):
+        return f'{self.statut} {HTTPStatus(self.statut).phrase}'
+
+
+def _erreur(statut, *en_tetes):
+    corps = HTTPStatus(statut).phrase.encode()
+    return Reponse(statut, [
+        ('Content-Type', 'text/plain; charset=utf-8'),
+        ('Content-Length', str(len(corps))),
+        *en_tetes,
+    ], corps=corps)
+
+
+def _encodages_acceptes(valeur):
+    acceptes = set()
+    for element in valeur.split(','):
+        nom, _, parametres = element.strip().partition(';')
+        if parametres.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        acceptes.add(nom.strip().lower())
+    return acceptes
+
+
+def _plage(valeur, taille):
+    """
+    (début, fin incluse) de l'en-tête `Range`, None pour l'ignorer (syntaxe
+    inconnue, plages multiples) ou False si elle est hors du fichier.
+    """
+    unite, _, plages = valeur.partition('=')
+    if unite.strip().lower() != 'bytes' or ',' in plages:
+        return None
+    debut, tiret, fin = plages.strip().partition('-')
+    if not tiret or not (debut or fin) or not (debut or '0').isdigit() or not (fin or '0').isdigit():
+        return None
+    if not debut:
+        # Suffixe : les N derniers octets
+        longueur = int(fin)
+        if not longueur or not taille:
+            return False
+        return max(taille - longueur, 0), taille - 1
+    debut = int(debut)
+    fin = min(int(fin), taille - 1) if fin else taille - 1
+    if debut >= taille:
+        return False
+    if fin < debut:
+        return None
+    return debut, fin
+
+
+def _url_prefixe(url):
+    if not url:
+        return None
+    url = urlsplit(url)
+    if url.netloc:
+        return None  # servi par un autre domaine (CDN)
+    return '/' + url.path.strip('/') + '/'
+
+
+class Fichiers:
+    """Résout une URL vers un fichier d'un des dossiers montés et prépare la réponse."""
+
+    def __init__(self, montages):
+        # (préfixe d'URL, dossier, fonction nom -> immuable)
+        self.montages = [
+            (prefixe, os.path.realpath(racine), immuable)
+            for prefixe, racine, immuable in montages if prefixe and racine
+        ]
+
+    @classmethod
+    def depuis_reglages(cls):
+        return cls([
+            (_url_prefixe(settings.STATIC_URL), settings.STATIC_ROOT, statique_immuable),
+            (_url_prefixe(settings.MEDIA_URL), settings.MEDIA_ROOT, est_immuable),
+        ])
+
+    def trouver(self, path):
+        for prefixe, racine, immuable in self.montages:
+            if path.startswith(prefixe):
+                return racine, path[len(prefixe):], immuable
+        return None
+
+    def _stat(self, chemin):
+        try:
+            infos = os.stat(chemin)
+        except (OSError, ValueError):
+            return None
+        return infos if stat.S_ISREG(infos.st_mode) else None
+
+    def repondre(self, methode, path, en_tetes):
+        """
+        Réponse à une requête sous un des préfixes montés, None pour laisser
+        passer la requête à l'application. `en_tetes` : noms en minuscules.
+        """
+        trouve = self.trouver(path)
+        if trouve is None:
+            return None
+        racine, nom, immuable = trouve
+        if methode not in ('GET', 'HEAD'):
+            return _erreur(405, ('Allow', 'GET, HEAD'))
+
+        chemin = os.path.realpath(os.path.join(racine, nom))
+        infos = self._stat(chemin) if chemin.startswith(racine + os.sep) else None
+        if infos is None:
+            return _erreur(404)
+
+        type_contenu, _ = mimetypes.guess_type(nom)
+        type_contenu = type_contenu or 'application/octet-stream'
+        if type_contenu.startswith('text/') or type_contenu in ('application/javascript', 'application/json'):
+            type_contenu += '; charset=utf-8'
+        en_tetes_reponse = [
+            ('Content-Type', type_contenu),
+            ('Cache-Control', CACHE_IMMUABLE if immuable(nom) else CACHE_REVALIDER),
+            ('Accept-Ranges', 'bytes'),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+
+        # Variante précompressée, sauf pour une plage (les plages portent sur l'original)
+        variantes = {
+            encodage: (chemin + suffixe, variante)
+            for encodage, suffixe in ENCODAGES
+            if (variante := self._stat(chemin + suffixe)) and variante.st_mtime >= infos.st_mtime
+        }
+        encodage = None
+        if variantes:
+            en_tetes_reponse.append(('Vary', 'Accept-Encoding'))
+            if 'range' not in en_tetes:
+                acceptes = _encodages_acceptes(en_tetes.get('accept-encoding', ''))
+                encodage = next((encodage for encodage in variantes if encodage in acceptes), None)
+        if encodage:
+            chemin, infos = variantes[encodage]
+            en_tetes_reponse.append(('Content-Encoding', encodage))
+
+        etag = f'"{infos.st_mtime_ns:x}-{infos.st_size:x}{"-" + encodage if encodage else ""}"'
+        derniere_modification = int(infos.st_mtime)
+        en_tetes_reponse += [('ETag', etag), ('Last-Modified', http_date(derniere_modification))]
+
+        if self.non_modifie(en_tetes, etag, derniere_modification):
+            return Reponse(304, [(cle, valeur) for cle, valeur in en_tetes_reponse
+                                 if cle in ('Cache-Control', 'Vary', 'ETag', 'Last-Modified')])
+
+        taille = infos.st_size
+        plage = None
+        if 'range' in en_tetes and self.plage_applicable(en_tetes, etag, derniere_modification):
+            plage = _plage(en_tetes['range'], taille)
+        if plage is False:
+            return _erreur(416, ('Content-Range', f'bytes */{taille}'))
+        if plage:
+            debut, fin = plage
+            en_tetes_reponse += [
+                ('Content-Range', f'bytes {debut}-{fin}/{taille}'),
+                ('Content-Length', str(fin - debut + 1)),
+            ]
+            return Reponse(206, en_tetes_reponse, chemin, debut, fin - debut + 1)
+
+        en_tetes_reponse.append(('Content-Length', str(taille)))
+        reponse = Reponse(200, en_tetes_reponse, chemin, 0, taille)
+        reponse.complet = True
+        return reponse
+
+    def non_modifie(self, en_tetes, etag, derniere_modification):
+        if 'if-none-match' in en_tetes:
+            valeur = en_tetes['if-none-match'].strip()
+            # Comparaison faible : W/"x" correspond à "x"
+            return valeur == '*' or etag in [
+                candidat.removeprefix('W/') for candidat in parse_etags(valeur)
+            ]
+        depuis = parse_http_date_safe(en_tetes.get('if-modified-since', ''))
+        return depuis is not None and derniere_modification <= depuis
+
+    def plage_applicable(self, en_tetes, etag, derniere_modification):
+        """`If-Range` : ne renvoyer une plage que si la copie du client est à jour."""
+        if 'if-range' not in en_tetes:
+            return True
+        valeur = en_tetes['if-range'].strip()
+        if valeur.startswith('"'):
+            return valeur == etag
+        return parse_http_date_safe(valeur) == derniere_modification
+
+
+def _lire(fichier, debut, longueur):
+    with fichier:
+        fichier.seek(debut)
+        while longueur > 0:
+            bloc = fichier.read(min(TAILLE_BLOC, longueur))
+            if not bloc:
+                break
+            longueur -= len(bloc)
+            yield bloc
+
+
+class FichiersWSGI:
+    """Enveloppe une application WSGI : sert les fichiers, transmet le reste."""
+
+    def __init__(self, application, fichiers=None):
+        self.application = application
+        self.fichiers = fichiers or Fichiers.depuis_reglages()
+
+    def __call__(self, environ, start_response):
+        en_tetes = {
+            cle[5:].replace('_', '-').lower(): valeur
+            for cle, valeur in environ.items() if cle.startswith('HTTP_')
+        }
+        methode = environ['REQUEST_METHOD'].upper()
+        reponse = self.fichiers.repondre(methode, get_path_info(environ), en_tetes)
+        if reponse is None:
+            return self.application(environ, start_response)
+
+        start_response(reponse.ligne_statut, reponse.en_tetes)
+        if methode == 'HEAD':
+            return [b'']
+        if reponse.chemin is None:
+            return [reponse.corps]
+        fichier = open(reponse.chemin, 'rb')
+        if reponse.complet and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](fichier, TAILLE_BLOC)
+        return _lire(fichier, reponse.debut, reponse.longueur)
+
+
+class FichiersASGI:
+    """Enveloppe une application ASGI : sert les fichiers, transmet le reste."""
+
+    def __init__(self, application, fichiers=None):
+        self.application = application
+        self.fichiers = fichiers or Fichiers.depuis_reglages()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            en_tetes = {cle.decode('latin-1').lower(): valeur.decode('latin-1') for cle, valeur in scope['headers']}
+            reponse = await asyncio.to_thread(self.fichiers.repondre, scope['method'], scope['path'], en_tetes)
+            if reponse is not None:
+                await self.envoyer(scope, send, reponse)
+                return
+        await self.application(scope, receive, send)
+
+    async def envoyer(self, scope, send, reponse):
+        await send({
+            'type': 'http.response.start',
+            'status': reponse.statut,
+            'headers': [(cle.lower().encode('latin-1'), valeur.encode('latin-1')) for cle, valeur in reponse.en_tetes],
+        })
+        if scope['method'] == 'HEAD' or reponse.chemin is None:
+            await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else reponse.corps})
+            return
+
+        fichier = await asyncio.to_thread(open, reponse.chemin, 'rb')
+        with fichier:
+            if 'http.response.zerocopy' in (scope.get('extensions') or {}):
+                await send({
+                    'type': 'http.response.zerocopy', 'file': fichier,
+                    'offset': reponse.debut, 'count': reponse.longueur,
+                })
+                return
+            await asyncio.to_thread(fichier.seek, reponse.debut)
+            restant = reponse.longueur
+            while restant > 0:
+                bloc = await asyncio.to_thread(fichier.read, min(TAILLE_BLOC, restant))
+                if not bloc:
+                    break
+                restant -= len(bloc)
+                await send({'type': 'http.response.body', 'body': bloc, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+def compresser(chemin):
+    """
+    Écrit les variantes `.gz` (et `.br` si `brotli` est installé) de `chemin`
+    quand elles sont plus petites. Retourne les suffixes écrits.
+    """
+    infos = os.stat(chemin)
+    compresseurs = [('.gz', lambda contenu: gzip.compress(contenu, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compresseurs.append(('.br', lambda contenu: brotli.compress(contenu, quality=11)))
+
+    contenu = None
+    ecrits = []
+    for suffixe, compresseur in compresseurs:
+        variante = chemin + suffixe
+        if os.path.exists(variante) and os.stat(variante).st_mtime >= infos.st_mtime:
+            continue  # déjà à jour
+        if contenu is None:
+            with open(chemin, 'rb') as fichier:
+                contenu = fichier.read()
+        compresse = compresseur(contenu)
+        if len(compresse) < len(contenu) * 0.95:
+            with open(variante, 'wb') as fichier:
+                fichier.write(compresse)
+            ecrits.append(suffixe)
+        elif os.path.exists(variante):
+            os.remove(variante)
+    return ecrits
+
+
+class CompressionMixin:
+    """Précompresse les fichiers textuels à la fin de `collectstatic`."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        traites = set()
+        parent = getattr(super(), 'post_process', None)
+        if parent is not None:
+            for original, traite, modifie in parent(paths, dry_run=dry_run, **options):
+                traites.add(original)
+                yield original, traite, modifie
+        if dry_run:
+            return
+
+        for dossier, _, noms in os.walk(self.location):
+            for nom in noms:
+                chemin = os.path.join(dossier, nom)
+                if os.path.splitext(nom)[1].lower() not in EXTENSIONS_COMPRESSIBLES \
+                        or os.path.getsize(chemin) < TAILLE_MINIMALE_COMPRESSION:
+                    continue
+                if compresser(chemin):
+                    relatif = os.path.relpath(chemin, self.location).replace(os.sep, '/')
+                    if relatif not in traites:
+                        yield relatif, relatif, True
+
+
+class StockageStatiqueCompresse(CompressionMixin, StaticFilesStorage):
+    pass
+
+
+class StockageStatiqueManifesteCompresse(CompressionMixin, ManifestStaticFilesStorage):
+    """Noms hachés (servis avec un cache immuable) et variantes précompressées."""
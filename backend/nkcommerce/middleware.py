@@ -0,0 +1,48 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+from .routeurs import marquer_ecriture
+
+URLCONF_ASGI = 'nkcommerce.urls_asgi'
+
+
+@sync_and_async_middleware
+def vues_async_middleware(get_response):
+    """
+    Sous ASGI, résout les URL avec `nkcommerce.urls_asgi` pour que les
+    lectures du catalogue et du panier s'exécutent sur la boucle d'événements
+    plutôt que dans le thread des vues synchrones. Sans effet sous WSGI.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if settings.VUES_ASYNC:
+                request.urlconf = URLCONF_ASGI
+            return await get_response(request)
+    else:
+        def middleware(request):
+            return get_response(request)
+    return middleware
+
+
+@sync_and_async_middleware
+def primaire_apres_ecriture_middleware(get_response):
+    """
+    Après une écriture réussie, les lectures du même client restent sur la
+    base primaire le temps que les répliques la reçoivent
+    (`REPLIQUES_DELAI_PRIMAIRE`, voir `nkcommerce.routeurs`).
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            if request.method not in SAFE_METHODS:
+                # L'utilisateur peut encore être à charger depuis la session
+                await sync_to_async(marquer_ecriture)(request, response)
+            return response
+    else:
+        def middleware(request):
+            response = get_response(request)
+            marquer_ecriture(request, response)
+            return response
+    return middleware
@@ -0,0 +1,121 @@
+"""
+Routage des lectures vers les répliques (`REPLIQUES`).
+
+Le routeur n'envoie une lecture sur une réplique que dans un contexte
+`lecture_replique()` : les vues qui le supportent l'ouvrent pour leurs
+lectures (catalogue, statistiques) avec `LectureRepliqueMixin` ou
+`alecture_replique`. Tout le reste (écritures, panier, commande,
+authentification) reste sur la primaire.
+
+Une réplique a du retard sur la primaire. Pendant `REPLIQUES_DELAI_PRIMAIRE`
+secondes après une écriture, un client relit donc la primaire (cookie posé
+par `primaire_apres_ecriture_middleware`, et clé du cache par utilisateur
+pour les clients sans cookie), de même que les lectures du catalogue juste
+après une invalidation, pour ne pas remettre en cache un contenu périmé.
+"""
+import contextvars
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+COOKIE_PRIMAIRE = 'primaire_jusqu_a'
+
+_lecture_replique = contextvars.ContextVar('lecture_replique', default=False)
+
+
+def _cle_utilisateur(utilisateur):
+    return f'routeurs:primaire:{utilisateur.pk}'
+
+
+@contextmanager
+def lecture_replique(actif=True):
+    """Les lectures du bloc vont sur une réplique (ou sur la primaire si `actif` est faux)."""
+    jeton = _lecture_replique.set(actif)
+    try:
+        yield
+    finally:
+        _lecture_replique.reset(jeton)
+
+
+def primaire_si_recent(horodatage):
+    """Contexte qui force la primaire si `horodatage` (secondes) date de moins du délai."""
+    if time.time() - horodatage < settings.REPLIQUES_DELAI_PRIMAIRE:
+        return lecture_replique(False)
+    return nullcontext()
+
+
+def primaire_requise(request, utilisateur=None):
+    """Vrai si le client de la requête a écrit il y a moins de `REPLIQUES_DELAI_PRIMAIRE` secondes."""
+    try:
+        if float(request.COOKIES.get(COOKIE_PRIMAIRE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    if utilisateur is None:
+        utilisateur = request.user
+    return utilisateur.is_authenticated and cache.get(_cle_utilisateur(utilisateur)) is not None
+
+
+def marquer_ecriture(request, response):
+    """Après une écriture réussie, renvoie les lectures du client sur la primaire."""
+    if not settings.REPLIQUES or request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+    delai = settings.REPLIQUES_DELAI_PRIMAIRE
+    response.set_cookie(COOKIE_PRIMAIRE, f'{time.time() + delai:.3f}', max_age=delai, httponly=True, samesite='Lax')
+    utilisateur = getattr(request, 'user', None)
+    if utilisateur is not None and utilisateur.is_authenticated:
+        cache.set(_cle_utilisateur(utilisateur), 1, timeout=delai)
+
+
+@asynccontextmanager
+async def alecture_replique(request):
+    """Variante async de `LectureRepliqueMixin` pour les vues Django natives."""
+    actif = bool(settings.REPLIQUES) and not primaire_requise(request, await request.auser())
+    with lecture_replique(actif):
+        yield
+
+
+class LectureRepliqueMixin:
+    """Exécute les actions `actions_replique` d'un ViewSet sur une réplique."""
+    actions_replique = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        # Authentification et permissions d'abord, sur la primaire
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.REPLIQUES
+            and request.method in SAFE_METHODS
+            and self.action in self.actions_replique
+            and not primaire_requise(request)
+        ):
+            self._jeton_replique = _lecture_replique.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        jeton = self.__dict__.pop('_jeton_replique', None)
+        if jeton is not None:
+            _lecture_replique.reset(jeton)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class RouteurRepliques:
+    """Lectures sur une réplique tirée au hasard dans un contexte `lecture_replique`."""
+
+    def db_for_read(self, model, **hints):
+        if _lecture_replique.get() and settings.REPLIQUES:
+            return random.choice(settings.REPLIQUES)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mêmes données partout : un objet lu sur une réplique peut être lié à un objet de la primaire
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLIQUES
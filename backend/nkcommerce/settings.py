@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from .bases import base_de_donnees, repliques
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -62,8 +64,13 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'nkcommerce.middleware.vues_async_middleware',
+    'nkcommerce.middleware.primaire_apres_ecriture_middleware',
 ]
 
+# Sous ASGI, lectures du catalogue et du panier par les vues async (nkcommerce/urls_asgi.py)
+VUES_ASYNC = os.environ.get('VUES_ASYNC', '1') == '1'
+
 ROOT_URLCONF = 'nkcommerce.urls'
 
 TEMPLATES = [
@@ -88,13 +95,58 @@ WSGI_APPLICATION = 'nkcommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Moteur et profil de connexion (persistance, pool, pragmas SQLite) choisis par
+# l'environnement : DB_MOTEUR, DB_PROFIL... (voir nkcommerce/bases.py)
 DATABASES = {
+    'default': base_de_donnees(BASE_DIR),
+}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Base de test sur disque : les tests de concurrence ouvrent plusieurs
+    # connexions, ce que la base en mémoire partagée gère mal
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Répliques en lecture (DB_REPLIQUES) : lectures du catalogue et statistiques,
+# voir nkcommerce/routeurs.py
+DATABASES.update(repliques(DATABASES['default']))
+REPLIQUES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['nkcommerce.routeurs.RouteurRepliques']
+# Durée (secondes) pendant laquelle un client relit la primaire après une de ses
+# écritures, et le catalogue après une invalidation : à régler sur le retard des répliques
+REPLIQUES_DELAI_PRIMAIRE = float(os.environ.get('DB_REPLIQUES_DELAI', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# L'alias `catalogue` peut pointer vers un cache fichier
+# (django.core.cache.backends.filebased.FileBasedCache) ou Redis
+# (django.core.cache.backends.redis.RedisCache) via l'environnement.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'BACKEND': os.environ.get('CATALOGUE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOGUE_CACHE_LOCATION', 'catalogue'),
+    },
+    # Paniers des visiteurs anonymes avec le stockage clé-valeur (Redis en production)
+    'paniers': {
+        'BACKEND': os.environ.get('PANIERS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PANIERS_CACHE_LOCATION', 'paniers'),
+    },
 }
 
+# Durée de vie (secondes) des réponses du catalogue mises en cache
+CATALOGUE_CACHE_TIMEOUT = int(os.environ.get('CATALOGUE_CACHE_TIMEOUT', 300))
+# Durée pendant laquelle navigateurs et CDN réutilisent une réponse du catalogue sans la revalider
+CATALOGUE_HTTP_MAX_AGE = int(os.environ.get('CATALOGUE_HTTP_MAX_AGE', 60))
+
+# Stockage des paniers anonymes : orders.paniers.StockageRelationnel (base)
+# ou orders.paniers.StockageCleValeur (cache `paniers`, sans écriture en base)
+PANIER_INVITE_STOCKAGE = os.environ.get('PANIER_INVITE_STOCKAGE', 'orders.paniers.StockageRelationnel')
+# Durée de vie (secondes) d'un panier anonyme inactif dans le stockage clé-valeur
+PANIER_INVITE_TTL = int(os.environ.get('PANIER_INVITE_TTL', 7 * 24 * 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,10 +185,23 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# collectstatic écrit aussi les variantes .gz/.br servies par nkcommerce.fichiers ;
+# STATICFILES_BACKEND=nkcommerce.fichiers.StockageStatiqueManifesteCompresse
+# ajoute l'empreinte aux noms pour un cache immuable
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': os.environ.get('STATICFILES_BACKEND', 'nkcommerce.fichiers.StockageStatiqueCompresse'),
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(Path(__file__).resolve().parent.parent.parent, 'uploads')
 
+# Threads générant les déclinaisons des images téléversées (0 : dans la requête)
+IMAGES_WORKERS = int(os.environ.get('IMAGES_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
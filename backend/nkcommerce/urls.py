@@ -16,8 +16,6 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework.authtoken.views import obtain_auth_token
 
 urlpatterns = [
@@ -28,6 +26,3 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls')),
     path('api/token-auth/', obtain_auth_token, name='api_token_auth'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,21 @@
+"""
+URL des requêtes servies sous ASGI (voir `nkcommerce.middleware`).
+
+Les lectures les plus fréquentes passent par leurs variantes async, placées
+avant les routes DRF équivalentes ; tout le reste est repris de `urls.py`.
+"""
+from django.urls import path, re_path
+
+from orders import views_async as commandes
+from products import views_async as catalogue
+from .urls import urlpatterns as urlpatterns_wsgi
+
+urlpatterns = [
+    path('api/products/', catalogue.liste_produits, name='produit-list-async'),
+    path('api/products/categories/<slug:slug>/produits/', catalogue.produits_categorie,
+         name='categorie-produits-async'),
+    # Mêmes URL que la route détail du routeur, hors `categories/` et des actions de liste
+    re_path(r'^api/products/(?!(?:categories|nouveautes|import|export)/)(?P<slug>[^/.]+)/$', catalogue.detail_produit,
+            name='produit-detail-async'),
+    path('api/orders/panier/', commandes.panier, name='panier-list-async'),
+] + urlpatterns_wsgi
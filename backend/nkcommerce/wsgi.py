@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nkcommerce.settings')
 
 application = get_wsgi_application()
+
+# Fichiers statiques et téléversés servis avant Django (voir nkcommerce.fichiers)
+from nkcommerce.fichiers import FichiersWSGI  # noqa: E402
+
+application = FichiersWSGI(application)
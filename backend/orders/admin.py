@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Commande, DetailCommande, Panier, ArticlePanier
+from django import forms
+from django.contrib import admin, messages
+from .models import Commande, DetailCommande, HistoriqueStatut, Panier, ArticlePanier
+from . import statuts
 
 class DetailCommandeInline(admin.TabularInline):
     model = DetailCommande
@@ -7,13 +9,35 @@ class DetailCommandeInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['prix', 'montant_total']
 
+class HistoriqueStatutInline(admin.TabularInline):
+    model = HistoriqueStatut
+    extra = 0
+    can_delete = False
+    fields = readonly_fields = ['date', 'ancien_statut', 'nouveau_statut', 'auteur', 'commentaire']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class CommandeAdminForm(forms.ModelForm):
+    class Meta:
+        model = Commande
+        fields = '__all__'
+
+    def clean_statut(self):
+        statut = self.cleaned_data['statut']
+        ancien = self.initial.get('statut')
+        if self.instance.pk and statut != ancien and not statuts.transition_possible(ancien, statut):
+            raise forms.ValidationError(statuts.message_refus(ancien, statut))
+        return statut
+
 @admin.register(Commande)
 class CommandeAdmin(admin.ModelAdmin):
     list_display = ['id', 'nom_complet', 'email', 'ville', 'montant_total', 'statut', 'date_creation']
     list_filter = ['statut', 'date_creation']
     search_fields = ['nom_complet', 'email', 'telephone']
     readonly_fields = ['montant_total']
-    inlines = [DetailCommandeInline]
+    inlines = [DetailCommandeInline, HistoriqueStatutInline]
+    form = CommandeAdminForm
     fieldsets = (
         (None, {'fields': ('client', 'statut', 'montant_total')}),
         ('Informations client', {'fields': ('nom_complet', 'email', 'telephone')}),
@@ -22,24 +46,39 @@ class CommandeAdmin(admin.ModelAdmin):
     )
     actions = ['confirmer_commandes', 'marquer_comme_expediees', 'marquer_comme_livrees', 'annuler_commandes']
     
+    def save_model(self, request, obj, form, change):
+        # Le changement de statut passe par le service, qui l'historise
+        statut = obj.statut
+        if change and 'statut' in form.changed_data:
+            obj.statut = form.initial['statut']
+        super().save_model(request, obj, form, change)
+        if statut != obj.statut:
+            statuts.changer_statut(Commande.objects.filter(pk=obj.pk), statut, auteur=request.user)
+            obj.statut = statut
+    
+    def changer_statut(self, request, queryset, statut, message):
+        modifiees, refusees = statuts.changer_statut(queryset, statut, auteur=request.user)
+        self.message_user(request, f'{modifiees} commandes ont été {message}.')
+        if refusees:
+            self.message_user(
+                request, f'{refusees} commandes ignorées : leur statut ne permet pas cette transition.',
+                messages.WARNING,
+            )
+    
     def confirmer_commandes(self, request, queryset):
-        updated = queryset.update(statut='confirmee')
-        self.message_user(request, f'{updated} commandes ont été confirmées.')
+        self.changer_statut(request, queryset, 'confirmee', 'confirmées')
     confirmer_commandes.short_description = "Confirmer les commandes sélectionnées"
     
     def marquer_comme_expediees(self, request, queryset):
-        updated = queryset.update(statut='expediee')
-        self.message_user(request, f'{updated} commandes ont été marquées comme expédiées.')
+        self.changer_statut(request, queryset, 'expediee', 'marquées comme expédiées')
     marquer_comme_expediees.short_description = "Marquer comme expédiées"
     
     def marquer_comme_livrees(self, request, queryset):
-        updated = queryset.update(statut='livree')
-        self.message_user(request, f'{updated} commandes ont été marquées comme livrées.')
+        self.changer_statut(request, queryset, 'livree', 'marquées comme livrées')
     marquer_comme_livrees.short_description = "Marquer comme livrées"
     
     def annuler_commandes(self, request, queryset):
-        updated = queryset.update(statut='annulee')
-        self.message_user(request, f'{updated} commandes ont été annulées.')
+        self.changer_statut(request, queryset, 'annulee', 'annulées')
     annuler_commandes.short_description = "Annuler les commandes"
 
 class ArticlePanierInline(admin.TabularInline):
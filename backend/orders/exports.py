@@ -0,0 +1,97 @@
+"""
+Export des commandes pour la comptabilité, en CSV ou JSON Lines.
+
+Les commandes sont lues dans l'ordre chronologique par
+`iterator(chunk_size=...)`, sous forme de tuples (`values_list`) plutôt que
+d'instances sérialisées : pour chaque lot, une seule requête charge les
+lignes de détail des commandes du lot. Le fichier est produit au fil de
+l'eau, un morceau par lot, si bien que la mémoire ne dépend pas du nombre
+de commandes exportées (`StreamingHttpResponse` ou fichier).
+
+En CSV, une ligne par article commandé (les colonnes de la commande sont
+répétées, une commande sans article occupe une ligne sans colonnes
+d'article) ; en JSON Lines, un objet par commande avec ses `lignes`.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from products.transferts import FORMATS, TamponCSV, par_lots
+from .models import Commande, DetailCommande
+
+COLONNES_COMMANDE = (
+    'id', 'date_creation', 'statut', 'client_id', 'nom_complet', 'email',
+    'telephone', 'adresse', 'ville', 'montant_total',
+)
+COLONNES_LIGNE = ('produit', 'produit_nom', 'prix', 'quantite', 'montant')
+# Expressions `values_list` des colonnes de ligne (le montant est calculé)
+CHAMPS_LIGNE = ('commande_id', 'produit__slug', 'produit__nom', 'prix', 'quantite')
+STATUTS = [statut for statut, _ in Commande.STATUT_CHOICES]
+
+
+def _debut_du_jour(jour):
+    return timezone.make_aware(datetime.combine(jour, time.min))
+
+
+def commandes(debut=None, fin=None, statuts=()):
+    """
+    Commandes à exporter : créées entre `debut` et `fin` (dates incluses,
+    fuseau courant), de l'un des `statuts` s'il y en a.
+    """
+    queryset = Commande.objects.order_by('date_creation', 'pk')
+    # Bornes sur la colonne elle-même (et non sa date) pour utiliser l'index
+    if debut:
+        queryset = queryset.filter(date_creation__gte=_debut_du_jour(debut))
+    if fin:
+        queryset = queryset.filter(date_creation__lt=_debut_du_jour(fin + timedelta(days=1)))
+    if statuts:
+        queryset = queryset.filter(statut__in=statuts)
+    return queryset
+
+
+def _lignes_du_lot(lot):
+    """Lignes de détail des commandes du lot, regroupées par commande."""
+    lignes = {}
+    details = (
+        DetailCommande.objects.filter(commande_id__in=[commande[0] for commande in lot])
+        .order_by('commande_id', 'pk')
+        .values_list(*CHAMPS_LIGNE)
+    )
+    for commande_id, *ligne in details:
+        lignes.setdefault(commande_id, []).append(ligne)
+    return lignes
+
+
+def exporter(queryset, format='csv', taille_lot=1000):
+    """Générateur des morceaux (str) du fichier d'export, un par lot de `taille_lot` commandes."""
+    if format not in FORMATS:
+        raise ValueError(f"Format {format!r} : valeurs possibles {', '.join(FORMATS)}")
+    resultats = queryset.values_list(*COLONNES_COMMANDE).iterator(chunk_size=taille_lot)
+
+    if format == 'csv':
+        ecrivain = csv.writer(TamponCSV())
+        yield ecrivain.writerow(COLONNES_COMMANDE + COLONNES_LIGNE)
+        vide = ('',) * len(COLONNES_LIGNE)
+
+        def encoder(commande, lignes):
+            if not lignes:
+                return ecrivain.writerow(commande + vide)
+            return ''.join(
+                ecrivain.writerow((*commande, slug, nom, prix, quantite, prix * quantite))
+                for slug, nom, prix, quantite in lignes
+            )
+    else:
+        def encoder(commande, lignes):
+            objet = dict(zip(COLONNES_COMMANDE, commande))
+            objet['lignes'] = [
+                dict(zip(COLONNES_LIGNE, (slug, nom, prix, quantite, prix * quantite)))
+                for slug, nom, prix, quantite in lignes
+            ]
+            return json.dumps(objet, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    for lot in par_lots(resultats, taille_lot):
+        lignes = _lignes_du_lot(lot)
+        yield ''.join(encoder(commande, lignes.get(commande[0], ())) for commande in lot)
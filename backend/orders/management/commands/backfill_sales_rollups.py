@@ -0,0 +1,85 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from orders.models import (
+    Commande, DetailCommande, VentesJournalieres, VentesProduitJournalieres,
+    VentesClientJournalieres,
+)
+
+
+class Command(BaseCommand):
+    help = ("Reconstruit les agrégats de ventes quotidiens (par statut, produit et client) "
+            "à partir des commandes, sur toute la période ou entre deux dates")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=date.fromisoformat, help="Premier jour à reconstruire (AAAA-MM-JJ)")
+        parser.add_argument('--fin', type=date.fromisoformat, help="Dernier jour à reconstruire (AAAA-MM-JJ)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Taille des lots d'insertion (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        debut, fin = options['debut'], options['fin']
+        if debut and fin and debut > fin:
+            raise CommandError("--debut doit précéder --fin")
+        self.batch_size = options['batch_size']
+        demarrage = time.monotonic()
+
+        with transaction.atomic():
+            commandes = self.filtrer(Commande.objects.all(), 'date_creation__date', debut, fin)
+            details = self.filtrer(DetailCommande.objects.all(), 'commande__date_creation__date', debut, fin)
+
+            statuts = self.reconstruire(
+                VentesJournalieres, debut, fin,
+                commandes.annotate(jour=TruncDate('date_creation'))
+                .values('jour', 'statut')
+                .annotate(somme_nombre=Count('id'), somme_montant=Sum('montant_total')),
+            )
+            produits = self.reconstruire(
+                VentesProduitJournalieres, debut, fin,
+                details.annotate(jour=TruncDate('commande__date_creation'))
+                .values('jour', 'produit_id')
+                .annotate(somme_quantite=Sum('quantite'), somme_montant=Sum(F('prix') * F('quantite'))),
+            )
+            clients = self.reconstruire(
+                VentesClientJournalieres, debut, fin,
+                commandes.annotate(jour=TruncDate('date_creation'))
+                .values('jour', 'client_id', 'nom_complet', 'email')
+                .annotate(somme_nombre=Count('id'), somme_montant=Sum('montant_total')),
+            )
+
+        duree = time.monotonic() - demarrage
+        self.stdout.write(self.style.SUCCESS(
+            f"Agrégats reconstruits en {duree:.2f}s : {statuts} par statut, "
+            f"{produits} par produit, {clients} par client"
+        ))
+
+    def filtrer(self, queryset, champ, debut, fin):
+        if debut:
+            queryset = queryset.filter(**{f'{champ}__gte': debut})
+        if fin:
+            queryset = queryset.filter(**{f'{champ}__lte': fin})
+        return queryset
+
+    # Les agrégats sont annotés sous un autre nom pour ne pas masquer les champs sommés
+    CHAMPS = {
+        'somme_nombre': 'nombre_commandes',
+        'somme_quantite': 'quantite',
+        'somme_montant': 'montant_total',
+    }
+
+    def reconstruire(self, modele, debut, fin, lignes):
+        self.filtrer(modele.objects.all(), 'jour', debut, fin).delete()
+        total = 0
+        lot = []
+        for ligne in lignes.order_by().iterator(chunk_size=self.batch_size):
+            lot.append(modele(**{self.CHAMPS.get(champ, champ): valeur for champ, valeur in ligne.items()}))
+            if len(lot) >= self.batch_size:
+                total += len(modele.objects.bulk_create(lot))
+                lot = []
+        total += len(modele.objects.bulk_create(lot))
+        return total
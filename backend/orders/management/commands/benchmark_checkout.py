@@ -0,0 +1,77 @@
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from orders.models import Panier, ArticlePanier
+from products.models import Categorie, Produit
+
+COORDONNEES = {
+    'nom_complet': "Benchmark",
+    'email': "benchmark@exemple.com",
+    'telephone': "0000000000",
+    'adresse': "Benchmark",
+    'ville': "Benchmark",
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Mesure la latence de convertir_en_commande selon la taille du panier. "
+            "Toutes les données créées sont annulées à la fin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', type=int, nargs='+', default=[1, 10, 50, 100, 200],
+                            help="Nombres de lignes de panier à mesurer")
+        parser.add_argument('--repetitions', type=int, default=5,
+                            help="Nombre de commandes passées par taille")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.mesurer(options['tailles'], options['repetitions'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def mesurer(self, tailles, repetitions):
+        jeton = uuid.uuid4().hex[:8]
+        categorie = Categorie.objects.create(nom=f"Benchmark {jeton}", slug=f"benchmark-{jeton}")
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f"Benchmark {i}", slug=f"benchmark-{jeton}-{i}", categorie=categorie,
+                    description="", prix=Decimal('10.00'), stock=10 ** 6)
+            for i in range(max(tailles))
+        ])
+        user = User.objects.create_user(f'benchmark-{jeton}')
+        panier, _ = Panier.objects.get_or_create(client=user)
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        self.stdout.write(f"{'lignes':>8} {'requêtes':>9} {'médiane (ms)':>13} {'max (ms)':>9}")
+        for taille in tailles:
+            durees = []
+            for _ in range(repetitions):
+                ArticlePanier.objects.bulk_create([
+                    ArticlePanier(panier=panier, produit=produit, quantite=1)
+                    for produit in produits[:taille]
+                ])
+                with CaptureQueriesContext(connection) as ctx:
+                    debut = time.perf_counter()
+                    response = client.post('/api/orders/panier/convertir_en_commande/', COORDONNEES)
+                    durees.append((time.perf_counter() - debut) * 1000)
+                if response.status_code != 201:
+                    self.stderr.write(f"Échec de la commande ({response.status_code}) : {response.content[:200]!r}")
+                    return
+            self.stdout.write(
+                f"{taille:>8} {len(ctx.captured_queries):>9} "
+                f"{statistics.median(durees):>13.2f} {max(durees):>9.2f}"
+            )
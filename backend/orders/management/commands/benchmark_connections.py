@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from nkcommerce.bases import base_de_donnees
+
+ALIAS = 'benchmark_connexions'
+
+
+class Command(BaseCommand):
+    help = ("Mesure le coût de connexion par requête selon le profil de base : une connexion "
+            "par requête, connexions persistantes, pool PostgreSQL, pragmas SQLite (WAL). "
+            "Chaque requête simulée ouvre ou réutilise sa connexion comme le cycle "
+            "request_started / request_finished de Django.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=2000,
+                            help="Nombre de requêtes simulées par mode (défaut : 2000)")
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Nombre de workers concurrents, chacun avec sa connexion (défaut : 1)")
+        parser.add_argument('--ecritures', action='store_true',
+                            help="Une insertion par requête en plus de la lecture")
+
+    def handle(self, *args, **options):
+        moteur = 'postgresql' if 'postgresql' in settings.DATABASES['default']['ENGINE'] else 'sqlite'
+        with tempfile.TemporaryDirectory() as dossier:
+            # SQLite : base jetable, le mode WAL est enregistré dans le fichier
+            base = {'DB_MOTEUR': moteur}
+            if moteur == 'sqlite':
+                base['DB_NAME'] = str(Path(dossier) / 'benchmark.sqlite3')
+            modes = [
+                ('par requête', {'DB_PROFIL': 'developpement', 'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'}),
+                ('persistante', {'DB_PROFIL': 'developpement', 'DB_POOL': '0', 'DB_CONN_MAX_AGE': '600'}),
+            ]
+            if moteur == 'sqlite':
+                modes += [
+                    ('par requête + WAL', {'DB_PROFIL': 'developpement', 'DB_SQLITE_PRAGMAS': '1'}),
+                    ('production', {'DB_PROFIL': 'production'}),
+                ]
+            else:
+                modes.append(('pool', {'DB_PROFIL': 'production', 'DB_POOL': '1'}))
+
+            self.stdout.write(
+                f"{'mode':<20} {'requêtes':>9} {'connexions':>11} {'µs/requête':>11} {'p99 (µs)':>9} {'req/s':>9}"
+            )
+            for nom, variables in modes:
+                config = base_de_donnees(settings.BASE_DIR, environ={**os.environ, **base, **variables})
+                try:
+                    self.afficher(nom, *self.mesurer(config, options))
+                except Exception as erreur:
+                    self.stderr.write(f"{nom} : {erreur}")
+
+    def afficher(self, nom, duree, latences, ouvertures):
+        latences = sorted(latences)
+        moyenne = sum(latences) / len(latences)
+        p99 = latences[min(len(latences) - 1, int(len(latences) * 0.99))]
+        self.stdout.write(
+            f"{nom:<20} {len(latences):>9} {ouvertures:>11} {moyenne * 1e6:>11.0f} "
+            f"{p99 * 1e6:>9.0f} {len(latences) / duree:>9.0f}"
+        )
+
+    def mesurer(self, config, options):
+        connections.settings[ALIAS] = connections.configure_settings({
+            'default': settings.DATABASES['default'], ALIAS: config,
+        })[ALIAS]
+        ouvertures = []
+
+        def compter(sender, connection, **kwargs):
+            if connection.alias == ALIAS:
+                ouvertures.append(1)
+
+        connection_created.connect(compter)
+        try:
+            with connections[ALIAS].cursor() as curseur:
+                curseur.execute('CREATE TABLE IF NOT EXISTS benchmark_connexions (valeur integer)')
+            connections[ALIAS].close()
+
+            latences = []
+            par_thread = -(-options['requetes'] // options['threads'])
+            threads = [
+                threading.Thread(target=self.worker, args=(par_thread, options['ecritures'], latences))
+                for _ in range(options['threads'])
+            ]
+            debut = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duree = time.perf_counter() - debut
+
+            with connections[ALIAS].cursor() as curseur:
+                curseur.execute('DROP TABLE benchmark_connexions')
+            return duree, latences, len(ouvertures)
+        finally:
+            connection_created.disconnect(compter)
+            connexion = connections[ALIAS]
+            connexion.close()
+            if getattr(connexion, 'pool', None):
+                connexion.close_pool()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+
+    def worker(self, requetes, ecritures, latences):
+        connexion = connections[ALIAS]
+        try:
+            for i in range(requetes):
+                debut = time.perf_counter()
+                # Ce que font request_started et request_finished (close_old_connections)
+                connexion.close_if_unusable_or_obsolete()
+                with connexion.cursor() as curseur:
+                    curseur.execute('SELECT 1')
+                    if ecritures:
+                        curseur.execute('INSERT INTO benchmark_connexions (valeur) VALUES (%s)', [i])
+                connexion.close_if_unusable_or_obsolete()
+                latences.append(time.perf_counter() - debut)
+        finally:
+            connexion.close()
@@ -0,0 +1,73 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Panier, ArticlePanier
+from products.models import Categorie, Produit
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Mesure le débit de purge_guest_carts sur un grand nombre de paniers anonymes "
+            "inactifs. Toutes les données créées sont annulées à la fin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paniers', type=int, default=1_000_000,
+                            help="Nombre de paniers inactifs à créer (défaut : 1 000 000)")
+        parser.add_argument('--lignes', type=int, default=2,
+                            help="Nombre de lignes par panier (défaut : 2)")
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[1000, 5000],
+                            help="Tailles de lot à comparer")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'lot':>8} {'paniers':>10} {'lignes':>10} {'durée (s)':>10} {'paniers/s':>10}")
+        for batch_size in options['batch_size']:
+            try:
+                with transaction.atomic():
+                    self.mesurer(options['paniers'], options['lignes'], batch_size)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def mesurer(self, nombre, lignes, batch_size):
+        jeton = uuid.uuid4().hex[:8]
+        categorie = Categorie.objects.create(nom=f"Benchmark {jeton}", slug=f"benchmark-{jeton}")
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f"Benchmark {i}", slug=f"benchmark-{jeton}-{i}", categorie=categorie,
+                    description="", prix=Decimal('10.00'), stock=10)
+            for i in range(lignes)
+        ])
+
+        premier_id = None
+        for debut in range(0, nombre, 10_000):
+            paniers = Panier.objects.bulk_create([
+                Panier(session_id=f'{jeton}-{i}') for i in range(debut, min(debut + 10_000, nombre))
+            ])
+            premier_id = premier_id or paniers[0].pk
+            ArticlePanier.objects.bulk_create([
+                ArticlePanier(panier=panier, produit=produit, quantite=1)
+                for panier in paniers for produit in produits
+            ])
+        Panier.objects.filter(session_id__startswith=f'{jeton}-').update(
+            date_modification=timezone.now() - timedelta(days=365)
+        )
+
+        debut = time.perf_counter()
+        call_command(
+            'purge_guest_carts', batch_size=batch_size, sans_sessions=True,
+            depuis_id=(premier_id or 1) - 1, stdout=StringIO(),
+        )
+        duree = time.perf_counter() - debut
+        self.stdout.write(
+            f"{batch_size:>8} {nombre:>10} {nombre * lignes:>10} {duree:>10.2f} {nombre / duree:>10.0f}"
+        )
@@ -0,0 +1,123 @@
+import json
+import re
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from orders.models import ArticlePanier, Commande, Panier
+from products.models import Produit
+
+# Tables des chemins critiques (catalogue, paniers, commandes)
+MODELES_CRITIQUES = (Produit, Panier, ArticlePanier, Commande)
+
+# Ligne du logger django.db.backends : "(0.001) SELECT ...; args=(...); alias=default"
+LIGNE_LOG = re.compile(r'^\(\d+\.\d+\) (?P<sql>.+?); args=.*$')
+
+# Alias de tables générés par l'ORM : "products_produit" U0, INNER JOIN "x" T3
+ALIAS_TABLE = re.compile(r'"(?P<table>\w+)"\s+(?:AS\s+)?"?(?P<alias>[A-Z]\d+)"?(?=[\s,)]|$)')
+
+# Parcours séquentiels selon le moteur : SCAN sans index (SQLite), Seq Scan (PostgreSQL)
+PARCOURS_SEQUENTIEL = {
+    'sqlite': re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+INSTRUCTIONS_EXPLICABLES = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def requetes_critiques():
+    """Requêtes représentatives des filtres fréquents, utilisées sans journal capturé."""
+    maintenant = timezone.now()
+    return [
+        Produit.objects.filter(disponible=True).order_by('-date_creation', '-id')[:20],
+        Produit.objects.filter(categorie_id=1, disponible=True).order_by('-date_creation'),
+        Produit.objects.filter(marque='').order_by('-date_creation'),
+        Panier.objects.filter(session_id=''),
+        Panier.objects.filter(client_id=1),
+        ArticlePanier.objects.filter(panier_id=1, produit_id=1),
+        Commande.objects.filter(client_id=1).order_by('-date_creation'),
+        Commande.objects.filter(statut='en_attente'),
+        Commande.objects.filter(date_creation__gte=maintenant),
+    ]
+
+
+def lire_journal(chemin):
+    """
+    Lit un journal de requêtes : JSON Lines (`{"sql": ..., "params": [...]}`,
+    le format de `connection.queries`), lignes du logger `django.db.backends`
+    ou une instruction SQL par ligne.
+    """
+    with open(chemin, encoding='utf-8') as fichier:
+        for ligne in fichier:
+            ligne = ligne.strip()
+            if not ligne or ligne.startswith('--'):
+                continue
+            if ligne.startswith('{'):
+                entree = json.loads(ligne)
+                yield entree['sql'], tuple(entree['params']) if entree.get('params') else None
+                continue
+            correspondance = LIGNE_LOG.match(ligne)
+            yield (correspondance['sql'] if correspondance else ligne.rstrip(';')), None
+
+
+class Command(BaseCommand):
+    help = ("Rejoue des requêtes avec EXPLAIN et signale les parcours séquentiels "
+            "sur les tables des chemins critiques (produits, paniers, commandes)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('journal', nargs='?',
+                            help="Journal de requêtes capturé ; à défaut, requêtes représentatives intégrées")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Alias de base de données à interroger (défaut : default)")
+        parser.add_argument('--toutes-tables', action='store_true',
+                            help="Signaler les parcours séquentiels sur toutes les tables")
+        parser.add_argument('--strict', action='store_true',
+                            help="Échouer si au moins un parcours séquentiel est détecté")
+
+    def handle(self, *args, **options):
+        connexion = connections[options['database']]
+        motif = PARCOURS_SEQUENTIEL.get(connexion.vendor)
+        if motif is None:
+            raise CommandError(f"Moteur non pris en charge : {connexion.vendor}")
+        critiques = {modele._meta.db_table for modele in MODELES_CRITIQUES}
+
+        if options['journal']:
+            requetes = Counter(lire_journal(options['journal']))
+        else:
+            requetes = Counter()
+            for queryset in requetes_critiques():
+                sql, params = queryset.using(options['database']).query.sql_with_params()
+                requetes[sql, tuple(params)] += 1
+
+        prefixe = connexion.ops.explain_query_prefix()
+        signalees = 0
+        for (sql, params), occurrences in requetes.items():
+            if not sql.lstrip().upper().startswith(INSTRUCTIONS_EXPLICABLES):
+                continue
+            with connexion.cursor() as cursor:
+                cursor.execute(f'{prefixe} {sql}', params)
+                plan = [str(ligne[-1]) for ligne in cursor.fetchall()]
+
+            alias = {m['alias']: m['table'] for m in ALIAS_TABLE.finditer(sql)}
+            tables = sorted({
+                alias.get(m['table'], m['table'])
+                for m in map(motif.search, plan) if m
+            })
+            if not options['toutes_tables']:
+                tables = [table for table in tables if table in critiques]
+
+            if options['verbosity'] >= 2 or tables:
+                self.stdout.write(f"\n[{occurrences}x] {sql}")
+            if tables:
+                signalees += 1
+                self.stdout.write(self.style.WARNING(f"  Parcours séquentiel : {', '.join(tables)}"))
+            if options['verbosity'] >= 2:
+                for ligne in plan:
+                    self.stdout.write(f"    {ligne}")
+
+        resume = f"{len(requetes)} requêtes analysées, {signalees} avec parcours séquentiel"
+        if signalees and options['strict']:
+            raise CommandError(resume)
+        self.stdout.write(self.style.SUCCESS(resume))
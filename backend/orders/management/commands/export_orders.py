@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders import exports
+from products.transferts import format_du_fichier
+
+
+class Command(BaseCommand):
+    help = ("Exporte les commandes et leurs lignes pour la comptabilité (CSV : une ligne par "
+            "article ; JSON Lines : une commande par ligne), au fil de l'eau et par lots : la "
+            "mémoire ne dépend pas du nombre de commandes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', nargs='?', default='-',
+                            help="Fichier de sortie (défaut : sortie standard)")
+        parser.add_argument('--format', choices=exports.FORMATS,
+                            help="Format du fichier (défaut : d'après l'extension, sinon csv)")
+        parser.add_argument('--debut', type=date.fromisoformat,
+                            help="Première date de création incluse (AAAA-MM-JJ)")
+        parser.add_argument('--fin', type=date.fromisoformat,
+                            help="Dernière date de création incluse (AAAA-MM-JJ)")
+        parser.add_argument('--statut', action='append', choices=exports.STATUTS, default=[],
+                            help="Statut exporté (répétable ; défaut : tous)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Commandes lues par lot (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        format = options['format'] or format_du_fichier(options['fichier']) or 'csv'
+        commandes = exports.commandes(options['debut'], options['fin'], options['statut'])
+
+        debut = time.monotonic()
+        morceaux = exports.exporter(commandes, format, options['batch_size'])
+        if options['fichier'] == '-':
+            for morceau in morceaux:
+                self.stdout.write(morceau, ending='')
+        else:
+            try:
+                with open(options['fichier'], 'w', encoding='utf-8', newline='') as sortie:
+                    sortie.writelines(morceaux)
+            except OSError as erreur:
+                raise CommandError(erreur)
+        self.stderr.write(f"Export terminé en {time.monotonic() - debut:.2f}s")
@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import Panier, ArticlePanier
+
+
+class Command(BaseCommand):
+    help = ("Supprime par lots les paniers anonymes inactifs, leurs lignes et les sessions "
+            "expirées. Chaque lot est une courte transaction : la commande peut tourner "
+            "pendant le trafic, être interrompue et relancée sans perte.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=30,
+                            help="Ancienneté minimale de la dernière activité d'un panier (défaut : 30)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Nombre de paniers ou de sessions supprimés par lot (défaut : 1000)")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Pause en secondes entre deux lots, pour laisser passer le trafic")
+        parser.add_argument('--depuis-id', type=int, default=0,
+                            help="Reprendre après cet id de panier (affiché dans la progression)")
+        parser.add_argument('--sans-sessions', action='store_true',
+                            help="Ne pas purger les sessions expirées")
+        parser.add_argument('--intervalle', type=int,
+                            help="Tourner en continu, une purge toutes les N secondes")
+
+    def handle(self, *args, **options):
+        while True:
+            self.purger(options)
+            if not options['intervalle']:
+                break
+            time.sleep(options['intervalle'])
+
+    def purger(self, options):
+        debut = time.monotonic()
+        avant = timezone.now() - timedelta(days=options['jours'])
+        paniers, lignes = self.purger_paniers(avant, options)
+        sessions = 0 if options['sans_sessions'] else self.purger_sessions(options)
+
+        duree = time.monotonic() - debut
+        debit = (paniers + lignes + sessions) / duree if duree else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{paniers} paniers, {lignes} lignes et {sessions} sessions supprimés "
+            f"en {duree:.2f}s ({debit:.0f} lignes/s)"
+        ))
+        return paniers, lignes, sessions
+
+    def purger_paniers(self, avant, options):
+        inactifs = Panier.objects.invites_inactifs(avant)
+        dernier_id = options['depuis_id']
+        paniers = lignes = 0
+
+        while True:
+            ids = list(
+                inactifs.filter(pk__gt=dernier_id).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            dernier_id = ids[-1]
+            # Le critère d'inactivité est réévalué à la suppression : un panier
+            # redevenu actif depuis la sélection est conservé
+            _, supprimes = inactifs.filter(pk__in=ids).delete()
+            paniers += supprimes.get(Panier._meta.label, 0)
+            lignes += supprimes.get(ArticlePanier._meta.label, 0)
+
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"  ... {paniers} paniers supprimés (dernier id : {dernier_id})")
+            if options['pause']:
+                time.sleep(options['pause'])
+        return paniers, lignes
+
+    def purger_sessions(self, options):
+        expirees = Session.objects.filter(expire_date__lt=timezone.now())
+        supprimees = 0
+        while True:
+            cles = list(expirees.order_by('session_key').values_list('session_key', flat=True)[:options['batch_size']])
+            if not cles:
+                break
+            supprimees += expirees.filter(session_key__in=cles).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+        return supprimees
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q, F
+
+from orders.models import Panier
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les totaux dénormalisés des paniers (nombre d'articles, montant) "
+            "et signale les paniers dont les valeurs stockées ont dérivé")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Nombre de paniers vérifiés par lot (défaut : 1000)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Signaler les écarts sans les corriger")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        debut = time.monotonic()
+        verifies = 0
+        derives = []
+        dernier_id = 0
+
+        while True:
+            ids = list(
+                Panier.objects.filter(pk__gt=dernier_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            dernier_id = ids[-1]
+            verifies += len(ids)
+
+            ecarts = list(
+                Panier.objects.filter(pk__in=ids).avec_totaux_calcules().filter(
+                    ~Q(nombre_articles=F('nombre_calcule')) | ~Q(montant_total=F('montant_calcule'))
+                ).values_list('pk', 'nombre_articles', 'nombre_calcule', 'montant_total', 'montant_calcule')
+            )
+            for pk, nombre, nombre_calcule, montant, montant_calcule in ecarts:
+                self.stdout.write(
+                    f"Panier {pk} : {nombre} articles / {montant} stockés, "
+                    f"{nombre_calcule} articles / {montant_calcule} attendus"
+                )
+            derives.extend(pk for pk, *_ in ecarts)
+
+            if ecarts and not options['dry_run']:
+                Panier.objects.filter(pk__in=[pk for pk, *_ in ecarts]).recalculer_totaux()
+
+        duree = time.monotonic() - debut
+        action = "à corriger" if options['dry_run'] else "corrigés"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verifies} paniers vérifiés en {duree:.2f}s, {len(derives)} {action}"
+        ))
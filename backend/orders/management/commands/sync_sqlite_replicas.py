@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Copie la base SQLite primaire dans les répliques SQLite de DB_REPLIQUES, pour "
+            "essayer le routage des lectures en local. Avec --intervalle, recopie périodiquement "
+            "et simule ainsi le retard de réplication.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalle', type=float, default=0,
+                            help="Secondes entre deux copies ; 0 (défaut) pour une seule copie")
+
+    def handle(self, *args, **options):
+        primaire = settings.DATABASES['default']
+        repliques = [
+            alias for alias in settings.REPLIQUES
+            if 'sqlite' in settings.DATABASES[alias]['ENGINE']
+        ]
+        if 'sqlite' not in primaire['ENGINE'] or not repliques:
+            raise CommandError("Aucune réplique SQLite configurée (DB_REPLIQUES) pour une base SQLite")
+
+        while True:
+            for alias in repliques:
+                self.copier(primaire['NAME'], settings.DATABASES[alias]['NAME'])
+                self.stdout.write(f"{alias} : copie de {primaire['NAME']} vers {settings.DATABASES[alias]['NAME']}")
+            if not options['intervalle']:
+                break
+            time.sleep(options['intervalle'])
+
+    def copier(self, source, destination):
+        # API de sauvegarde de SQLite : copie cohérente même pendant des écritures
+        with sqlite3.connect(source) as origine, sqlite3.connect(destination) as copie:
+            origine.backup(copie)
+        origine.close()
+        copie.close()
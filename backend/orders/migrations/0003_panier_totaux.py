@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:08
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculer_totaux(apps, schema_editor):
+    Panier = apps.get_model('orders', 'Panier')
+    ArticlePanier = apps.get_model('orders', 'ArticlePanier')
+    lignes = ArticlePanier.objects.filter(panier=OuterRef('pk')).order_by().values('panier')
+    Panier.objects.update(
+        nombre_articles=Coalesce(
+            Subquery(lignes.annotate(total=Sum('quantite')).values('total')),
+            Value(0),
+        ),
+        montant_total=Coalesce(
+            Subquery(lignes.annotate(total=Sum(F('quantite') * F('produit__prix'))).values('total')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_alter_articlepanier_options_alter_commande_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panier',
+            name='montant_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='panier',
+            name='nombre_articles',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(calculer_totaux, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_panier_totaux'),
+        ('products', '0004_produits_recherche'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentesJournalieres',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('statut', models.CharField(choices=[('en_attente', 'En Attente'), ('confirmee', 'Confirmée'), ('en_traitement', 'En Traitement'), ('expediee', 'Expédiée'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('nombre_commandes', models.IntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Ventes journalières',
+                'verbose_name_plural': 'Ventes journalières',
+                'constraints': [models.UniqueConstraint(fields=('jour', 'statut'), name='ventes_jour_statut_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentesClientJournalieres',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('nom_complet', models.CharField(max_length=100)),
+                ('email', models.EmailField(max_length=254)),
+                ('nombre_commandes', models.IntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ventes client journalières',
+                'verbose_name_plural': 'Ventes client journalières',
+                'constraints': [models.UniqueConstraint(fields=('jour', 'client', 'nom_complet', 'email'), name='ventes_jour_client_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentesProduitJournalieres',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('quantite', models.IntegerField(default=0)),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.produit')),
+            ],
+            options={
+                'verbose_name': 'Ventes produit journalières',
+                'verbose_name_plural': 'Ventes produit journalières',
+                'constraints': [models.UniqueConstraint(fields=('jour', 'produit'), name='ventes_jour_produit_uniq')],
+            },
+        ),
+    ]
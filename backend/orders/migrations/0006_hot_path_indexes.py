@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_commande_statut_date_indexes'),
+        ('products', '0005_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='articlepanier',
+            index=models.Index(fields=['panier', 'produit'], name='article_panier_produit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['client', '-date_creation'], name='commande_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='panier',
+            index=models.Index(condition=models.Q(('session_id__isnull', False)), fields=['session_id'], name='panier_session_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:17
+
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+
+
+def fusionner_doublons(apps, schema_editor):
+    """Fusionne les paniers et lignes en double avant d'ajouter les contraintes d'unicité."""
+    Panier = apps.get_model('orders', 'Panier')
+    ArticlePanier = apps.get_model('orders', 'ArticlePanier')
+    modifies = set()
+
+    # Plusieurs paniers pour un même client ou une même session : garder le plus ancien
+    for champ in ('client', 'session_id'):
+        doublons = (
+            Panier.objects.filter(**{f'{champ}__isnull': False})
+            .values(champ).annotate(nombre=Count('id'), garde=Min('id')).filter(nombre__gt=1)
+        )
+        for doublon in doublons:
+            autres = Panier.objects.filter(**{champ: doublon[champ]}).exclude(id=doublon['garde'])
+            ArticlePanier.objects.filter(panier__in=autres).update(panier_id=doublon['garde'])
+            autres.delete()
+            modifies.add(doublon['garde'])
+
+    # Plusieurs lignes pour un même produit : cumuler les quantités sur la plus ancienne
+    doublons = (
+        ArticlePanier.objects.values('panier', 'produit')
+        .annotate(nombre=Count('id'), garde=Min('id'), total=Sum('quantite')).filter(nombre__gt=1)
+    )
+    for doublon in doublons:
+        ArticlePanier.objects.filter(id=doublon['garde']).update(quantite=doublon['total'])
+        ArticlePanier.objects.filter(
+            panier=doublon['panier'], produit=doublon['produit']
+        ).exclude(id=doublon['garde']).delete()
+        modifies.add(doublon['panier'])
+
+    for panier in Panier.objects.filter(id__in=modifies):
+        totaux = ArticlePanier.objects.filter(panier=panier).aggregate(
+            nombre=Sum('quantite'), montant=Sum(F('quantite') * F('produit__prix')),
+        )
+        panier.nombre_articles = totaux['nombre'] or 0
+        panier.montant_total = totaux['montant'] or Decimal('0')
+        panier.save(update_fields=['nombre_articles', 'montant_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_hot_path_indexes'),
+        ('products', '0005_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_doublons, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='articlepanier',
+            name='article_panier_produit_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='panier',
+            name='panier_session_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='articlepanier',
+            constraint=models.UniqueConstraint(fields=('panier', 'produit'), name='article_panier_produit_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='panier',
+            constraint=models.UniqueConstraint(fields=('client',), name='panier_client_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='panier',
+            constraint=models.UniqueConstraint(condition=models.Q(('session_id__isnull', False)), fields=('session_id',), name='panier_session_unique'),
+        ),
+    ]
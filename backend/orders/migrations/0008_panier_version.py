@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_panier_unicite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panier',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_panier_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panier',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='panier',
+            index=models.Index(condition=models.Q(('client__isnull', True)), fields=['date_modification'], name='panier_invite_activite_idx'),
+        ),
+    ]
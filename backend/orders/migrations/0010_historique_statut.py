@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_panier_activite'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoriqueStatut',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancien_statut', models.CharField(choices=[('en_attente', 'En Attente'), ('confirmee', 'Confirmée'), ('en_traitement', 'En Traitement'), ('expediee', 'Expédiée'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('nouveau_statut', models.CharField(choices=[('en_attente', 'En Attente'), ('confirmee', 'Confirmée'), ('en_traitement', 'En Traitement'), ('expediee', 'Expédiée'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('commentaire', models.CharField(blank=True, max_length=255)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('commande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historique', to='orders.commande')),
+            ],
+            options={
+                'verbose_name': 'Historique de statut',
+                'verbose_name_plural': 'Historique des statuts',
+                'ordering': ['date', 'id'],
+            },
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from decimal import Decimal
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from products.models import Produit
-from django.db.models.signals import post_save
+from django.db.models import F, Sum, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.text import slugify
 import uuid
 
@@ -28,10 +32,36 @@ class Commande(models.Model):
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['statut'], name='commande_statut_idx'),
+            models.Index(fields=['date_creation'], name='commande_date_idx'),
+            # Historique d'un client, le plus récent d'abord
+            models.Index(fields=['client', '-date_creation'], name='commande_client_date_idx'),
+        ]
+    
     def __str__(self):
         return f"Commande {self.id} - {self.nom_complet}"
 
 
+class HistoriqueStatut(models.Model):
+    """Changement de statut d'une commande, écrit par `orders.statuts.changer_statut`."""
+    commande = models.ForeignKey(Commande, related_name='historique', on_delete=models.CASCADE)
+    ancien_statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    nouveau_statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    auteur = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    commentaire = models.CharField(max_length=255, blank=True)
+    date = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Historique de statut"
+        verbose_name_plural = "Historique des statuts"
+        ordering = ['date', 'id']
+    
+    def __str__(self):
+        return f"Commande {self.commande_id} : {self.ancien_statut} → {self.nouveau_statut}"
+
+
 class DetailCommande(models.Model):
     commande = models.ForeignKey(Commande, related_name='details', on_delete=models.CASCADE)
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
@@ -43,26 +73,198 @@ class DetailCommande(models.Model):
     
     @property
     def montant_total(self):
+        # Ligne vide du formulaire de l'admin : ni prix ni quantité
+        if self.prix is None or self.quantite is None:
+            return None
         return self.prix * self.quantite
 
 
+class VentesJournalieres(models.Model):
+    """Agrégat quotidien des commandes par statut (alimenté par orders.rollups)."""
+    jour = models.DateField()
+    statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    nombre_commandes = models.IntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Ventes journalières"
+        verbose_name_plural = "Ventes journalières"
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'statut'], name='ventes_jour_statut_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.jour} - {self.statut}"
+
+
+class VentesProduitJournalieres(models.Model):
+    """Agrégat quotidien des quantités et montants vendus par produit."""
+    jour = models.DateField()
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='+')
+    quantite = models.IntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Ventes produit journalières"
+        verbose_name_plural = "Ventes produit journalières"
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'produit'], name='ventes_jour_produit_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.jour} - produit {self.produit_id}"
+
+
+class VentesClientJournalieres(models.Model):
+    """Agrégat quotidien des commandes par client (compte, nom et email de la commande)."""
+    jour = models.DateField()
+    client = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    nom_complet = models.CharField(max_length=100)
+    email = models.EmailField()
+    nombre_commandes = models.IntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Ventes client journalières"
+        verbose_name_plural = "Ventes client journalières"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['jour', 'client', 'nom_complet', 'email'], name='ventes_jour_client_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.jour} - {self.email}"
+
+
+class PanierQuerySet(models.QuerySet):
+    @staticmethod
+    def totaux_calcules():
+        """Expressions (nombre, montant) recalculant les totaux d'un panier depuis ses lignes."""
+        lignes = ArticlePanier.objects.filter(panier=OuterRef('pk')).order_by().values('panier')
+        nombre = Coalesce(
+            Subquery(lignes.annotate(total=Sum('quantite')).values('total')),
+            Value(0),
+        )
+        montant = Coalesce(
+            Subquery(lignes.annotate(total=Sum(F('quantite') * F('produit__prix'))).values('total')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+        return nombre, montant
+    
+    def avec_totaux_calcules(self):
+        nombre, montant = self.totaux_calcules()
+        return self.annotate(nombre_calcule=nombre, montant_calcule=montant)
+    
+    def recalculer_totaux(self, **champs):
+        """Recalcule les totaux de tous les paniers du queryset en une seule requête."""
+        nombre, montant = self.totaux_calcules()
+        return self.update(nombre_articles=nombre, montant_total=montant, version=F('version') + 1, **champs)
+    
+    def invites_inactifs(self, avant):
+        """Paniers anonymes sans activité depuis `avant`."""
+        return self.filter(client__isnull=True, date_modification__lt=avant)
+
+
 class Panier(models.Model):
     client = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     session_id = models.CharField(max_length=100, blank=True, null=True)
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Dernière activité du client sur le panier (voir ajuster_totaux)
+    date_modification = models.DateTimeField(auto_now=True)
+    # Totaux dénormalisés, maintenus par PanierViewSet (voir ajuster_totaux)
+    nombre_articles = models.PositiveIntegerField(default=0)
+    montant_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Incrémentée à chaque modification, sert d'ETag aux réponses du panier
+    version = models.PositiveIntegerField(default=0)
+    
+    objects = PanierQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            # Un seul panier par client et par session invitée : get_or_create
+            # concurrents retombent sur le panier créé par la première requête
+            models.UniqueConstraint(fields=['client'], name='panier_client_unique'),
+            models.UniqueConstraint(
+                fields=['session_id'], name='panier_session_unique',
+                condition=models.Q(session_id__isnull=False),
+            ),
+        ]
+        indexes = [
+            # Purge des paniers anonymes inactifs
+            models.Index(
+                fields=['date_modification'], name='panier_invite_activite_idx',
+                condition=models.Q(client__isnull=True),
+            ),
+        ]
     
     def __str__(self):
         if self.client:
             return f"Panier de {self.client.username}"
         return f"Panier invité {self.session_id}"
     
-    @property
-    def nombre_articles(self):
-        return sum(article.quantite for article in self.articles.all())
+    def ajuster_totaux(self, quantite, montant):
+        """Applique un delta aux totaux en base, puis recharge les valeurs."""
+        Panier.objects.filter(pk=self.pk).update(
+            nombre_articles=F('nombre_articles') + quantite,
+            montant_total=F('montant_total') + montant,
+            version=F('version') + 1,
+            date_modification=timezone.now(),
+        )
+        self.refresh_from_db(fields=['nombre_articles', 'montant_total', 'version', 'date_modification'])
+    
+    def recalculer_totaux(self):
+        Panier.objects.filter(pk=self.pk).recalculer_totaux(date_modification=timezone.now())
+        self.refresh_from_db(fields=['nombre_articles', 'montant_total', 'version', 'date_modification'])
     
     @property
-    def montant_total(self):
-        return sum(article.montant_total for article in self.articles.all())
+    def etag(self):
+        return f'"{self.pk}-{self.version}"'
+    
+    def ajouter_article(self, produit, quantite):
+        """
+        Ajoute `quantite` du produit au panier sans lecture préalable : la ligne
+        existante est incrémentée avec `F()`, sinon elle est créée, la contrainte
+        d'unicité (panier, produit) départageant les ajouts concurrents.
+        À appeler dans une transaction ; retourne la ligne à jour.
+        """
+        lignes = ArticlePanier.objects.filter(panier=self, produit=produit)
+        article = None
+        if not lignes.update(quantite=F('quantite') + quantite):
+            try:
+                with transaction.atomic():
+                    article = ArticlePanier.objects.create(panier=self, produit=produit, quantite=quantite)
+            except IntegrityError:
+                # Ligne créée entre-temps par une requête concurrente
+                lignes.update(quantite=F('quantite') + quantite)
+        self.ajuster_totaux(quantite, quantite * produit.prix)
+        return article or lignes.get()
+    
+    def fusionner(self, quantites):
+        """
+        Ajoute les quantités `{produit_id: quantite}` aux lignes du panier en
+        un nombre fixe de requêtes : lecture (verrouillée) des lignes existantes,
+        puis un seul INSERT ... ON CONFLICT qui crée les lignes manquantes et
+        met à jour les autres avec la somme. À appeler dans une transaction.
+        """
+        if not quantites:
+            return
+        existantes = dict(
+            ArticlePanier.objects.select_for_update()
+            .filter(panier=self, produit_id__in=list(quantites))
+            .values_list('produit_id', 'quantite')
+        )
+        ArticlePanier.objects.bulk_create(
+            [
+                ArticlePanier(panier=self, produit_id=produit_id, quantite=quantite + existantes.get(produit_id, 0))
+                for produit_id, quantite in quantites.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['panier', 'produit'],
+            update_fields=['quantite'],
+        )
+        self.recalculer_totaux()
 
 
 class ArticlePanier(models.Model):
@@ -71,6 +273,11 @@ class ArticlePanier(models.Model):
     quantite = models.PositiveIntegerField(default=1)
     date_ajout = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['panier', 'produit'], name='article_panier_produit_unique'),
+        ]
+    
     def __str__(self):
         return f"{self.quantite} x {self.produit.nom}"
     
@@ -84,3 +291,32 @@ def creer_panier_utilisateur(sender, instance, created, **kwargs):
     """Créer un panier pour chaque nouvel utilisateur."""
     if created:
         Panier.objects.create(client=instance)
+
+
+@receiver(post_init, sender=Produit)
+def memoriser_prix_produit(sender, instance, **kwargs):
+    # Passer par __dict__ pour ne pas charger les champs différés (only/defer)
+    instance._prix_initial = instance.__dict__.get('prix')
+
+
+@receiver(post_save, sender=Produit)
+def recalculer_paniers_produit(sender, instance, created, raw=False, **kwargs):
+    """Le montant des paniers dépend du prix courant : recalculer ceux qui contiennent le produit."""
+    prix = instance.__dict__.get('prix')
+    if not created and not raw and prix is not None and prix != instance._prix_initial:
+        Panier.objects.filter(articles__produit=instance).recalculer_totaux()
+    instance._prix_initial = prix
+
+
+@receiver(pre_delete, sender=Produit)
+def memoriser_paniers_produit(sender, instance, **kwargs):
+    instance._paniers_a_recalculer = list(
+        ArticlePanier.objects.filter(produit=instance).values_list('panier_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Produit)
+def recalculer_paniers_produit_supprime(sender, instance, **kwargs):
+    paniers = getattr(instance, '_paniers_a_recalculer', None)
+    if paniers:
+        Panier.objects.filter(pk__in=paniers).recalculer_totaux()
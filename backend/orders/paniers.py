@@ -0,0 +1,365 @@
+"""
+Stockage des paniers derrière `PanierViewSet`.
+
+Les paniers des clients authentifiés sont toujours en base. Ceux des
+visiteurs anonymes passent par le backend désigné par
+`settings.PANIER_INVITE_STOCKAGE` :
+
+- `StockageRelationnel` : `Panier` et `ArticlePanier` en base, identifiés
+  par la session (comportement historique) ;
+- `StockageCleValeur` : un document par panier dans le cache `paniers`
+  (mémoire locale, ou Redis avec `django.core.cache.backends.redis.RedisCache`),
+  expirant après `PANIER_INVITE_TTL` secondes d'inactivité. Le visiteur est
+  identifié par un cookie signé : ni panier ni session ne sont écrits en
+  base tant qu'il ne commande pas ou ne se connecte pas. Les modifications
+  relisent le document sous un verrou posé avec `cache.add`, si bien que
+  des requêtes concurrentes ne s'écrasent pas.
+
+Les deux backends exposent les mêmes opérations. Les lignes sont des
+`ArticlePanier` ; pour le stockage clé-valeur elles ne sont pas
+enregistrées et leur id est celui du produit.
+"""
+import hashlib
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import aprefetch_related_objects
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from products.models import Produit
+from products.serializers import ProduitSerializer
+from .models import Panier, ArticlePanier
+from .serializers import PanierSerializer
+
+ALIAS = 'paniers'
+COOKIE = 'panier_invite'
+# Durée de vie (secondes) du verrou d'un panier anonyme : libère celui d'une requête
+# interrompue, et borne l'attente d'une requête concurrente
+VERROU_DUREE = 5
+
+
+class PanierOccupe(Exception):
+    """Le panier anonyme est resté verrouillé par une autre requête au-delà de `VERROU_DUREE`."""
+
+
+def stockage_invite():
+    return import_string(settings.PANIER_INVITE_STOCKAGE)()
+
+
+def stockage_pour(request):
+    """Backend de stockage du panier de la requête."""
+    if request.user.is_authenticated:
+        return StockageRelationnel()
+    return stockage_invite()
+
+
+def fusionner_panier_invite(request, user):
+    """
+    Verse le panier anonyme de la requête dans le panier de `user` (quantités
+    additionnées), puis supprime le panier anonyme. Le nombre de requêtes ne
+    dépend pas du nombre de lignes. Retourne le panier de l'utilisateur, ou
+    None s'il n'y avait rien à fusionner.
+    """
+    with transaction.atomic():
+        quantites = stockage_invite().extraire_invite(request)
+        if not quantites:
+            return None
+        panier, created = Panier.objects.get_or_create(client=user)
+        panier.fusionner(quantites)
+    return panier
+
+
+@receiver(user_logged_in)
+def fusionner_a_la_connexion(sender, request, user, **kwargs):
+    if request is not None:
+        fusionner_panier_invite(request, user)
+
+
+class StockageRelationnel:
+    """Paniers en base de données."""
+
+    def obtenir(self, request):
+        if request.user.is_authenticated:
+            panier, created = Panier.objects.get_or_create(client=request.user)
+            return panier
+
+        session_id = request.session.get('cart_session_id')
+        if not session_id:
+            session_id = str(uuid.uuid4())
+            request.session['cart_session_id'] = session_id
+
+        panier, created = Panier.objects.get_or_create(session_id=session_id)
+        return panier
+
+    def preparer(self, panier, complet=True):
+        """Panier prêt à sérialiser : avec ses lignes et produits si `complet`."""
+        return PanierSerializer.prefetch_instance(panier) if complet else panier
+
+    async def aobtenir(self, request):
+        """Variante async d'`obtenir` ; `request.user` doit déjà être résolu."""
+        if request.user.is_authenticated:
+            panier, created = await Panier.objects.aget_or_create(client=request.user)
+            return panier
+
+        session_id = await request.session.aget('cart_session_id')
+        if not session_id:
+            session_id = str(uuid.uuid4())
+            await request.session.aset('cart_session_id', session_id)
+
+        panier, created = await Panier.objects.aget_or_create(session_id=session_id)
+        return panier
+
+    async def apreparer(self, panier):
+        select, prefetch = PanierSerializer.get_eager_loading_plan()
+        await aprefetch_related_objects([panier], *select, *prefetch)
+        return panier
+
+    def lignes(self, panier):
+        return list(ArticlePanier.objects.filter(panier=panier).select_related('produit'))
+
+    def ligne(self, panier, article_id):
+        return ArticlePanier.objects.select_related('produit').get(id=article_id, panier=panier)
+
+    def ajouter(self, panier, produit, quantite):
+        with transaction.atomic():
+            article = panier.ajouter_article(produit, quantite)
+        article.produit = produit
+        return article
+
+    def modifier(self, panier, article, quantite):
+        with transaction.atomic():
+            lignes = ArticlePanier.objects.filter(pk=article.pk)
+            # Relue verrouillée : la ligne lue par `ligne()` a pu changer depuis
+            ancienne_quantite = lignes.select_for_update().values_list('quantite', flat=True).first()
+            if ancienne_quantite is None:
+                return
+            if quantite <= 0:
+                lignes.delete()
+                quantite = 0
+            else:
+                lignes.update(quantite=quantite)
+            article.quantite = quantite
+
+            delta = quantite - ancienne_quantite
+            panier.ajuster_totaux(delta, delta * article.produit.prix)
+
+    def supprimer(self, panier, article):
+        with transaction.atomic():
+            lignes = ArticlePanier.objects.filter(pk=article.pk)
+            quantite = lignes.select_for_update().values_list('quantite', flat=True).first()
+            # Déjà supprimée par une requête concurrente : rien à retirer
+            if quantite is not None and lignes.delete()[0]:
+                panier.ajuster_totaux(-quantite, -quantite * article.produit.prix)
+
+    def vider(self, panier):
+        with transaction.atomic():
+            lignes = ArticlePanier.objects.filter(panier=panier)
+            supprimes = list(lignes.values_list('id', flat=True))
+            lignes.delete()
+            panier.recalculer_totaux()
+        return supprimes
+
+    def extraire_invite(self, request):
+        """Quantités `{produit_id: quantite}` du panier anonyme de la requête, supprimé au passage."""
+        session = getattr(request, 'session', None)
+        session_id = session.pop('cart_session_id', None) if session is not None else None
+        if not session_id:
+            return {}
+        paniers = Panier.objects.filter(session_id=session_id, client__isnull=True)
+        quantites = dict(ArticlePanier.objects.filter(panier__in=paniers).values_list('produit_id', 'quantite'))
+        paniers.delete()
+        return quantites
+
+    def retirer_commandees(self, panier, articles):
+        """Retire les lignes commandées ; appelée dans la transaction de la commande."""
+        ArticlePanier.objects.filter(id__in=[article.id for article in articles]).delete()
+        panier.recalculer_totaux()
+
+    def finaliser(self, request, response, panier):
+        pass
+
+
+class PanierInvite:
+    """Panier anonyme du stockage clé-valeur, présenté comme un `Panier`."""
+    id = None
+    client = None
+
+    def __init__(self, cle, quantites=None, version=0, date_creation=None, enregistre=False):
+        self.cle = cle
+        self.quantites = quantites or {}
+        self.version = version
+        self.date_creation = date_creation or timezone.now()
+        self.enregistre = enregistre
+        self.articles = []
+        self.nombre_articles = sum(self.quantites.values())
+        self.montant_total = Decimal('0')
+
+    @property
+    def etag(self):
+        return f'"{hashlib.sha256(self.cle.encode()).hexdigest()[:16]}-{self.version}"'
+
+
+class StockageCleValeur:
+    """Paniers anonymes dans un cache clé-valeur, avec durée de vie."""
+
+    def get_cache(self):
+        return caches[ALIAS]
+
+    def _cle(self, cle):
+        return f'panier:{cle}'
+
+    def obtenir(self, request):
+        cle = request.get_signed_cookie(COOKIE, default=None, salt=COOKIE)
+        document = self.get_cache().get(self._cle(cle)) if cle else None
+        if document is None:
+            return PanierInvite(cle or uuid.uuid4().hex)
+        return PanierInvite(cle, enregistre=True, **document)
+
+    def _enregistrer(self, panier):
+        panier.version += 1
+        panier.enregistre = True
+        self.get_cache().set(self._cle(panier.cle), {
+            'quantites': panier.quantites,
+            'version': panier.version,
+            'date_creation': panier.date_creation,
+        }, timeout=settings.PANIER_INVITE_TTL)
+
+    @contextmanager
+    def _modification(self, panier):
+        """
+        Relit le document du panier sous verrou, puis l'enregistre en sortie
+        du bloc. `cache.add` est atomique sur tous les backends : une seule
+        requête à la fois modifie le panier, à partir de sa dernière version.
+        """
+        cache = self.get_cache()
+        verrou, jeton = f'{self._cle(panier.cle)}:verrou', uuid.uuid4().hex
+        limite = time.monotonic() + VERROU_DUREE
+        while not cache.add(verrou, jeton, timeout=VERROU_DUREE):
+            if time.monotonic() >= limite:
+                raise PanierOccupe
+            time.sleep(0.005)
+        # Au-delà, le verrou a pu expirer et être pris par une autre requête
+        echeance = time.monotonic() + VERROU_DUREE * 0.9
+        try:
+            document = cache.get(self._cle(panier.cle))
+            if document is None:
+                # Expiré ou pas encore créé
+                panier.quantites, panier.version = {}, 0
+            else:
+                panier.quantites, panier.version = document['quantites'], document['version']
+                panier.date_creation = document['date_creation']
+            yield panier
+            self._enregistrer(panier)
+        finally:
+            # L'API de cache n'a pas de « comparer et supprimer » : le verrou n'est
+            # libéré qu'avant son échéance, sinon il expire de lui-même. Reste une
+            # course à la limite de l'échéance, au pire un verrou relâché tôt
+            if time.monotonic() < echeance and cache.get(verrou) == jeton:
+                cache.delete(verrou)
+
+    async def aobtenir(self, request):
+        cle = request.get_signed_cookie(COOKIE, default=None, salt=COOKIE)
+        document = await self.get_cache().aget(self._cle(cle)) if cle else None
+        if document is None:
+            return PanierInvite(cle or uuid.uuid4().hex)
+        return PanierInvite(cle, enregistre=True, **document)
+
+    def _produits(self, panier, complet):
+        produits = Produit.objects.filter(id__in=list(panier.quantites))
+        # Les réponses compactes n'ont besoin que des prix
+        return ProduitSerializer.setup_eager_loading(produits) if complet else produits.only('id', 'prix')
+
+    def preparer(self, panier, complet=True):
+        """Charge les produits des lignes et calcule les totaux aux prix courants."""
+        return self._assembler(panier, {produit.id: produit for produit in self._produits(panier, complet)})
+
+    async def apreparer(self, panier):
+        return self._assembler(panier, {produit.id: produit async for produit in self._produits(panier, True)})
+
+    def _assembler(self, panier, produits):
+        # Lignes dans l'ordre d'ajout ; celles des produits supprimés sont ignorées
+        panier.articles = [
+            ArticlePanier(id=produit_id, produit=produits[produit_id], quantite=quantite)
+            for produit_id, quantite in panier.quantites.items()
+            if produit_id in produits
+        ]
+        panier.nombre_articles = sum(article.quantite for article in panier.articles)
+        panier.montant_total = sum((article.montant_total for article in panier.articles), Decimal('0'))
+        return panier
+
+    def lignes(self, panier):
+        return self.preparer(panier).articles
+
+    def ligne(self, panier, article_id):
+        try:
+            produit_id = int(article_id)
+        except (TypeError, ValueError):
+            raise ArticlePanier.DoesNotExist
+        if produit_id not in panier.quantites:
+            raise ArticlePanier.DoesNotExist
+        produit = Produit.objects.filter(id=produit_id).first()
+        if produit is None:
+            raise ArticlePanier.DoesNotExist
+        return ArticlePanier(id=produit_id, produit=produit, quantite=panier.quantites[produit_id])
+
+    def ajouter(self, panier, produit, quantite):
+        with self._modification(panier):
+            panier.quantites[produit.id] = panier.quantites.get(produit.id, 0) + quantite
+        return ArticlePanier(id=produit.id, produit=produit, quantite=panier.quantites[produit.id])
+
+    def modifier(self, panier, article, quantite):
+        with self._modification(panier):
+            if article.produit_id not in panier.quantites:
+                # Ligne supprimée entre-temps par une requête concurrente
+                return
+            if quantite <= 0:
+                panier.quantites.pop(article.produit_id)
+            else:
+                panier.quantites[article.produit_id] = article.quantite = quantite
+
+    def supprimer(self, panier, article):
+        with self._modification(panier):
+            panier.quantites.pop(article.produit_id, None)
+
+    def vider(self, panier):
+        with self._modification(panier):
+            supprimes = list(panier.quantites)
+            panier.quantites = {}
+        return supprimes
+
+    def extraire_invite(self, request):
+        """Quantités `{produit_id: quantite}` du panier anonyme de la requête, supprimé au passage."""
+        cle = request.get_signed_cookie(COOKIE, default=None, salt=COOKIE)
+        document = self.get_cache().get(self._cle(cle)) if cle else None
+        if not document:
+            return {}
+        transaction.on_commit(lambda: self.get_cache().delete(self._cle(cle)))
+        # Ignorer les produits supprimés depuis l'ajout
+        existants = set(Produit.objects.filter(id__in=list(document['quantites'])).values_list('id', flat=True))
+        return {pid: quantite for pid, quantite in document['quantites'].items() if pid in existants}
+
+    def retirer_commandees(self, panier, articles):
+        def retirer():
+            with self._modification(panier):
+                for article in articles:
+                    panier.quantites.pop(article.produit_id, None)
+
+        # Le cache ne suit pas la transaction : ne vider qu'une fois la commande validée,
+        # sans faire échouer la requête (commande déjà enregistrée) si le panier reste occupé
+        transaction.on_commit(retirer, robust=True)
+
+    def finaliser(self, request, response, panier):
+        # Cookie posé seulement pour un panier existant ; sa durée de vie suit celle du document
+        if panier.enregistre:
+            response.set_signed_cookie(
+                COOKIE, panier.cle, salt=COOKIE, max_age=settings.PANIER_INVITE_TTL,
+                httponly=True, samesite='Lax',
+            )
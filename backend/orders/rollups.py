@@ -0,0 +1,243 @@
+"""
+Agrégats de ventes matérialisés pour les endpoints de statistiques.
+
+Trois tables quotidiennes sont tenues à jour de façon incrémentale :
+
+- `VentesJournalieres` : nombre et montant des commandes par jour et statut ;
+- `VentesProduitJournalieres` : quantités et montants vendus par jour et produit ;
+- `VentesClientJournalieres` : commandes et montants par jour et client.
+
+Les créations, modifications (statut, montant, client) et suppressions de
+`Commande` passent par les signaux ci-dessous. Les chemins qui contournent
+les signaux (`bulk_create` des détails, changements de statut groupés de
+`orders.statuts`) appellent explicitement `enregistrer_details` et
+`enregistrer_mouvements`. La commande `backfill_sales_rollups` reconstruit
+les agrégats à partir des commandes.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Commande, DetailCommande, VentesJournalieres, VentesProduitJournalieres,
+    VentesClientJournalieres,
+)
+
+
+def jour_de(commande):
+    return timezone.localdate(commande.date_creation)
+
+
+def _incrementer(modele, cles, **deltas):
+    """Ajoute les deltas à la ligne d'agrégat identifiée par `cles`, en la créant au besoin."""
+    increments = {champ: F(champ) + valeur for champ, valeur in deltas.items()}
+    if modele.objects.filter(**cles).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            modele.objects.create(**cles, **deltas)
+    except IntegrityError:
+        # Créée entre-temps par une autre transaction
+        modele.objects.filter(**cles).update(**increments)
+
+
+# Champs de `Commande` dont dépendent les agrégats, et ceux qui identifient le client
+CHAMPS_SUIVIS = ('statut', 'montant_total', 'client_id', 'nom_complet', 'email')
+CHAMPS_CLIENT = ('client_id', 'nom_complet', 'email')
+
+
+def _etat(commande):
+    return {champ: getattr(commande, champ) for champ in CHAMPS_SUIVIS}
+
+
+def _cles_client(etat, jour):
+    return {'jour': jour, **{champ: etat[champ] for champ in CHAMPS_CLIENT}}
+
+
+def enregistrer_commande(commande, signe=1, etat=None):
+    """
+    Ajoute (ou retire avec `signe=-1`) la commande aux agrégats, avec les
+    valeurs de `etat` à la place de celles de l'instance s'il est donné.
+    """
+    etat = {**_etat(commande), **(etat or {})}
+    jour = jour_de(commande)
+    _incrementer(
+        VentesJournalieres, {'jour': jour, 'statut': etat['statut']},
+        nombre_commandes=signe, montant_total=signe * etat['montant_total'],
+    )
+    _incrementer(
+        VentesClientJournalieres, _cles_client(etat, jour),
+        nombre_commandes=signe, montant_total=signe * etat['montant_total'],
+    )
+
+
+def enregistrer_details(commande, details, signe=1):
+    """
+    Ajoute (ou retire avec `signe=-1`) les lignes de commande aux ventes par
+    produit, en un nombre fixe de requêtes quel que soit le nombre de lignes :
+    une lecture des agrégats existants, un UPDATE groupé et un INSERT groupé.
+    """
+    jour = jour_de(commande)
+    par_produit = {}
+    for detail in details:
+        quantite, montant = par_produit.get(detail.produit_id, (0, 0))
+        par_produit[detail.produit_id] = (quantite + signe * detail.quantite, montant + signe * detail.montant_total)
+    if not par_produit:
+        return
+
+    lignes = VentesProduitJournalieres.objects.filter(jour=jour)
+    existants = set(lignes.filter(produit_id__in=list(par_produit)).values_list('produit_id', flat=True))
+    if existants:
+        lignes.filter(produit_id__in=existants).update(
+            quantite=F('quantite') + Case(
+                *(When(produit_id=pid, then=Value(par_produit[pid][0])) for pid in existants),
+                default=Value(0),
+            ),
+            montant_total=F('montant_total') + Case(
+                *(When(produit_id=pid, then=Value(par_produit[pid][1])) for pid in existants),
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+    nouveaux = [pid for pid in par_produit if pid not in existants]
+    if not nouveaux:
+        return
+    try:
+        with transaction.atomic():
+            VentesProduitJournalieres.objects.bulk_create([
+                VentesProduitJournalieres(
+                    jour=jour, produit_id=pid,
+                    quantite=par_produit[pid][0], montant_total=par_produit[pid][1],
+                )
+                for pid in nouveaux
+            ])
+    except IntegrityError:
+        # Certaines lignes ont été créées entre-temps : repli ligne par ligne
+        for pid in nouveaux:
+            _incrementer(
+                VentesProduitJournalieres, {'jour': jour, 'produit_id': pid},
+                quantite=par_produit[pid][0], montant_total=par_produit[pid][1],
+            )
+
+
+def enregistrer_mouvements(mouvements):
+    """
+    Reporte dans `VentesJournalieres` les variations
+    `{(jour, statut): (nombre, montant)}`, en un nombre fixe de requêtes
+    comme `enregistrer_details`.
+    """
+    mouvements = {cle: delta for cle, delta in mouvements.items() if delta[0] or delta[1]}
+    if not mouvements:
+        return
+
+    lignes = VentesJournalieres.objects.filter(
+        jour__in={jour for jour, _ in mouvements}, statut__in={statut for _, statut in mouvements},
+    )
+    existants = {
+        (jour, statut): pk
+        for pk, jour, statut in lignes.values_list('pk', 'jour', 'statut')
+        if (jour, statut) in mouvements
+    }
+    if existants:
+        VentesJournalieres.objects.filter(pk__in=existants.values()).update(
+            nombre_commandes=F('nombre_commandes') + Case(
+                *(When(pk=pk, then=Value(mouvements[cle][0])) for cle, pk in existants.items()),
+                default=Value(0),
+            ),
+            montant_total=F('montant_total') + Case(
+                *(When(pk=pk, then=Value(mouvements[cle][1])) for cle, pk in existants.items()),
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+    nouveaux = [cle for cle in mouvements if cle not in existants]
+    if not nouveaux:
+        return
+    try:
+        with transaction.atomic():
+            VentesJournalieres.objects.bulk_create([
+                VentesJournalieres(
+                    jour=jour, statut=statut,
+                    nombre_commandes=mouvements[jour, statut][0], montant_total=mouvements[jour, statut][1],
+                )
+                for jour, statut in nouveaux
+            ])
+    except IntegrityError:
+        # Certaines lignes ont été créées entre-temps : repli ligne par ligne
+        for jour, statut in nouveaux:
+            _incrementer(
+                VentesJournalieres, {'jour': jour, 'statut': statut},
+                nombre_commandes=mouvements[jour, statut][0], montant_total=mouvements[jour, statut][1],
+            )
+
+
+@receiver(post_init, sender=Commande)
+def memoriser_etat(sender, instance, **kwargs):
+    # Valeurs telles qu'en base ; les champs différés (absents de __dict__) ne sont pas suivis
+    instance._etat_initial = {
+        champ: instance.__dict__[champ] for champ in CHAMPS_SUIVIS if champ in instance.__dict__
+    }
+
+
+@receiver(post_save, sender=Commande)
+def suivre_commande(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        enregistrer_commande(instance)
+    else:
+        initial = instance._etat_initial
+        modifies = {champ for champ, valeur in initial.items() if getattr(instance, champ) != valeur}
+        if modifies:
+            jour = jour_de(instance)
+            ancien, actuel = {**_etat(instance), **initial}, _etat(instance)
+            if modifies & {'statut', 'montant_total'}:
+                _incrementer(
+                    VentesJournalieres, {'jour': jour, 'statut': ancien['statut']},
+                    nombre_commandes=-1, montant_total=-ancien['montant_total'],
+                )
+                _incrementer(
+                    VentesJournalieres, {'jour': jour, 'statut': actuel['statut']},
+                    nombre_commandes=1, montant_total=actuel['montant_total'],
+                )
+            if modifies & {'montant_total', *CHAMPS_CLIENT}:
+                _incrementer(
+                    VentesClientJournalieres, _cles_client(ancien, jour),
+                    nombre_commandes=-1, montant_total=-ancien['montant_total'],
+                )
+                _incrementer(
+                    VentesClientJournalieres, _cles_client(actuel, jour),
+                    nombre_commandes=1, montant_total=actuel['montant_total'],
+                )
+    memoriser_etat(sender, instance)
+
+
+@receiver(pre_delete, sender=Commande)
+def retirer_commande(sender, instance, **kwargs):
+    # Les valeurs à retirer sont celles enregistrées en base
+    enregistrer_commande(instance, signe=-1, etat=instance._etat_initial)
+    enregistrer_details(instance, instance.details.all(), signe=-1)
+
+
+@receiver(post_save, sender=DetailCommande)
+def suivre_detail(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enregistrer_details(instance.commande, [instance])
+
+
+@receiver(post_delete, sender=DetailCommande)
+def retirer_detail(sender, instance, origin=None, **kwargs):
+    # Seules les suppressions directes de détails sont reportées ici : en cascade
+    # depuis une commande, retirer_commande s'en est chargé ; depuis un produit,
+    # ses agrégats sont supprimés avec lui
+    if getattr(origin, 'model', type(origin)) is not DetailCommande:
+        return
+    commande = Commande.objects.filter(id=instance.commande_id).first()
+    if commande:
+        enregistrer_details(commande, [instance], signe=-1)
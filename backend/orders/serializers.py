@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from .models import Commande, DetailCommande, Panier, ArticlePanier
-from products.serializers import ProduitSerializer
+from products.serializers import EagerLoadingMixin, ProduitSerializer
 from products.models import Produit
+from . import statuts
 
-class DetailCommandeSerializer(serializers.ModelSerializer):
+class DetailCommandeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     produit = ProduitSerializer(read_only=True)
     produit_id = serializers.PrimaryKeyRelatedField(write_only=True, source='produit', queryset=Produit.objects.all())
     montant_total = serializers.ReadOnlyField()
@@ -13,7 +14,7 @@ class DetailCommandeSerializer(serializers.ModelSerializer):
         fields = ['id', 'produit', 'produit_id', 'prix', 'quantite', 'montant_total']
 
 
-class CommandeSerializer(serializers.ModelSerializer):
+class CommandeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     details = DetailCommandeSerializer(many=True, read_only=True)
     
     class Meta:
@@ -25,13 +26,26 @@ class CommandeSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['client', 'montant_total']
     
+    def validate_statut(self, statut):
+        # Le changement lui-même est fait par statuts.changer_statut (voir CommandeViewSet.perform_update)
+        ancien = self.instance.statut if self.instance else None
+        if ancien and statut != ancien and not statuts.transition_possible(ancien, statut):
+            raise serializers.ValidationError(statuts.message_refus(ancien, statut))
+        return statut
+    
     def create(self, validated_data):
         client = self.context['request'].user
         validated_data['client'] = client
         return super().create(validated_data)
 
 
-class ArticlePanierSerializer(serializers.ModelSerializer):
+class ChangementStatutSerializer(serializers.Serializer):
+    commandes = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+    statut = serializers.ChoiceField(choices=Commande.STATUT_CHOICES)
+    commentaire = serializers.CharField(max_length=255, required=False, default='', allow_blank=True)
+
+
+class ArticlePanierSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     produit = ProduitSerializer(read_only=True)
     produit_id = serializers.PrimaryKeyRelatedField(write_only=True, source='produit', queryset=Produit.objects.all())
     montant_total = serializers.ReadOnlyField()
@@ -41,12 +55,43 @@ class ArticlePanierSerializer(serializers.ModelSerializer):
         fields = ['id', 'produit', 'produit_id', 'quantite', 'montant_total', 'date_ajout']
 
 
-class PanierSerializer(serializers.ModelSerializer):
+class PanierSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     articles = ArticlePanierSerializer(many=True, read_only=True)
     montant_total = serializers.ReadOnlyField()
     nombre_articles = serializers.ReadOnlyField()
     
     class Meta:
         model = Panier
-        fields = ['id', 'client', 'articles', 'montant_total', 'nombre_articles', 'date_creation']
-        read_only_fields = ['client'] 
\ No newline at end of file
+        fields = ['id', 'client', 'articles', 'montant_total', 'nombre_articles', 'version', 'date_creation']
+        read_only_fields = ['client']
+
+
+class ArticlePanierDeltaSerializer(serializers.ModelSerializer):
+    """Ligne de panier compacte, sans le produit imbriqué."""
+    produit_id = serializers.ReadOnlyField()
+    montant_total = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = ArticlePanier
+        fields = ['id', 'produit_id', 'quantite', 'montant_total']
+
+
+class PanierDeltaSerializer(serializers.ModelSerializer):
+    """
+    Réponse compacte d'une mutation : totaux, version et seulement les lignes
+    modifiées (`articles`) ou supprimées (`supprimes`).
+    """
+    articles = serializers.SerializerMethodField()
+    supprimes = serializers.SerializerMethodField()
+    montant_total = serializers.ReadOnlyField()
+    nombre_articles = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = Panier
+        fields = ['id', 'version', 'montant_total', 'nombre_articles', 'articles', 'supprimes']
+    
+    def get_articles(self, panier):
+        return ArticlePanierDeltaSerializer(self.context.get('modifies', []), many=True).data
+    
+    def get_supprimes(self, panier):
+        return list(self.context.get('supprimes', [])) 
\ No newline at end of file
@@ -0,0 +1,38 @@
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+class Agregation:
+    """
+    Construit un ensemble de métriques sous forme d'agrégats conditionnels
+    (`SUM(...) FILTER (WHERE ...)`) évalués en une seule requête :
+
+        stats = Agregation(VentesJournalieres.objects.all())
+        stats.somme('total', 'nombre_commandes')
+        stats.somme('en_attente', 'nombre_commandes', statut='en_attente')
+        stats.calculer()  # {'total': ..., 'en_attente': ...}
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.metriques = {}
+
+    @staticmethod
+    def _condition(filtre, conditions):
+        if not filtre and not conditions:
+            return None
+        return Q(*conditions, **filtre)
+
+    def somme(self, nom, champ, *conditions, defaut=0, **filtre):
+        agregat = Sum(champ, filter=self._condition(filtre, conditions))
+        self.metriques[nom] = agregat if defaut is None else Coalesce(agregat, Value(defaut))
+        return self
+
+    def compte(self, nom, champ='*', *conditions, **filtre):
+        self.metriques[nom] = Count(champ, filter=self._condition(filtre, conditions))
+        return self
+
+    def calculer(self):
+        if not self.metriques:
+            return {}
+        return self.queryset.aggregate(**self.metriques)
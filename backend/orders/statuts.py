@@ -0,0 +1,83 @@
+"""
+Cycle de vie des commandes.
+
+`TRANSITIONS` donne, pour chaque statut, les statuts qu'une commande peut
+prendre ensuite. Tous les changements de statut (actions de l'admin,
+formulaire de l'admin, API) passent par `changer_statut`, qui traite un
+queryset entier en un nombre fixe de requêtes, quel que soit le nombre de
+commandes : lecture des commandes concernées (verrouillées), UPDATE
+groupé, `bulk_create` de `HistoriqueStatut` et report des mouvements dans
+les agrégats de ventes (`rollups.enregistrer_mouvements`).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import Commande, HistoriqueStatut
+
+TRANSITIONS = {
+    'en_attente': {'confirmee', 'annulee'},
+    'confirmee': {'en_traitement', 'expediee', 'annulee'},
+    'en_traitement': {'expediee', 'annulee'},
+    'expediee': {'livree'},
+    'livree': set(),
+    'annulee': set(),
+}
+LIBELLES = dict(Commande.STATUT_CHOICES)
+
+
+def transition_possible(ancien, nouveau):
+    return nouveau in TRANSITIONS.get(ancien, ())
+
+
+def message_refus(ancien, nouveau):
+    return f"Une commande « {LIBELLES.get(ancien, ancien)} » ne peut pas passer à « {LIBELLES.get(nouveau, nouveau)} »"
+
+
+def changer_statut(queryset, statut, auteur=None, commentaire=''):
+    """
+    Fait passer au `statut` les commandes du queryset dont le statut actuel
+    le permet, et historise chaque changement. Retourne le couple
+    (modifiées, refusées) ; les commandes déjà au `statut` ne comptent ni
+    dans l'un ni dans l'autre.
+    """
+    if statut not in TRANSITIONS:
+        raise ValueError(f"Statut inconnu : {statut!r}")
+    sources = [ancien for ancien, suivants in TRANSITIONS.items() if statut in suivants]
+
+    with transaction.atomic():
+        # Par clé primaire : le queryset reçu peut être trié, distinct ou joint
+        commandes = Commande.objects.filter(pk__in=queryset.values('pk')).exclude(statut=statut)
+        lignes = list(
+            commandes.select_for_update().order_by()
+            .values_list('pk', 'statut', 'date_creation', 'montant_total')
+        )
+        a_changer = [ligne for ligne in lignes if ligne[1] in sources]
+        refusees = len(lignes) - len(a_changer)
+        if not a_changer:
+            return 0, refusees
+
+        maintenant = timezone.now()
+        Commande.objects.filter(pk__in=[pk for pk, *_ in a_changer]).update(
+            statut=statut, date_modification=maintenant,
+        )
+        HistoriqueStatut.objects.bulk_create([
+            HistoriqueStatut(
+                commande_id=pk, ancien_statut=ancien, nouveau_statut=statut,
+                auteur=auteur if auteur is not None and auteur.is_authenticated else None,
+                commentaire=commentaire, date=maintenant,
+            )
+            for pk, ancien, _, _ in a_changer
+        ])
+
+        mouvements = defaultdict(lambda: (0, Decimal('0')))
+        for _, ancien, date_creation, montant in a_changer:
+            jour = timezone.localdate(date_creation)
+            for cle, signe in (((jour, ancien), -1), ((jour, statut), 1)):
+                nombre, total = mouvements[cle]
+                mouvements[cle] = (nombre + signe, total + signe * montant)
+        rollups.enregistrer_mouvements(mouvements)
+    return len(a_changer), refusees
@@ -0,0 +1,80 @@
+"""
+Réservation de stock pour la conversion d'un panier en commande.
+
+Le stock est décrémenté par des UPDATE conditionnels (`stock >= quantité`)
+exprimés avec `F()` : la base vérifie et décrémente en une seule instruction,
+sans lecture préalable côté Python, ce qui évite les mises à jour perdues
+entre commandes concurrentes. Si une ligne ne peut pas être servie, une
+exception est levée pour annuler toute la transaction.
+"""
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value
+
+from products import cache as catalogue_cache
+from products.models import Produit
+
+# Nombre de produits par UPDATE (borne la taille de la clause WHERE)
+TAILLE_LOT = 200
+
+
+class StockInsuffisant(Exception):
+    """
+    Au moins un produit ne peut pas être servi. `quantites` contient les
+    quantités demandées ; `produits_en_rupture()` permet d'identifier les
+    produits fautifs une fois la transaction annulée.
+    """
+
+    def __init__(self, quantites):
+        self.quantites = quantites
+        super().__init__("Stock insuffisant")
+
+
+def regrouper(lignes):
+    """Additionne les quantités par produit à partir de paires (produit_id, quantite)."""
+    quantites = Counter()
+    for produit_id, quantite in lignes:
+        quantites[produit_id] += quantite
+    return quantites
+
+
+def reserver_stock(lignes):
+    """
+    Décrémente le stock de chaque produit de `lignes` (paires
+    `(produit_id, quantite)`), ou lève `StockInsuffisant` si au moins un
+    produit n'a pas assez de stock. Doit être appelée dans une transaction
+    pour que l'échec annule les décréments déjà appliqués.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise transaction.TransactionManagementError("reserver_stock doit être appelée dans transaction.atomic()")
+
+    quantites = regrouper(lignes)
+    produit_ids = list(quantites)
+
+    for debut in range(0, len(produit_ids), TAILLE_LOT):
+        lot = produit_ids[debut:debut + TAILLE_LOT]
+        conditions = reduce(or_, (Q(id=pid, stock__gte=quantites[pid]) for pid in lot))
+        mis_a_jour = Produit.objects.filter(conditions).update(
+            stock=F('stock') - Case(
+                *(When(id=pid, then=Value(quantites[pid])) for pid in lot),
+                default=Value(0),
+            )
+        )
+        if mis_a_jour != len(lot):
+            raise StockInsuffisant(quantites)
+
+    # update() n'émet pas de signal : invalider le cache du catalogue une fois validé
+    transaction.on_commit(lambda: catalogue_cache.invalider_produits(produit_ids), robust=True)
+    return quantites
+
+
+def produits_en_rupture(quantites):
+    """
+    Identifie les produits dont le stock ne couvre pas la quantité demandée.
+    À appeler hors de la transaction annulée, sur les stocks d'origine.
+    """
+    stocks = dict(Produit.objects.filter(id__in=list(quantites)).values_list('id', 'stock'))
+    return sorted(pid for pid, quantite in quantites.items() if stocks.get(pid, 0) < quantite)
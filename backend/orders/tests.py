@@ -1,3 +1,1104 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import login
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import F, Sum
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from nkcommerce.bases import base_de_donnees, repliques
+from nkcommerce.routeurs import COOKIE_PRIMAIRE
+from products import cache as catalogue_cache
+from products.models import Categorie, Produit
+from products.tests import QueryCountMixin, creer_produits
+from .models import (
+    Commande, DetailCommande, HistoriqueStatut, Panier, ArticlePanier, VentesJournalieres,
+    VentesClientJournalieres,
+)
+from .paniers import COOKIE, StockageRelationnel
+from .stock import StockInsuffisant, reserver_stock
+from . import exports, statuts, views_async
+
+COORDONNEES = {
+    'nom_complet': "Client Test",
+    'email': "client@exemple.com",
+    'telephone': "0600000000",
+    'adresse': "1 rue de la Paix",
+    'ville': "Paris",
+}
+
+
+class EagerLoadingTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('client', is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+
+    def remplir_commandes(self, debut, nombre):
+        produits = creer_produits(self.categorie, nombre, debut=debut)
+        commandes = Commande.objects.bulk_create([
+            Commande(client=self.user, nom_complet="Client", email="client@exemple.com",
+                     telephone="0600000000", adresse="1 rue", ville="Paris",
+                     montant_total=Decimal('10.00'))
+            for _ in range(nombre)
+        ])
+        DetailCommande.objects.bulk_create([
+            DetailCommande(commande=commande, produit=produit, prix=produit.prix, quantite=1)
+            for commande, produit in zip(commandes, produits)
+        ])
+
+    def remplir_panier(self, debut, nombre):
+        panier = Panier.objects.get(client=self.user)
+        ArticlePanier.objects.bulk_create([
+            ArticlePanier(panier=panier, produit=produit, quantite=2)
+            for produit in creer_produits(self.categorie, nombre, debut=debut)
+        ])
+
+    def test_liste_commandes(self):
+        self.assertConstantQueries('/api/orders/commandes/', self.remplir_commandes)
+
+    def test_panier(self):
+        self.assertConstantQueries('/api/orders/panier/', self.remplir_panier)
+
+
+class ReservationStockTests(TestCase):
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+
+    def test_decremente_toutes_les_lignes_en_une_requete(self):
+        with transaction.atomic(), self.assertNumQueries(1):
+            reserver_stock([(self.a.id, 3), (self.b.id, 10)])
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.stock, self.b.stock), (7, 0))
+
+    def test_lignes_dupliquees_additionnees(self):
+        with self.assertRaises(StockInsuffisant), transaction.atomic():
+            reserver_stock([(self.a.id, 6), (self.a.id, 6)])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock, 10)
+
+    def test_rupture_annule_toutes_les_lignes(self):
+        with self.assertRaises(StockInsuffisant), transaction.atomic():
+            reserver_stock([(self.a.id, 3), (self.b.id, 11)])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock, 10)
+
+    def test_commande_refusee_si_rupture(self):
+        client = APIClient()
+        client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.a.id, 'quantite': 5})
+        Produit.objects.filter(id=self.a.id).update(stock=2)
+        response = client.post('/api/orders/panier/convertir_en_commande/', COORDONNEES)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['produits'], [self.a.id])
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(ArticlePanier.objects.count(), 1)
+
+
+class CommandesConcurrentesTests(TransactionTestCase):
+    """Commandes simultanées sur le même produit : jamais de survente."""
+    commandes = 20
+    stock = 7
+
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produit = Produit.objects.create(
+            nom="Édition limitée", categorie=categorie, description="",
+            prix=Decimal('99.00'), stock=self.stock,
+        )
+        self.clients = []
+        for _ in range(self.commandes):
+            client = APIClient()
+            client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.produit.id, 'quantite': 1})
+            self.clients.append(client)
+
+    def commander(self, client, depart, statuts):
+        depart.wait()
+        try:
+            while True:
+                try:
+                    response = client.post('/api/orders/panier/convertir_en_commande/', COORDONNEES)
+                    break
+                except OperationalError:
+                    # SQLite sérialise les écritures : réessayer si la base est verrouillée
+                    continue
+            statuts.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_pas_de_survente(self):
+        depart = threading.Barrier(self.commandes)
+        statuts = []
+        threads = [
+            threading.Thread(target=self.commander, args=(client, depart, statuts))
+            for client in self.clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.produit.refresh_from_db()
+        self.assertEqual(statuts.count(201), self.stock)
+        self.assertEqual(statuts.count(400), self.commandes - self.stock)
+        self.assertEqual(self.produit.stock, 0)
+        self.assertEqual(Commande.objects.count(), self.stock)
+
+
+class AjoutsConcurrentsTests(TransactionTestCase):
+    """Ajouts simultanés du même produit : une seule ligne, aucune quantité perdue."""
+    ajouts = 20
+
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produit = Produit.objects.create(
+            nom="Eau de toilette", categorie=categorie, description="",
+            prix=Decimal('25.00'), stock=100,
+        )
+        self.acheteur = User.objects.create_user('acheteur')
+
+    def ajouter(self, depart):
+        client = APIClient()
+        client.force_authenticate(self.acheteur)
+        depart.wait()
+        try:
+            while True:
+                try:
+                    client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.produit.id, 'quantite': 1})
+                    break
+                except OperationalError:
+                    # SQLite sérialise les écritures : réessayer si la base est verrouillée
+                    continue
+        finally:
+            connection.close()
+
+    def test_quantite_egale_au_nombre_d_ajouts(self):
+        depart = threading.Barrier(self.ajouts)
+        threads = [threading.Thread(target=self.ajouter, args=(depart,)) for _ in range(self.ajouts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        panier = Panier.objects.get(client=self.acheteur)
+        article = ArticlePanier.objects.get(panier=panier, produit=self.produit)
+        self.assertEqual(article.quantite, self.ajouts)
+        self.assertEqual(panier.nombre_articles, self.ajouts)
+        self.assertEqual(panier.montant_total, self.produit.prix * self.ajouts)
+
+
+@override_settings(PANIER_INVITE_STOCKAGE='orders.paniers.StockageCleValeur')
+class AjoutsConcurrentsCleValeurTests(TransactionTestCase):
+    """Même garantie pour un panier anonyme du stockage clé-valeur."""
+    ajouts = 20
+
+    def setUp(self):
+        caches['paniers'].clear()
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produit, self.autre = creer_produits(categorie, 2)
+        # Le panier existe déjà : toutes les requêtes portent le même cookie
+        client = APIClient()
+        client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.autre.id})
+        self.cookie = client.cookies['panier_invite'].value
+
+    def ajouter(self, depart):
+        client = APIClient()
+        client.cookies['panier_invite'] = self.cookie
+        depart.wait()
+        try:
+            client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.produit.id, 'quantite': 1})
+        finally:
+            connection.close()
+
+    def test_quantite_egale_au_nombre_d_ajouts(self):
+        depart = threading.Barrier(self.ajouts)
+        threads = [threading.Thread(target=self.ajouter, args=(depart,)) for _ in range(self.ajouts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        client = APIClient()
+        client.cookies['panier_invite'] = self.cookie
+        panier = client.get('/api/orders/panier/').data
+        self.assertEqual(
+            [(article['produit']['id'], article['quantite']) for article in panier['articles']],
+            [(self.autre.id, 1), (self.produit.id, self.ajouts)],
+        )
+        self.assertEqual(panier['nombre_articles'], self.ajouts + 1)
+
+
+class ModificationsConcurrentesTests(TestCase):
+    """Deux requêtes ont lu la même ligne avant de la modifier : les totaux restent exacts."""
+
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+        self.panier, _ = Panier.objects.get_or_create(client=User.objects.create_user('acheteur'))
+        self.ligne = self.panier.ajouter_article(self.a, 3)
+        self.panier.ajouter_article(self.b, 2)
+        self.stockage = StockageRelationnel()
+
+    def lues_deux_fois(self):
+        return self.stockage.ligne(self.panier, self.ligne.id), self.stockage.ligne(self.panier, self.ligne.id)
+
+    def assertTotauxExacts(self):
+        self.panier.refresh_from_db()
+        attendus = self.panier.articles.aggregate(nombre=Sum('quantite'), montant=Sum(F('quantite') * F('produit__prix')))
+        self.assertEqual(
+            (self.panier.nombre_articles, self.panier.montant_total),
+            (attendus['nombre'], attendus['montant']),
+        )
+
+    def test_suppressions_simultanees(self):
+        premiere, seconde = self.lues_deux_fois()
+        self.stockage.supprimer(self.panier, premiere)
+        self.stockage.supprimer(self.panier, seconde)
+        self.assertTotauxExacts()
+        self.assertEqual(self.panier.nombre_articles, 2)
+
+    def test_modifications_simultanees(self):
+        premiere, seconde = self.lues_deux_fois()
+        self.stockage.modifier(self.panier, premiere, 5)
+        self.stockage.modifier(self.panier, seconde, 1)
+        self.assertTotauxExacts()
+        self.assertEqual(self.panier.nombre_articles, 3)
+
+        premiere, seconde = self.lues_deux_fois()
+        self.stockage.supprimer(self.panier, premiere)
+        self.stockage.modifier(self.panier, seconde, 4)
+        self.assertTotauxExacts()
+
+
+@override_settings(PANIER_INVITE_STOCKAGE='orders.paniers.StockageCleValeur')
+class StockageCleValeurTests(TestCase):
+    def setUp(self):
+        caches['paniers'].clear()
+        self.client = APIClient()
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+
+    def test_panier_invite_sans_ecriture_en_base(self):
+        paniers, sessions = Panier.objects.count(), Session.objects.count()
+        url = '/api/orders/panier/'
+        self.client.post(url + 'ajouter_produit/', {'produit_id': self.a.id, 'quantite': 2})
+        response = self.client.post(url + 'ajouter_produit/', {'produit_id': self.b.id, 'quantite': 1})
+        self.assertEqual(response.data['nombre_articles'], 3)
+        self.assertEqual(response.data['montant_total'], self.a.prix * 2 + self.b.prix)
+        self.assertEqual(response.data['articles'][0]['produit']['id'], self.a.id)
+
+        article_id = response.data['articles'][0]['id']
+        response = self.client.post(url + 'modifier_quantite/?mode=delta', {'article_id': article_id, 'quantite': 5})
+        self.assertEqual(response.data['articles'][0]['quantite'], 5)
+        self.assertEqual(response.data['nombre_articles'], 6)
+        response = self.client.post(url + 'supprimer_article/?mode=delta', {'article_id': self.b.id})
+        self.assertEqual(response.data['supprimes'], [self.b.id])
+        self.assertEqual(self.client.get(url).data['nombre_articles'], 5)
+
+        self.assertEqual(Panier.objects.count(), paniers)
+        self.assertEqual(Session.objects.count(), sessions)
+
+    def test_lecture_d_un_panier_vide_sans_cookie(self):
+        response = self.client.get('/api/orders/panier/')
+        self.assertEqual(response.data['articles'], [])
+        self.assertNotIn('panier_invite', response.cookies)
+
+    def test_commande_depuis_le_stockage_cle_valeur(self):
+        url = '/api/orders/panier/'
+        self.client.post(url + 'ajouter_produit/', {'produit_id': self.a.id, 'quantite': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + 'convertir_en_commande/', COORDONNEES)
+        self.assertEqual(response.status_code, 201)
+
+        commande = Commande.objects.get(id=response.data['id_commande'])
+        self.assertEqual(commande.montant_total, self.a.prix * 2)
+        self.assertEqual(commande.details.get().quantite, 2)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.stock, 8)
+        self.assertEqual(self.client.get(url).data['articles'], [])
+
+    def test_panier_expire(self):
+        self.client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.a.id})
+        caches['paniers'].clear()
+        self.assertEqual(self.client.get('/api/orders/panier/').data['articles'], [])
+
+    @mock.patch('orders.paniers.VERROU_DUREE', 0.05)
+    def test_panier_occupe(self):
+        url = '/api/orders/panier/ajouter_produit/'
+        self.client.post(url, {'produit_id': self.a.id})
+        requete = RequestFactory().get('/')
+        requete.COOKIES[COOKIE] = self.client.cookies[COOKIE].value
+        cle = requete.get_signed_cookie(COOKIE, salt=COOKIE)
+        verrou = f'panier:{cle}:verrou'
+        # Verrou tenu par une autre requête : attente bornée puis 409
+        caches['paniers'].add(verrou, 'autre', timeout=60)
+        response = self.client.post(url, {'produit_id': self.a.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(caches['paniers'].get(verrou), 'autre')
+
+        caches['paniers'].delete(verrou)
+        response = self.client.post(url, {'produit_id': self.a.id})
+        self.assertEqual(response.data['nombre_articles'], 2)
+
+
+
+class PanierAsyncTests(TestCase):
+    def setUp(self):
+        caches['paniers'].clear()
+        self.client = APIClient()
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+
+    def lire(self, **en_tetes):
+        with mock.patch.object(views_async, 'panier_drf', side_effect=AssertionError("délégation inattendue")):
+            return async_to_sync(self.async_client.get)('/api/orders/panier/', headers=en_tetes)
+
+    def test_client_authentifie_par_jeton(self):
+        jeton = Token.objects.create(user=User.objects.create_user('client'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {jeton.key}')
+        self.client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.a.id, 'quantite': 2})
+        attendu = self.client.get('/api/orders/panier/')
+
+        response = self.lire(Authorization=f'Token {jeton.key}')
+        self.assertEqual(response.json(), json.loads(attendu.content))
+        self.assertEqual(response['ETag'], attendu['ETag'])
+
+        response = async_to_sync(self.async_client.get)('/api/orders/panier/', headers={'Authorization': 'Token faux'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_visiteur_avec_session(self):
+        premier = self.lire()
+        self.assertEqual(premier.json()['articles'], [])
+        self.assertEqual(self.lire().json()['id'], premier.json()['id'])
+        self.assertEqual(Panier.objects.filter(client__isnull=True).count(), 1)
+
+    @override_settings(PANIER_INVITE_STOCKAGE='orders.paniers.StockageCleValeur')
+    def test_visiteur_stockage_cle_valeur(self):
+        self.client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.b.id})
+        self.client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.a.id, 'quantite': 3})
+        attendu = self.client.get('/api/orders/panier/')
+
+        self.async_client.cookies = self.client.cookies
+        response = self.lire()
+        self.assertEqual(response.json(), json.loads(attendu.content))
+        self.assertEqual([article['produit']['id'] for article in response.json()['articles']], [self.b.id, self.a.id])
+        self.assertIn('panier_invite', response.cookies)
+
+
+class PurgePaniersTests(TestCase):
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produit, = creer_produits(categorie, 1)
+        ancien = timezone.now() - timedelta(days=60)
+        self.inactifs = Panier.objects.bulk_create(Panier(session_id=f'inactif-{i}') for i in range(5))
+        self.actif = Panier.objects.create(session_id='actif')
+        self.client_inactif = Panier.objects.get(client=User.objects.create_user('fidele'))
+        ArticlePanier.objects.bulk_create(
+            ArticlePanier(panier=panier, produit=self.produit)
+            for panier in self.inactifs + [self.actif, self.client_inactif]
+        )
+        Panier.objects.exclude(pk=self.actif.pk).update(date_modification=ancien)
+        Session.objects.create(session_key='expiree', session_data='', expire_date=ancien)
+        Session.objects.create(session_key='valide', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+    def test_purge_par_lots(self):
+        sortie = StringIO()
+        call_command('purge_guest_carts', jours=30, batch_size=2, stdout=sortie)
+        self.assertIn("5 paniers, 5 lignes et 1 sessions supprimés", sortie.getvalue())
+        self.assertEqual(set(Panier.objects.all()), {self.actif, self.client_inactif})
+        self.assertEqual(ArticlePanier.objects.count(), 2)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['valide'])
+
+    def test_reprise_et_activite(self):
+        # Une mutation du panier compte comme une activité
+        self.inactifs[0].ajuster_totaux(1, self.produit.prix)
+        call_command('purge_guest_carts', depuis_id=self.inactifs[1].pk, stdout=StringIO())
+        self.assertEqual(
+            set(Panier.objects.filter(client__isnull=True)),
+            {self.inactifs[0], self.inactifs[1], self.actif},
+        )
+
+
+class FusionPanierTests(TestCase):
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produits = creer_produits(categorie, 300)
+        self.user = User.objects.create_user('acheteur', password='secret')
+        self.panier = Panier.objects.get(client=self.user)
+        self.panier.fusionner({produit.id: 1 for produit in self.produits[:10]})
+
+    def visiteur(self, lignes):
+        """Client anonyme dont le panier en base contient `lignes` produits en quantité 2."""
+        client = APIClient()
+        client.get('/api/orders/panier/')
+        panier = Panier.objects.get(session_id=client.session['cart_session_id'])
+        ArticlePanier.objects.bulk_create(
+            ArticlePanier(panier=panier, produit=produit, quantite=2) for produit in self.produits[:lignes]
+        )
+        return client, panier
+
+    def connecter(self, client):
+        return client.post('/api/users/public/token/', {'username': 'acheteur', 'password': 'secret'}, format='json')
+
+    def test_fusion_a_la_connexion_par_jeton(self):
+        client, invite = self.visiteur(300)
+        self.assertEqual(self.connecter(client).status_code, 200)
+
+        self.assertFalse(Panier.objects.filter(pk=invite.pk).exists())
+        quantites = dict(ArticlePanier.objects.filter(panier=self.panier).values_list('produit_id', 'quantite'))
+        self.assertEqual(len(quantites), 300)
+        self.assertEqual(quantites[self.produits[0].id], 3)
+        self.assertEqual(quantites[self.produits[-1].id], 2)
+        self.panier.refresh_from_db()
+        self.assertEqual(self.panier.nombre_articles, 610)
+        self.assertEqual(
+            self.panier.montant_total,
+            sum(produit.prix * quantites[produit.id] for produit in self.produits),
+        )
+
+        # Une seconde connexion ne fusionne plus rien
+        self.connecter(client)
+        self.assertEqual(ArticlePanier.objects.get(panier=self.panier, produit=self.produits[0]).quantite, 3)
+
+    def test_requetes_independantes_du_nombre_de_lignes(self):
+        self.connecter(APIClient())  # création du jeton
+        requetes = []
+        # Jusqu'à 240 lignes, l'INSERT groupé tient dans un seul lot pour SQLite
+        for lignes in (20, 240):
+            ArticlePanier.objects.filter(panier=self.panier).delete()
+            client, _ = self.visiteur(lignes)
+            with CaptureQueriesContext(connection) as ctx:
+                self.connecter(client)
+            requetes.append(len(ctx))
+        self.assertEqual(requetes[0], requetes[1])
+
+    def test_fusion_a_l_inscription(self):
+        client, _ = self.visiteur(5)
+        response = client.post('/api/users/public/register/', {
+            'username': 'nouveau', 'email': 'nouveau@exemple.com', 'password': 'secret',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        panier = Panier.objects.get(client__username='nouveau')
+        self.assertEqual(panier.nombre_articles, 10)
+
+    def test_fusion_sur_user_logged_in(self):
+        client, invite = self.visiteur(3)
+        request = RequestFactory().get('/')
+        request.session = client.session
+        login(request, self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertFalse(Panier.objects.filter(pk=invite.pk).exists())
+        self.assertEqual(ArticlePanier.objects.get(panier=self.panier, produit=self.produits[0]).quantite, 3)
+
+    @override_settings(PANIER_INVITE_STOCKAGE='orders.paniers.StockageCleValeur')
+    def test_fusion_depuis_le_stockage_cle_valeur(self):
+        caches['paniers'].clear()
+        client = APIClient()
+        for produit in self.produits[:2] + self.produits[20:22]:
+            client.post('/api/orders/panier/ajouter_produit/', {'produit_id': produit.id, 'quantite': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.connecter(client)
+
+        self.panier.refresh_from_db()
+        self.assertEqual(self.panier.nombre_articles, 10 + 8)
+        self.assertEqual(ArticlePanier.objects.get(panier=self.panier, produit=self.produits[20]).quantite, 2)
+        self.assertEqual(client.get('/api/orders/panier/').data['articles'], [])
+
+
+class CommandeGroupeeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('acheteur')
+        self.client.force_authenticate(self.user)
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.panier = Panier.objects.get(client=self.user)
+        self.deja_crees = 0
+
+    def remplir_panier(self, lignes):
+        produits = creer_produits(self.categorie, lignes, debut=self.deja_crees)
+        self.deja_crees += lignes
+        ArticlePanier.objects.bulk_create([
+            ArticlePanier(panier=self.panier, produit=produit, quantite=2) for produit in produits
+        ])
+        return produits
+
+    def commander(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/panier/convertir_en_commande/', COORDONNEES)
+        self.assertEqual(response.status_code, 201)
+        return response, len(ctx.captured_queries)
+
+    def test_nombre_de_requetes_constant(self):
+        # Première commande du jour : crée les lignes d'agrégats de statut et de client
+        self.remplir_panier(1)
+        self.commander()
+        comptes = {}
+        for lignes in (1, 50, 200):
+            self.remplir_panier(lignes)
+            _, comptes[lignes] = self.commander()
+        self.assertEqual(len(set(comptes.values())), 1, comptes)
+
+    def test_commande_complete(self):
+        produits = self.remplir_panier(3)
+        response, _ = self.commander()
+        commande = Commande.objects.get(id=response.data['id_commande'])
+        self.assertEqual(commande.details.count(), 3)
+        self.assertEqual(commande.montant_total, sum(p.prix * 2 for p in produits))
+        self.assertFalse(ArticlePanier.objects.filter(panier=self.panier).exists())
+        self.assertEqual(
+            set(Produit.objects.values_list('stock', flat=True)), {8}
+        )
+
+
+class TotauxPanierTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('acheteur')
+        self.client.force_authenticate(self.user)
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+        self.panier = Panier.objects.get(client=self.user)
+
+    def totaux(self):
+        self.panier.refresh_from_db()
+        return self.panier.nombre_articles, self.panier.montant_total
+
+    def attendus(self):
+        panier = Panier.objects.avec_totaux_calcules().get(pk=self.panier.pk)
+        return panier.nombre_calcule, panier.montant_calcule
+
+    def test_mutations_maintiennent_les_totaux(self):
+        url = '/api/orders/panier/'
+        self.client.post(url + 'ajouter_produit/', {'produit_id': self.a.id, 'quantite': 2})
+        response = self.client.post(url + 'ajouter_produit/', {'produit_id': self.b.id, 'quantite': 3})
+        self.assertEqual(response.data['nombre_articles'], 5)
+        self.assertEqual(self.totaux(), self.attendus())
+
+        article = ArticlePanier.objects.get(produit=self.a)
+        self.client.post(url + 'modifier_quantite/', {'article_id': article.id, 'quantite': 4})
+        self.assertEqual(self.totaux(), (7, self.a.prix * 4 + self.b.prix * 3))
+
+        self.client.post(url + 'supprimer_article/', {'article_id': article.id})
+        self.assertEqual(self.totaux(), self.attendus())
+
+        self.client.post(url + 'vider/')
+        self.assertEqual(self.totaux(), (0, 0))
+
+    def test_reponses_delta(self):
+        url = '/api/orders/panier/'
+        response = self.client.post(url + 'ajouter_produit/?mode=delta', {'produit_id': self.a.id, 'quantite': 2})
+        self.assertNotIn('produit', response.data['articles'][0])
+        self.assertEqual(response.data['articles'][0]['produit_id'], self.a.id)
+        self.assertEqual(response.data['articles'][0]['quantite'], 2)
+        self.assertEqual(response.data['nombre_articles'], 2)
+        self.assertEqual(response['ETag'], f'"{self.panier.id}-{response.data["version"]}"')
+        version = response.data['version']
+
+        article = ArticlePanier.objects.get(produit=self.a)
+        response = self.client.post(url + 'modifier_quantite/?mode=delta', {'article_id': article.id, 'quantite': 0})
+        self.assertEqual(response.data['articles'], [])
+        self.assertEqual(response.data['supprimes'], [article.id])
+        self.assertEqual(response.data['nombre_articles'], 0)
+        self.assertGreater(response.data['version'], version)
+
+        # Le panier complet expose la même version
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], f'"{self.panier.id}-{response.data["version"]}"')
+
+    def test_delta_independant_de_la_taille_du_panier(self):
+        url = '/api/orders/panier/modifier_quantite/?mode=delta'
+        article = ArticlePanier.objects.create(panier=self.panier, produit=self.a, quantite=1)
+        with CaptureQueriesContext(connection) as petit:
+            self.client.post(url, {'article_id': article.id, 'quantite': 2})
+
+        autres = creer_produits(Categorie.objects.get(), 50, debut=2)
+        ArticlePanier.objects.bulk_create(
+            ArticlePanier(panier=self.panier, produit=produit) for produit in autres
+        )
+        with CaptureQueriesContext(connection) as grand:
+            response = self.client.post(url, {'article_id': article.id, 'quantite': 3})
+        self.assertEqual(len(grand), len(petit))
+        self.assertEqual(len(response.data['articles']), 1)
+
+    def test_changement_de_prix(self):
+        self.client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.a.id, 'quantite': 2})
+        self.a.prix = Decimal('1.50')
+        self.a.save()
+        self.assertEqual(self.totaux(), (2, Decimal('3.00')))
+
+        # Les totaux ne dépendent que du prix : rien à recalculer pour le stock
+        self.a.stock = 4
+        with CaptureQueriesContext(connection) as requetes:
+            self.a.save()
+        self.assertFalse([r for r in requetes.captured_queries if 'UPDATE "orders_panier"' in r['sql']])
+        self.assertEqual(self.totaux(), (2, Decimal('3.00')))
+        self.a.delete()
+        self.assertEqual(self.totaux(), (0, 0))
+
+    def test_reconciliation(self):
+        ArticlePanier.objects.create(panier=self.panier, produit=self.a, quantite=3)
+        sortie = StringIO()
+        call_command('reconcile_cart_totals', dry_run=True, stdout=sortie)
+        self.assertIn(f"Panier {self.panier.pk}", sortie.getvalue())
+        self.assertEqual(self.totaux(), (0, 0))
+
+        call_command('reconcile_cart_totals', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.totaux(), (3, self.a.prix * 3))
+
+
+class AgregatsVentesTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+        self.acheteur = User.objects.create_user('acheteur')
+
+    def commander(self, lignes, client=None):
+        api = APIClient()
+        if client:
+            api.force_authenticate(client)
+        for produit, quantite in lignes:
+            api.post('/api/orders/panier/ajouter_produit/', {'produit_id': produit.id, 'quantite': quantite})
+        response = api.post('/api/orders/panier/convertir_en_commande/', COORDONNEES)
+        return Commande.objects.get(id=response.data['id_commande'])
+
+    def statistiques(self, params=None):
+        return (
+            self.client.get('/api/orders/stats/orders/', params).json(),
+            self.client.get('/api/orders/stats/sales/', params).json(),
+            self.client.get('/api/orders/stats/users/', params).json(),
+        )
+
+    def test_suivi_incremental_identique_a_la_reconstruction(self):
+        premiere = self.commander([(self.a, 2), (self.b, 1)], client=self.acheteur)
+        self.commander([(self.a, 1)], client=self.acheteur)
+        troisieme = self.commander([(self.b, 3)])
+        self.client.post(f'/api/orders/commandes/{premiere.id}/confirm/')
+        statuts.changer_statut(Commande.objects.filter(id=troisieme.id), 'annulee')
+        Commande.objects.filter(id=troisieme.id).first().delete()
+
+        incremental = self.statistiques()
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.statistiques(), incremental)
+
+        commandes, ventes, clients = incremental
+        self.assertEqual(commandes['total_orders'], 2)
+        self.assertEqual(commandes['confirmed_orders'], 1)
+        self.assertEqual(commandes['pending_orders'], 1)
+        self.assertEqual(ventes['total_sales']['total'], float(self.a.prix * 3 + self.b.prix))
+        self.assertEqual(ventes['top_products'][0]['produit__id'], self.a.id)
+        self.assertEqual(ventes['top_products'][0]['total_quantity'], 3)
+        self.assertEqual(clients['total_customers'], 1)
+        self.assertEqual(clients['repeat_customers'], 1)
+
+    def test_modification_du_client_puis_suppression(self):
+        commande = self.commander([(self.a, 1)], client=self.acheteur)
+        gardee = self.commander([(self.b, 2)])
+        self.client.patch(f'/api/orders/commandes/{gardee.id}/', {'email': 'autre@exemple.com'}, format='json')
+
+        def lignes():
+            return list(
+                VentesClientJournalieres.objects.exclude(nombre_commandes=0, montant_total=0)
+                .order_by('email').values_list('client_id', 'email', 'nombre_commandes', 'montant_total')
+            )
+
+        self.assertEqual(lignes(), [
+            (None, 'autre@exemple.com', 1, self.b.prix * 2),
+            (self.acheteur.id, 'client@exemple.com', 1, self.a.prix),
+        ])
+
+        commande.refresh_from_db()
+        commande.email = 'nouveau@exemple.com'
+        commande.save(update_fields=['email'])
+        Commande.objects.get(pk=commande.pk).delete()
+        incremental = lignes()
+        self.assertEqual(incremental, [(None, 'autre@exemple.com', 1, self.b.prix * 2)])
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(lignes(), incremental)
+
+    def test_periode_personnalisee(self):
+        commande = self.commander([(self.a, 1)])
+        Commande.objects.filter(id=commande.id).update(date_creation=timezone.now() - timedelta(days=90))
+        call_command('backfill_sales_rollups', stdout=StringIO())
+
+        commandes, ventes, _ = self.statistiques()
+        self.assertEqual(commandes['recent_orders'], 0)
+        self.assertEqual(ventes['top_products'], [])
+
+        jour = (timezone.localdate() - timedelta(days=90)).isoformat()
+        commandes, ventes, clients = self.statistiques({'debut': jour, 'fin': jour})
+        self.assertEqual(commandes['recent_orders'], 1)
+        self.assertEqual(ventes['recent_sales']['total'], float(self.a.prix))
+        self.assertEqual(clients['new_customers'], 1)
+
+    def test_periode_invalide(self):
+        response = self.client.get('/api/orders/stats/orders/', {'debut': '2025-02-01', 'fin': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_une_requete_d_agregats_par_endpoint(self):
+        for numero in range(5):
+            client = User.objects.create_user(f'client{numero}')
+            self.commander([(self.a, 1), (self.b, numero + 1)], client=client)
+
+        # statistics : une seule requête, quel que soit le nombre de statuts
+        with self.assertNumQueries(1):
+            self.client.get('/api/orders/stats/orders/')
+        # sales et users : les métriques scalaires, puis le classement
+        with self.assertNumQueries(2):
+            self.client.get('/api/orders/stats/sales/')
+        with self.assertNumQueries(2):
+            self.client.get('/api/orders/stats/users/')
+
+
+class AnalyseRequetesTests(TestCase):
+    def test_filtres_frequents_sans_parcours_sequentiel(self):
+        out = StringIO()
+        call_command('explain_hot_queries', '--strict', stdout=out)
+        self.assertIn("0 avec parcours séquentiel", out.getvalue())
+
+    def test_journal_capture(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as journal:
+            journal.write(json.dumps({
+                'sql': 'SELECT U0."id" FROM "orders_commande" U0 WHERE U0."nom_complet" = %s',
+                'params': ['Client Test'],
+            }) + '\n')
+            journal.write('(0.001) SELECT "orders_panier"."id" FROM "orders_panier" '
+                          'WHERE "orders_panier"."session_id" = \'abc\'; args=(\'abc\',); alias=default\n')
+        self.addCleanup(os.remove, journal.name)
+
+        out = StringIO()
+        call_command('explain_hot_queries', journal.name, stdout=out)
+        self.assertIn("Parcours séquentiel : orders_commande", out.getvalue())
+        self.assertIn("2 requêtes analysées, 1 avec parcours séquentiel", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('explain_hot_queries', journal.name, '--strict', stdout=StringIO())
+
+
+class ProfilsBaseDeDonneesTests(TestCase):
+    def test_developpement(self):
+        config = base_de_donnees(Path('/tmp'), environ={})
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertFalse(config['CONN_HEALTH_CHECKS'])
+        self.assertEqual(config['OPTIONS'], {})
+
+    def test_production_sqlite(self):
+        config = base_de_donnees(Path('/tmp'), environ={'DB_PROFIL': 'production'})
+        self.assertEqual(config['CONN_MAX_AGE'], 600)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertIn('PRAGMA journal_mode=WAL', config['OPTIONS']['init_command'])
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        # Réglages de test posés par settings, pas par le profil
+        self.assertNotIn('TEST', config)
+
+        config = base_de_donnees(Path('/tmp'), environ={'DB_PROFIL': 'production', 'DB_SQLITE_WAL': '0'})
+        self.assertNotIn('journal_mode', config['OPTIONS']['init_command'])
+
+    def test_production_postgresql(self):
+        config = base_de_donnees(Path('/tmp'), environ={'DB_MOTEUR': 'postgresql', 'DB_PROFIL': 'production'})
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 10)
+        # Django refuse un pool avec des connexions persistantes
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+
+        config = base_de_donnees(Path('/tmp'), environ={
+            'DB_MOTEUR': 'postgresql', 'DB_PROFIL': 'production', 'DB_POOL': '0', 'DB_CONN_MAX_AGE': 'none',
+        })
+        self.assertNotIn('pool', config['OPTIONS'])
+        self.assertIsNone(config['CONN_MAX_AGE'])
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_repliques(self):
+        sqlite = base_de_donnees(Path('/tmp'), environ={'DB_PROFIL': 'production'})
+        configs = repliques(sqlite, environ={'DB_REPLIQUES': '/tmp/r1.sqlite3,/tmp/r2.sqlite3'})
+        self.assertEqual(list(configs), ['replique_1', 'replique_2'])
+        self.assertEqual(configs['replique_2']['NAME'], '/tmp/r2.sqlite3')
+        self.assertEqual(configs['replique_1']['TEST'], {'MIRROR': 'default'})
+        self.assertNotIn('transaction_mode', configs['replique_1']['OPTIONS'])
+        self.assertIn('transaction_mode', sqlite['OPTIONS'])
+
+        postgresql = base_de_donnees(Path('/tmp'), environ={'DB_MOTEUR': 'postgresql', 'DB_PORT': '5432'})
+        configs = repliques(postgresql, environ={'DB_REPLIQUES': 'lecture1,lecture2:6432'})
+        self.assertEqual((configs['replique_1']['HOST'], configs['replique_1']['PORT']), ('lecture1', '5432'))
+        self.assertEqual((configs['replique_2']['HOST'], configs['replique_2']['PORT']), ('lecture2', '6432'))
+        self.assertEqual(repliques(postgresql, environ={}), {})
+
+    def test_valeurs_inconnues(self):
+        with self.assertRaises(ValueError):
+            base_de_donnees(Path('/tmp'), environ={'DB_PROFIL': 'staging'})
+        with self.assertRaises(ValueError):
+            base_de_donnees(Path('/tmp'), environ={'DB_MOTEUR': 'mysql'})
+
+
+class BenchmarkConnexionsTests(TransactionTestCase):
+    def test_modes_sqlite(self):
+        out = StringIO()
+        # Alias temporaire de la commande, inconnu du lanceur de tests
+        with mock.patch.object(type(self), 'databases', {'default', 'benchmark_connexions'}):
+            call_command('benchmark_connections', requetes=20, threads=2, ecritures=True, stdout=out, stderr=out)
+        lignes = {ligne.split('  ')[0]: ligne.split() for ligne in out.getvalue().splitlines()[1:]}
+        self.assertEqual(set(lignes), {'par requête', 'persistante', 'par requête + WAL', 'production'})
+        # Une connexion par requête, ou une par thread (+ création et suppression de la table)
+        self.assertEqual(lignes['par requête'][2:4], ['20', '22'])
+        self.assertEqual(lignes['persistante'][1:3], ['20', '4'])
+
+
+@override_settings(REPLIQUES=['replique_1'])
+class RepliquesTests(TransactionTestCase):
+    """Réplique SQLite copiée de la base de test, puis laissée en retard sur la primaire."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        config = repliques(settings.DATABASES['default'], environ={
+            'DB_REPLIQUES': os.path.join(dossier.name, 'replique.sqlite3'),
+        })
+        connections.settings.update(connections.configure_settings({
+            'default': settings.DATABASES['default'], **config,
+        }))
+        self.addCleanup(connections.settings.pop, 'replique_1')
+        self.addCleanup(connections.__delitem__, 'replique_1')
+        self.addCleanup(lambda: connections['replique_1'].close())
+        # Alias ajouté après le démarrage du lanceur de tests
+        patch = mock.patch.object(type(self), 'databases', {'default', 'replique_1'})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        categorie = Categorie.objects.create(nom="Répliquée", slug="repliquee")
+        self.produit, = creer_produits(categorie, 1)
+        self.admin = User.objects.create_superuser('admin-replique', password='x')
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        # Écriture que la réplique n'a pas encore reçue
+        Produit.objects.filter(pk=self.produit.pk).update(nom="Nouveau nom")
+        # Générations anciennes : le catalogue n'a pas été invalidé récemment
+        cache = catalogue_cache.get_cache()
+        cache.clear()
+        cache.set_many({
+            catalogue_cache._cle_generation(portee): 1
+            for portee in ('produits', 'categories', f'produit:{self.produit.slug}')
+        }, timeout=None)
+        self.addCleanup(cache.clear)
+
+    def nom_lu(self, client):
+        return client.get(f'/api/products/{self.produit.slug}/').data['nom']
+
+    def test_catalogue_lu_sur_replique(self):
+        self.assertEqual(self.nom_lu(APIClient()), self.produit.nom)
+
+    def test_primaire_apres_ecriture_du_client(self):
+        client = APIClient()
+        response = client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.produit.id, 'quantite': 1})
+        self.assertIn(COOKIE_PRIMAIRE, response.cookies)
+        self.assertEqual(self.nom_lu(client), "Nouveau nom")
+        # Les autres clients lisent toujours la réplique (hors réponse mise en cache)
+        catalogue_cache.get_cache().delete(catalogue_cache.cle_requete(
+            RequestFactory().get(f'/api/products/{self.produit.slug}/'),
+            ['categories', f'produit:{self.produit.slug}'],
+        ))
+        self.assertEqual(self.nom_lu(APIClient()), self.produit.nom)
+
+    def test_primaire_apres_ecriture_par_jeton(self):
+        # Clients sans cookie : l'écriture est mémorisée par utilisateur
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        client.post('/api/orders/panier/ajouter_produit/', {'produit_id': self.produit.id, 'quantite': 1})
+        client.cookies.clear()
+        self.assertEqual(self.nom_lu(client), "Nouveau nom")
+
+    def test_primaire_apres_invalidation(self):
+        catalogue_cache.invalider('produits', 'categories', f'produit:{self.produit.slug}')
+        self.assertEqual(self.nom_lu(APIClient()), "Nouveau nom")
+
+    def test_statistiques_sur_replique_panier_sur_primaire(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with CaptureQueriesContext(connections['replique_1']) as replique:
+            self.assertEqual(client.get('/api/orders/stats/orders/').status_code, 200)
+        self.assertGreater(len(replique), 0)
+
+        with CaptureQueriesContext(connections['replique_1']) as replique:
+            client.get('/api/orders/panier/')
+            client.get('/api/orders/commandes/')
+        self.assertEqual(len(replique), 0)
+
+
+class ExportCommandesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.a, self.b = creer_produits(categorie, 2)
+        self.commandes = Commande.objects.bulk_create([
+            Commande(nom_complet=f"Client {i}", email="client@exemple.com", telephone="0600000000",
+                     adresse="1 rue", ville="Paris", montant_total=Decimal('10.00'), statut=statut)
+            for i, statut in enumerate(['livree', 'en_attente', 'livree', 'annulee', 'livree'])
+        ])
+        DetailCommande.objects.bulk_create([
+            DetailCommande(commande=self.commandes[0], produit=self.a, prix=Decimal('4.00'), quantite=2),
+            DetailCommande(commande=self.commandes[0], produit=self.b, prix=Decimal('2.00'), quantite=1),
+            DetailCommande(commande=self.commandes[2], produit=self.b, prix=Decimal('2.00'), quantite=5),
+        ])
+        # Une commande par jour, du 1er au 5 mars
+        for jour, commande in enumerate(self.commandes, 1):
+            Commande.objects.filter(pk=commande.pk).update(
+                date_creation=timezone.make_aware(timezone.datetime(2026, 3, jour, 12))
+            )
+
+    def exporter(self, **params):
+        response = self.client.get('/api/orders/commandes/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_une_ligne_par_article(self):
+        lignes = list(csv.DictReader(StringIO(self.exporter())))
+        self.assertEqual([int(ligne['id']) for ligne in lignes], [self.commandes[0].id] * 2 + [c.id for c in self.commandes[1:]])
+        self.assertEqual(
+            [(ligne['produit'], ligne['quantite'], ligne['montant']) for ligne in lignes[:3]],
+            [(self.a.slug, '2', '8.00'), (self.b.slug, '1', '2.00'), ('', '', '')],
+        )
+
+    def test_jsonl_filtres(self):
+        contenu = self.exporter(type='jsonl', debut='2026-03-02', fin='2026-03-04', statut='livree')
+        commandes = [json.loads(ligne) for ligne in contenu.splitlines()]
+        self.assertEqual([commande['id'] for commande in commandes], [self.commandes[2].id])
+        self.assertEqual(commandes[0]['lignes'], [
+            {'produit': self.b.slug, 'produit_nom': self.b.nom, 'prix': '2.00', 'quantite': 5, 'montant': '10.00'},
+        ])
+
+        contenu = self.exporter(type='jsonl', statut=['en_attente', 'annulee'])
+        self.assertEqual(len(contenu.splitlines()), 2)
+
+    def test_parametres_invalides(self):
+        for params in ({'type': 'xml'}, {'debut': '03/2026'}, {'statut': 'perdue'}):
+            self.assertEqual(self.client.get('/api/orders/commandes/export/', params).status_code, 400)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('client'))
+        self.assertEqual(client.get('/api/orders/commandes/export/').status_code, 403)
+
+    def test_une_requete_de_lignes_par_lot(self):
+        # Commandes lues par un seul curseur, plus une requête de lignes par lot
+        with self.assertNumQueries(1 + 3):
+            morceaux = list(exports.exporter(exports.commandes(), 'jsonl', taille_lot=2))
+        self.assertEqual(len(morceaux), 3)
+
+    def test_commande(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'commandes.csv')
+            call_command('export_orders', chemin, '--statut', 'livree', '--debut', '2026-03-03', stderr=StringIO())
+            with open(chemin, newline='') as fichier:
+                lignes = list(csv.DictReader(fichier))
+        self.assertEqual([int(ligne['id']) for ligne in lignes], [self.commandes[2].id, self.commandes[4].id])
+
+
+class ChangementStatutTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True, is_superuser=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def creer(self, *statuts_commandes):
+        commandes = Commande.objects.bulk_create([
+            Commande(nom_complet=f"Client {i}", email="client@exemple.com", telephone="0600000000",
+                     adresse="1 rue", ville="Paris", montant_total=Decimal('10.00'), statut=statut)
+            for i, statut in enumerate(statuts_commandes)
+        ])
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        return commandes
+
+    def agregats(self):
+        return sorted(VentesJournalieres.objects.filter(nombre_commandes__gt=0).values_list(
+            'jour', 'statut', 'nombre_commandes', 'montant_total'
+        ))
+
+    def test_transitions_validees_et_historisees(self):
+        commandes = self.creer('en_attente', 'confirmee', 'en_traitement', 'expediee', 'livree', 'annulee')
+        modifiees, refusees = statuts.changer_statut(
+            Commande.objects.all(), 'expediee', auteur=self.admin, commentaire="Tournée du matin",
+        )
+        self.assertEqual((modifiees, refusees), (2, 3))
+        self.assertEqual(
+            list(Commande.objects.order_by('pk').values_list('statut', flat=True)),
+            ['en_attente', 'expediee', 'expediee', 'expediee', 'livree', 'annulee'],
+        )
+        self.assertEqual(
+            sorted(HistoriqueStatut.objects.values_list('commande_id', 'ancien_statut', 'nouveau_statut', 'auteur', 'commentaire')),
+            [(commandes[1].id, 'confirmee', 'expediee', self.admin.id, "Tournée du matin"),
+             (commandes[2].id, 'en_traitement', 'expediee', self.admin.id, "Tournée du matin")],
+        )
+        with self.assertRaises(ValueError):
+            statuts.changer_statut(Commande.objects.all(), 'inconnu')
+
+    def test_nombre_de_requetes_constant(self):
+        nombres = []
+        for taille in (5, 50):
+            Commande.objects.all().delete()
+            self.creer(*['en_attente'] * taille)
+            with CaptureQueriesContext(connection) as requetes:
+                self.assertEqual(statuts.changer_statut(Commande.objects.all(), 'confirmee'), (taille, 0))
+            nombres.append(len(requetes))
+        self.assertEqual(nombres[0], nombres[1])
+        self.assertEqual(HistoriqueStatut.objects.count(), 50)
+
+    def test_agregats_identiques_a_la_reconstruction(self):
+        self.creer('en_attente', 'en_attente', 'confirmee')
+        statuts.changer_statut(Commande.objects.all(), 'annulee')
+        incremental = self.agregats()
+        self.assertEqual(incremental, [(timezone.localdate(), 'annulee', 3, Decimal('30.00'))])
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.agregats(), incremental)
+
+    def test_api(self):
+        attente, annulee, confirmee = self.creer('en_attente', 'annulee', 'confirmee')
+        response = self.client.post(f'/api/orders/commandes/{attente.id}/confirm/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['statut'], 'confirmee')
+        self.assertEqual(attente.historique.get().auteur, self.admin)
+        self.assertEqual(self.client.post(f'/api/orders/commandes/{annulee.id}/confirm/').status_code, 400)
+
+        response = self.client.patch(f'/api/orders/commandes/{confirmee.id}/', {'statut': 'livree'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/api/orders/commandes/{confirmee.id}/', {'statut': 'expediee', 'notes': "Colis"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['statut'], 'expediee')
+        self.assertEqual(confirmee.historique.get().nouveau_statut, 'expediee')
+
+        response = self.client.post('/api/orders/commandes/statut/', {
+            'commandes': [attente.id, annulee.id, confirmee.id], 'statut': 'annulee',
+        }, format='json')
+        self.assertEqual(response.data, {'modifiees': 1, 'refusees': 1})
+        self.assertEqual(Commande.objects.get(pk=attente.pk).statut, 'annulee')
+
+    def test_action_admin(self):
+        attente, livree = self.creer('en_attente', 'livree')
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/orders/commande/', {
+            'action': 'annuler_commandes', '_selected_action': [attente.id, livree.id],
+        }, follow=True)
+        self.assertContains(response, '1 commandes ont été annulées.')
+        self.assertContains(response, '1 commandes ignorées')
+        self.assertEqual(attente.historique.get().auteur, self.admin)
+        self.assertEqual(Commande.objects.get(pk=livree.pk).statut, 'livree')
+        # Fiche de la commande, avec son historique
+        self.assertContains(self.client.get(f'/admin/orders/commande/{attente.id}/change/'), 'Annulée')
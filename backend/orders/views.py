@@ -1,25 +1,40 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from products.models import Produit
-from .models import Commande, DetailCommande, Panier, ArticlePanier
-from .serializers import CommandeSerializer, DetailCommandeSerializer, PanierSerializer, ArticlePanierSerializer
+from .models import (
+    Commande, DetailCommande, ArticlePanier,
+    VentesJournalieres, VentesProduitJournalieres, VentesClientJournalieres,
+)
+from .serializers import (
+    CommandeSerializer, DetailCommandeSerializer, PanierSerializer, ArticlePanierSerializer,
+    PanierDeltaSerializer, ChangementStatutSerializer,
+)
+from .stock import StockInsuffisant, reserver_stock, produits_en_rupture
+from .statistiques import Agregation
+from .paniers import PanierOccupe, stockage_pour
+from . import exports, rollups, statuts
+from nkcommerce.routeurs import LectureRepliqueMixin
 from django.utils import timezone
-from django.db.models import Count, Sum, Avg, F
-from datetime import timedelta
-import uuid
+from django.db.models import Sum, Q
+from datetime import date, timedelta
+from decimal import Decimal
 
 
-class CommandeViewSet(viewsets.ModelViewSet):
+class CommandeViewSet(LectureRepliqueMixin, viewsets.ModelViewSet):
     serializer_class = CommandeSerializer
+    # Agrégats lourds, tolérants au retard de réplication
+    actions_replique = ('statistics', 'sales_data', 'user_statistics')
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             permission_classes = [permissions.IsAuthenticated]
-        elif self.action in ['update', 'partial_update', 'destroy', 'confirm', 'statistics', 'sales_data', 'user_statistics']:
+        elif self.action in ['update', 'partial_update', 'destroy', 'confirm', 'changer_statut', 'statistics', 'sales_data', 'user_statistics', 'exporter']:
             permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.AllowAny]
@@ -28,9 +43,10 @@ class CommandeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated:
+            queryset = CommandeSerializer.setup_eager_loading(Commande.objects.all())
             if user.is_staff:
-                return Commande.objects.all()
-            return Commande.objects.filter(client=user)
+                return queryset
+            return queryset.filter(client=user)
         return Commande.objects.none()
     
     @action(detail=True, methods=['post'])
@@ -39,33 +55,114 @@ class CommandeViewSet(viewsets.ModelViewSet):
         Confirm an order (admin only)
         """
         commande = self.get_object()
-        commande.statut = 'confirmee'
-        commande.save()
+        self.appliquer_statut(commande, 'confirmee')
         serializer = self.get_serializer(commande)
         return Response(serializer.data)
     
+    def appliquer_statut(self, commande, statut):
+        _, refusees = statuts.changer_statut(
+            Commande.objects.filter(pk=commande.pk), statut, auteur=self.request.user,
+        )
+        if refusees:
+            raise ValidationError({'statut': statuts.message_refus(commande.statut, statut)})
+        commande.statut = statut
+    
+    def perform_update(self, serializer):
+        # Statut validé par le serializer, changé (et historisé) par le service
+        statut = serializer.validated_data.pop('statut', None)
+        with transaction.atomic():
+            commande = serializer.save()
+            if statut and statut != commande.statut:
+                self.appliquer_statut(commande, statut)
+    
+    @action(detail=False, methods=['post'], url_path='statut')
+    def changer_statut(self, request):
+        """
+        Change le statut d'un lot de commandes (admin) :
+        `{"commandes": [ids], "statut": ..., "commentaire": ...}`.
+        Les commandes dont le statut ne permet pas la transition sont ignorées.
+        """
+        serializer = ChangementStatutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        donnees = serializer.validated_data
+        modifiees, refusees = statuts.changer_statut(
+            Commande.objects.filter(pk__in=donnees['commandes']), donnees['statut'],
+            auteur=request.user, commentaire=donnees['commentaire'],
+        )
+        return Response({'modifiees': modifiees, 'refusees': refusees})
+    
+    @action(detail=False, methods=['get'], url_path='export')
+    def exporter(self, request):
+        """
+        Export en flux des commandes et de leurs lignes (admin only) :
+        `type` (csv ou jsonl), `debut` et `fin` (AAAA-MM-JJ, inclusifs),
+        `statut` (répétable)
+        """
+        params = request.query_params
+        format = params.get('type', 'csv')
+        if format not in exports.FORMATS:
+            raise ValidationError({'type': f"Format attendu : {', '.join(exports.FORMATS)}"})
+        try:
+            debut = date.fromisoformat(params['debut']) if params.get('debut') else None
+            fin = date.fromisoformat(params['fin']) if params.get('fin') else None
+        except ValueError:
+            raise ValidationError({'detail': 'Les dates doivent être au format AAAA-MM-JJ'})
+        statuts_filtres = params.getlist('statut')
+        if set(statuts_filtres) - set(exports.STATUTS):
+            raise ValidationError({'statut': f"Statuts possibles : {', '.join(exports.STATUTS)}"})
+        
+        commandes = exports.commandes(debut, fin, statuts_filtres)
+        response = StreamingHttpResponse(
+            exports.exporter(commandes, format),
+            content_type='text/csv; charset=utf-8' if format == 'csv' else 'application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="commandes.{format}"'
+        return response
+    
+    def get_periode(self):
+        """
+        Période des statistiques « récentes » : paramètres `debut` et `fin`
+        (AAAA-MM-JJ, inclusifs), par défaut les 30 derniers jours.
+        """
+        params = self.request.query_params
+        try:
+            fin = date.fromisoformat(params['fin']) if params.get('fin') else timezone.localdate()
+            debut = date.fromisoformat(params['debut']) if params.get('debut') else fin - timedelta(days=29)
+        except ValueError:
+            raise ValidationError({'detail': 'Les dates doivent être au format AAAA-MM-JJ'})
+        if debut > fin:
+            raise ValidationError({'detail': 'La date de début doit précéder la date de fin'})
+        return debut, fin
+    
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """
         Get order statistics (admin only)
         """
-        total_orders = Commande.objects.count()
-        pending_orders = Commande.objects.filter(statut='en_attente').count()
-        confirmed_orders = Commande.objects.filter(statut='confirmee').count()
+        debut, fin = self.get_periode()
         
-        # Orders by status
-        status_counts = Commande.objects.values('statut').annotate(count=Count('id'))
+        # Toutes les métriques en une seule requête d'agrégats conditionnels
+        stats = Agregation(VentesJournalieres.objects.all())
+        stats.somme('total_orders', 'nombre_commandes')
+        stats.somme('recent_orders', 'nombre_commandes', jour__range=(debut, fin))
+        for statut, _ in Commande.STATUT_CHOICES:
+            stats.somme(statut, 'nombre_commandes', statut=statut)
+        resultats = stats.calculer()
         
-        # Recent orders (last 30 days)
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_orders = Commande.objects.filter(date_creation__gte=thirty_days_ago).count()
+        # Orders by status
+        status_counts = [
+            {'statut': statut, 'count': resultats[statut]}
+            for statut, _ in Commande.STATUT_CHOICES
+            if resultats[statut] > 0
+        ]
         
         return Response({
-            'total_orders': total_orders,
-            'pending_orders': pending_orders,
-            'confirmed_orders': confirmed_orders,
+            'total_orders': resultats['total_orders'],
+            'pending_orders': resultats['en_attente'],
+            'confirmed_orders': resultats['confirmee'],
             'status_distribution': status_counts,
-            'recent_orders': recent_orders
+            'recent_orders': resultats['recent_orders'],
+            'periode': {'debut': debut, 'fin': fin},
         })
     
     @action(detail=False, methods=['get'])
@@ -73,31 +170,35 @@ class CommandeViewSet(viewsets.ModelViewSet):
         """
         Get sales statistics (admin only)
         """
-        # Total sales
-        total_sales = Commande.objects.aggregate(total=Sum('montant_total'))
+        debut, fin = self.get_periode()
         
-        # Sales by period
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_sales = Commande.objects.filter(date_creation__gte=thirty_days_ago).aggregate(total=Sum('montant_total'))
+        stats = Agregation(VentesJournalieres.objects.all())
+        stats.somme('total', 'montant_total', defaut=None)
+        stats.somme('nombre', 'nombre_commandes')
+        stats.somme('recent', 'montant_total', defaut=None, jour__range=(debut, fin))
+        resultats = stats.calculer()
         
         # Average order value
-        avg_order_value = Commande.objects.aggregate(avg=Avg('montant_total'))
+        avg = (resultats['total'] / resultats['nombre']).quantize(Decimal('0.01')) if resultats['nombre'] else None
         
-        # Top selling products (last 30 days)
-        top_products = DetailCommande.objects.filter(
-            commande__date_creation__gte=thirty_days_ago
+        # Top selling products in the requested period
+        top_products = VentesProduitJournalieres.objects.filter(
+            jour__range=(debut, fin)
         ).values(
             'produit__id', 'produit__nom'
         ).annotate(
             total_quantity=Sum('quantite'),
-            total_sales=Sum(F('prix') * F('quantite'))
-        ).order_by('-total_quantity')[:5]
+            total_sales=Sum('montant_total')
+        ).filter(total_quantity__gt=0).order_by('-total_quantity')[:5]
+        # Évalué dans la vue, donc sur la réplique, et non au rendu de la réponse
+        top_products = list(top_products)
         
         return Response({
-            'total_sales': total_sales,
-            'recent_sales': recent_sales,
-            'average_order_value': avg_order_value,
-            'top_products': top_products
+            'total_sales': {'total': resultats['total']},
+            'recent_sales': {'total': resultats['recent']},
+            'average_order_value': {'avg': avg},
+            'top_products': top_products,
+            'periode': {'debut': debut, 'fin': fin},
         })
     
     @action(detail=False, methods=['get'])
@@ -105,30 +206,35 @@ class CommandeViewSet(viewsets.ModelViewSet):
         """
         Get user statistics (admin only)
         """
-        total_users = Commande.objects.values('client').distinct().count()
-        repeat_customers = Commande.objects.values('client').annotate(
-            order_count=Count('id')
-        ).filter(order_count__gt=1).count()
+        debut, fin = self.get_periode()
+        ventes = VentesClientJournalieres.objects.filter(nombre_commandes__gt=0)
         
-        # New users in the last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        new_customers = Commande.objects.filter(
-            date_creation__gte=thirty_days_ago
-        ).values('client').distinct().count()
+        # Une ligne par client, puis les compteurs calculés sur ce regroupement
+        par_client = ventes.values('client').annotate(
+            order_count=Sum('nombre_commandes'),
+            recent_count=Sum('nombre_commandes', filter=Q(jour__range=(debut, fin))),
+        ).order_by()
+        stats = Agregation(par_client)
+        stats.compte('total_customers')
+        stats.compte('repeat_customers', 'order_count', order_count__gt=1)
+        stats.compte('new_customers', 'order_count', recent_count__gt=0)
+        resultats = stats.calculer()
         
         # Top customers
-        top_customers = Commande.objects.values(
+        top_customers = ventes.values(
             'client__username', 'nom_complet', 'email'
         ).annotate(
-            order_count=Count('id'),
+            order_count=Sum('nombre_commandes'),
             total_spent=Sum('montant_total')
         ).order_by('-total_spent')[:5]
+        top_customers = list(top_customers)
         
         return Response({
-            'total_customers': total_users,
-            'repeat_customers': repeat_customers,
-            'new_customers': new_customers,
-            'top_customers': top_customers
+            'total_customers': resultats['total_customers'],
+            'repeat_customers': resultats['repeat_customers'],
+            'new_customers': resultats['new_customers'],
+            'top_customers': top_customers,
+            'periode': {'debut': debut, 'fin': fin},
         })
 
 
@@ -140,26 +246,51 @@ class PanierViewSet(viewsets.GenericViewSet):
         return [permission() for permission in permission_classes]
     
     def get_object(self):
-        request = self.request
-        
-        # For authenticated users, get or create their cart
-        if request.user.is_authenticated:
-            panier, created = Panier.objects.get_or_create(client=request.user)
-            return panier
-        
-        # For anonymous users, get or create a cart based on session ID
-        session_id = request.session.get('cart_session_id')
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            request.session['cart_session_id'] = session_id
-        
-        panier, created = Panier.objects.get_or_create(session_id=session_id)
-        return panier
+        self.stockage = stockage_pour(self.request)
+        self.panier = self.stockage.obtenir(self.request)
+        return self.panier
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, PanierOccupe):
+            response = Response(
+                {'detail': 'Panier en cours de modification, réessayez'}, status=status.HTTP_409_CONFLICT,
+            )
+            response['Retry-After'] = '1'
+            return response
+        return super().handle_exception(exc)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, 'panier', None) is not None:
+            self.stockage.finaliser(request, response, self.panier)
+        return super().finalize_response(request, response, *args, **kwargs)
+    
+    def mode_delta(self):
+        # `format` est réservé par DRF à la négociation du rendu
+        return self.request.query_params.get('mode') == 'delta'
+    
+    def reponse_panier(self, panier, modifies=(), supprimes=()):
+        """
+        Réponse d'une mutation : le panier complet, ou avec `?mode=delta`
+        uniquement les lignes modifiées, les ids supprimés et les totaux.
+        La version du panier est renvoyée dans l'en-tête ETag.
+        """
+        if self.mode_delta():
+            serializer = PanierDeltaSerializer(
+                self.stockage.preparer(panier, complet=False),
+                context={'modifies': modifies, 'supprimes': supprimes},
+            )
+        else:
+            serializer = PanierSerializer(self.stockage.preparer(panier))
+        response = Response(serializer.data)
+        response['ETag'] = panier.etag
+        return response
     
     def list(self, request):
         panier = self.get_object()
-        serializer = self.get_serializer(panier)
-        return Response(serializer.data)
+        serializer = self.get_serializer(self.stockage.preparer(panier))
+        response = Response(serializer.data)
+        response['ETag'] = panier.etag
+        return response
     
     @action(detail=False, methods=['post'])
     def ajouter_produit(self, request):
@@ -178,18 +309,8 @@ class PanierViewSet(viewsets.GenericViewSet):
         if not produit.disponible or produit.stock < quantite:
             return Response({'detail': 'Produit non disponible en stock'}, status=status.HTTP_400_BAD_REQUEST)
         
-        article, created = ArticlePanier.objects.get_or_create(
-            panier=panier,
-            produit=produit,
-            defaults={'quantite': quantite}
-        )
-        
-        if not created:
-            article.quantite += quantite
-            article.save()
-        
-        serializer = PanierSerializer(panier)
-        return Response(serializer.data)
+        article = self.stockage.ajouter(panier, produit, quantite)
+        return self.reponse_panier(panier, modifies=[article])
     
     @action(detail=False, methods=['post'])
     def modifier_quantite(self, request):
@@ -201,18 +322,15 @@ class PanierViewSet(viewsets.GenericViewSet):
             return Response({'detail': 'Article ID est requis'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            article = ArticlePanier.objects.get(id=article_id, panier=panier)
+            article = self.stockage.ligne(panier, article_id)
         except ArticlePanier.DoesNotExist:
             return Response({'detail': 'Article non trouvé'}, status=status.HTTP_404_NOT_FOUND)
         
-        if quantite <= 0:
-            article.delete()
-        else:
-            article.quantite = quantite
-            article.save()
+        self.stockage.modifier(panier, article, quantite)
         
-        serializer = PanierSerializer(panier)
-        return Response(serializer.data)
+        if quantite > 0:
+            return self.reponse_panier(panier, modifies=[article])
+        return self.reponse_panier(panier, supprimes=[int(article_id)])
     
     @action(detail=False, methods=['post'])
     def supprimer_article(self, request):
@@ -223,27 +341,26 @@ class PanierViewSet(viewsets.GenericViewSet):
             return Response({'detail': 'Article ID est requis'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            article = ArticlePanier.objects.get(id=article_id, panier=panier)
-            article.delete()
+            article = self.stockage.ligne(panier, article_id)
         except ArticlePanier.DoesNotExist:
             return Response({'detail': 'Article non trouvé'}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = PanierSerializer(panier)
-        return Response(serializer.data)
+        self.stockage.supprimer(panier, article)
+        return self.reponse_panier(panier, supprimes=[int(article_id)])
     
     @action(detail=False, methods=['post'])
     def vider(self, request):
         panier = self.get_object()
-        ArticlePanier.objects.filter(panier=panier).delete()
-        serializer = PanierSerializer(panier)
-        return Response(serializer.data)
+        supprimes = self.stockage.vider(panier)
+        return self.reponse_panier(panier, supprimes=supprimes)
     
     @action(detail=False, methods=['post'])
     def convertir_en_commande(self, request):
         panier = self.get_object()
-        articles = ArticlePanier.objects.filter(panier=panier)
+        # Une seule requête pour les lignes et leurs produits
+        articles = self.stockage.lignes(panier)
         
-        if not articles.exists():
+        if not articles:
             return Response({'detail': 'Le panier est vide'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Vérifier que les données requises sont fournies
@@ -255,36 +372,44 @@ class PanierViewSet(viewsets.GenericViewSet):
         # Calculer le montant total
         montant_total = sum(article.montant_total for article in articles)
         
-        with transaction.atomic():
-            # Créer la commande (lier au client si authentifié)
-            client = request.user if request.user.is_authenticated else None
-            
-            commande = Commande.objects.create(
-                client=client,
-                nom_complet=request.data.get('nom_complet'),
-                email=request.data.get('email'),
-                telephone=request.data.get('telephone'),
-                adresse=request.data.get('adresse'),
-                ville=request.data.get('ville'),
-                notes=request.data.get('notes', ''),
-                montant_total=montant_total
-            )
-            
-            # Créer les détails de commande
-            for article in articles:
-                DetailCommande.objects.create(
-                    commande=commande,
-                    produit=article.produit,
-                    prix=article.produit.prix,
-                    quantite=article.quantite
+        try:
+            with transaction.atomic():
+                # Réserver le stock de toutes les lignes ; annule tout si une ligne est en rupture
+                reserver_stock((article.produit_id, article.quantite) for article in articles)
+                
+                # Créer la commande (lier au client si authentifié)
+                client = request.user if request.user.is_authenticated else None
+                
+                commande = Commande.objects.create(
+                    client=client,
+                    nom_complet=request.data.get('nom_complet'),
+                    email=request.data.get('email'),
+                    telephone=request.data.get('telephone'),
+                    adresse=request.data.get('adresse'),
+                    ville=request.data.get('ville'),
+                    notes=request.data.get('notes', ''),
+                    montant_total=montant_total
                 )
                 
-                # Mettre à jour le stock
-                produit = article.produit
-                produit.stock -= article.quantite
-                produit.save()
-            
-            # Vider le panier
-            articles.delete()
+                # Créer les détails de commande en une insertion groupée
+                details = DetailCommande.objects.bulk_create([
+                    DetailCommande(
+                        commande=commande,
+                        produit=article.produit,
+                        prix=article.produit.prix,
+                        quantite=article.quantite
+                    )
+                    for article in articles
+                ])
+                # bulk_create n'émet pas de signal : alimenter les ventes par produit
+                rollups.enregistrer_details(commande, details)
+                
+                # Vider le panier (seulement les lignes commandées)
+                self.stockage.retirer_commandees(panier, articles)
+        except StockInsuffisant as e:
+            return Response({
+                'detail': 'Stock insuffisant pour certains produits',
+                'produits': produits_en_rupture(e.quantites),
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({'id_commande': commande.id}, status=status.HTTP_201_CREATED)
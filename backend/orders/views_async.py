@@ -0,0 +1,52 @@
+"""
+Variante async de la lecture du panier (`GET /api/orders/panier/`).
+
+Routée sous ASGI par `nkcommerce.middleware.vues_async_middleware`, comme
+les lectures de `products/views_async.py`. L'utilisateur est résolu sans
+bloquer (jeton DRF ou session), puis le panier est lu par les méthodes
+async du backend de stockage (`aobtenir`, `apreparer`). Les autres
+requêtes sont confiées à `PanierViewSet`.
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+
+from products.cache import reponse_json
+from products.views_async import prise_en_charge
+from .paniers import stockage_pour
+from .serializers import PanierSerializer
+from .views import PanierViewSet
+
+panier_drf = PanierViewSet.as_view({'get': 'list'})
+
+
+async def resoudre_utilisateur(request):
+    """
+    Utilisateur de la requête selon les authentifications de DRF (jeton puis
+    session), ou None si DRF doit répondre lui-même (jeton invalide).
+    """
+    en_tete = request.headers.get('Authorization', '').split()
+    if not en_tete or en_tete[0].lower() != 'token':
+        return await request.auser()
+    if len(en_tete) != 2:
+        return None
+    jeton = await Token.objects.select_related('user').filter(key=en_tete[1]).afirst()
+    if jeton is None or not jeton.user.is_active:
+        return None
+    return jeton.user
+
+
+@csrf_exempt
+async def panier(request):
+    # `?mode=delta` ne concerne que les mutations : ignoré en lecture, comme côté DRF
+    utilisateur = await resoudre_utilisateur(request) if prise_en_charge(request, parametres=True) else None
+    if utilisateur is None:
+        return await sync_to_async(panier_drf)(request)
+    request.user = utilisateur
+
+    stockage = stockage_pour(request)
+    instance = await stockage.apreparer(await stockage.aobtenir(request))
+    response = reponse_json(PanierSerializer(instance, context={'request': request}).data)
+    response['ETag'] = instance.etag
+    stockage.finaliser(request, response, instance)
+    return response
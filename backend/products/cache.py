@@ -0,0 +1,205 @@
+"""
+Cache de lecture du catalogue.
+
+Les réponses publiques du catalogue sont mises en cache sous une clé qui
+combine l'URL normalisée et les générations des « portées » dont elles
+dépendent (`produits`, `categories`, `categorie:<id>`, `produit:<slug>`).
+Les signaux des modèles incrémentent uniquement les générations concernées :
+les anciennes entrées ne sont plus jamais lues et expirent d'elles-mêmes.
+
+Une génération est l'horodatage (en nanosecondes) de la dernière
+invalidation de sa portée, au moins une seconde après toute génération
+précédente du catalogue. Les réponses portent donc, sans requête en base,
+un ETag (empreinte de l'URL et des générations) et un Last-Modified (la plus
+récente des générations) : une requête conditionnelle à jour reçoit un 304
+avant toute lecture du cache ou sérialisation, et `Cache-Control: public`
+permet à un CDN ou un proxy inverse d'absorber les lectures répétées.
+
+Le backend est celui de l'alias `catalogue` de `CACHES` (mémoire locale,
+fichiers ou Redis selon la configuration).
+
+Juste après une invalidation, les réponses sont construites depuis la base
+primaire même dans une vue lue sur réplique : une réplique en retard
+remettrait l'ancien contenu en cache sous la nouvelle génération.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from nkcommerce.routeurs import primaire_si_recent
+
+ALIAS = 'catalogue'
+PREFIXE = 'catalogue'
+HORLOGE = f'{PREFIXE}:horloge'
+
+
+def get_cache():
+    return caches[ALIAS]
+
+
+def _cle_generation(portee):
+    return f'{PREFIXE}:gen:{portee}'
+
+
+def _prochaine_generation(precedentes):
+    """
+    Génération d'une invalidation : l'instant présent, mais au moins une
+    seconde après les `precedentes` et après l'horloge du catalogue (la
+    dernière génération attribuée, toutes portées confondues). Last-Modified
+    étant à la seconde, il change ainsi à chaque invalidation, même deux fois
+    dans la même seconde ; une rafale d'invalidations fait prendre de
+    l'avance aux générations, rattrapée ensuite par l'horloge réelle.
+    """
+    return max([time.time_ns(), *(valeur + 1_000_000_000 for valeur in precedentes)])
+
+
+def generations(portees):
+    """Retourne la génération courante de chaque portée, en initialisant les absentes."""
+    cache = get_cache()
+    cles = [_cle_generation(portee) for portee in portees]
+    valeurs = cache.get_many([*cles, HORLOGE])
+    manquantes = [cle for cle in cles if cle not in valeurs]
+    if manquantes:
+        # Génération évincée ou jamais posée : traitée comme une invalidation
+        generation = _prochaine_generation([valeurs.get(HORLOGE, 0)])
+        cache.set(HORLOGE, generation, timeout=None)
+        for cle in manquantes:
+            cache.add(cle, generation, timeout=None)
+            valeurs[cle] = cache.get(cle)
+    return [valeurs[cle] for cle in cles]
+
+
+async def agenerations(portees):
+    """Variante async de `generations`."""
+    cache = get_cache()
+    cles = [_cle_generation(portee) for portee in portees]
+    valeurs = await cache.aget_many([*cles, HORLOGE])
+    manquantes = [cle for cle in cles if cle not in valeurs]
+    if manquantes:
+        generation = _prochaine_generation([valeurs.get(HORLOGE, 0)])
+        await cache.aset(HORLOGE, generation, timeout=None)
+        for cle in manquantes:
+            await cache.aadd(cle, generation, timeout=None)
+            valeurs[cle] = await cache.aget(cle)
+    return [valeurs[cle] for cle in cles]
+
+
+def invalider(*portees):
+    """Fait avancer la génération des portées données (voir `_prochaine_generation`)."""
+    cache = get_cache()
+    cles = [_cle_generation(portee) for portee in portees]
+    # Toujours strictement croissante, même si l'horloge recule
+    generation = _prochaine_generation(cache.get_many([*cles, HORLOGE]).values())
+    cache.set_many({cle: generation for cle in [*cles, HORLOGE]}, timeout=None)
+
+
+def invalider_produits(produit_ids):
+    """
+    Invalide les portées de produits modifiés sans passer par `save()`
+    (par exemple par `QuerySet.update`), qui n'émet pas de signal.
+    """
+    from .models import Produit
+
+    portees = {'produits'}
+    for slug, categorie_id in Produit.objects.filter(id__in=list(produit_ids)).values_list('slug', 'categorie_id'):
+        portees.update((f'produit:{slug}', f'categorie:{categorie_id}'))
+    invalider(*portees)
+
+
+def _empreinte(request, portees, valeurs):
+    # `GET` plutôt que `query_params` : aussi valable pour une HttpRequest (vues async)
+    params = sorted(
+        (cle, valeur)
+        for cle in request.GET
+        for valeur in sorted(request.GET.getlist(cle))
+    )
+    brut = repr((
+        request.get_host(),
+        request.path,
+        params,
+        list(zip(portees, valeurs)),
+    ))
+    return hashlib.sha256(brut.encode()).hexdigest()
+
+
+def cle_requete(request, portees):
+    return _validateurs(request, portees, generations(portees))[0]
+
+
+def _en_tetes_http(response, etag, derniere_modification):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(derniere_modification)
+    patch_cache_control(response, public=True, max_age=settings.CATALOGUE_HTTP_MAX_AGE)
+    # Même contenu pour tous les visiteurs : seul le format négocié varie
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _validateurs(request, portees, valeurs):
+    """(clé du cache de réponses, ETag, Last-Modified) d'une requête."""
+    empreinte = _empreinte(request, portees, valeurs)
+    # ETag faible : le rendu (JSON, API navigable) dépend de l'en-tête Accept
+    etag = f'W/"{empreinte[:32]}"'
+    return f'{PREFIXE}:reponse:{empreinte}', etag, max(valeurs) // 1_000_000_000
+
+
+def reponse_en_cache(request, portees, construire):
+    """
+    Retourne 304 si la copie du client est à jour, sinon la réponse en cache
+    pour cette requête, ou appelle `construire` et met en cache ses données
+    si elle réussit.
+    """
+    valeurs = generations(portees)
+    cle, etag, derniere_modification = _validateurs(request, portees, valeurs)
+    non_modifiee = get_conditional_response(request, etag=etag, last_modified=derniere_modification)
+    if non_modifiee is not None:
+        return _en_tetes_http(non_modifiee, etag, derniere_modification)
+
+    cache = get_cache()
+    data = cache.get(cle)
+    if data is not None:
+        return _en_tetes_http(Response(data), etag, derniere_modification)
+
+    with primaire_si_recent(max(valeurs) / 1e9):
+        response = construire()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(cle, response.data, timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+        _en_tetes_http(response, etag, derniere_modification)
+    return response
+
+
+async def areponse_en_cache(request, portees, construire):
+    """
+    Variante async de `reponse_en_cache` pour les vues Django natives :
+    `construire` est une coroutine qui retourne les données à sérialiser en
+    JSON. Les entrées du cache sont partagées avec les vues DRF.
+    """
+    valeurs = await agenerations(portees)
+    cle, etag, derniere_modification = _validateurs(request, portees, valeurs)
+    non_modifiee = get_conditional_response(request, etag=etag, last_modified=derniere_modification)
+    if non_modifiee is not None:
+        return _en_tetes_http(non_modifiee, etag, derniere_modification)
+
+    cache = get_cache()
+    data = await cache.aget(cle)
+    if data is None:
+        with primaire_si_recent(max(valeurs) / 1e9):
+            data = await construire()
+        await cache.aset(cle, data, timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+    return _en_tetes_http(reponse_json(data), etag, derniere_modification)
+
+
+def reponse_json(data, **kwargs):
+    """JSON identique à celui du `JSONRenderer` de DRF."""
+    return JsonResponse(
+        data, encoder=JSONEncoder, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')}, **kwargs
+    )
@@ -0,0 +1,142 @@
+"""
+Déclinaisons des images téléversées (miniature, carte, zoom) en WebP et JPEG.
+
+Pour un original `produits/flacon.jpg`, les déclinaisons sont enregistrées
+dans le même stockage sous `derives/produits/flacon/<taille>.<format>`.
+Leur chemin se déduit du nom de l'original : les serializers exposent les
+URL sans requête ni accès disque.
+
+Après un téléversement, la génération est confiée à un pool de threads
+(`IMAGES_WORKERS`, 0 pour générer dans la requête) une fois la transaction
+validée. La commande `generate_image_derivatives` traite les médias
+existants en parallèle sur plusieurs processus.
+"""
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Boîte englobante (largeur, hauteur) de chaque déclinaison ; jamais d'agrandissement
+TAILLES = {
+    'miniature': (200, 200),
+    'carte': (600, 600),
+    'zoom': (1600, 1600),
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+PREFIXE = 'derives'
+
+_pool = None
+
+
+def chemin_derive(nom, taille, extension):
+    racine, _ = posixpath.splitext(nom)
+    return posixpath.join(PREFIXE, racine, f'{taille}.{extension}')
+
+
+def urls_derives(fichier, request=None):
+    """URL des déclinaisons d'un `FieldFile` : `{taille: {format: url}}`, ou None sans fichier."""
+    if not fichier:
+        return None
+    urls = {}
+    for taille in TAILLES:
+        urls[taille] = {}
+        for extension in FORMATS:
+            url = fichier.storage.url(chemin_derive(fichier.name, taille, extension))
+            urls[taille][extension] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def generer_derives(nom, storage=None, forcer=False):
+    """
+    Crée les déclinaisons de l'original `nom`. Sans `forcer`, ne fait rien si
+    elles existent déjà. Retourne le nombre de fichiers écrits.
+    """
+    storage = storage or default_storage
+    if not forcer and storage.exists(chemin_derive(nom, 'miniature', 'webp')):
+        return 0
+
+    with storage.open(nom, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+
+    ecrits = 0
+    for taille, boite in TAILLES.items():
+        declinaison = image.copy()
+        declinaison.thumbnail(boite, Image.Resampling.LANCZOS)
+        for extension, options in FORMATS.items():
+            if extension == 'jpeg' and declinaison.mode not in ('RGB', 'L'):
+                # Le JPEG n'a pas de transparence : fond blanc
+                fond = Image.new('RGB', declinaison.size, 'white')
+                fond.paste(declinaison, mask=declinaison.convert('RGBA').getchannel('A'))
+                a_ecrire = fond
+            else:
+                a_ecrire = declinaison
+            tampon = BytesIO()
+            a_ecrire.save(tampon, **options)
+            chemin = chemin_derive(nom, taille, extension)
+            if storage.exists(chemin):
+                storage.delete(chemin)
+            storage.save(chemin, ContentFile(tampon.getvalue()))
+            ecrits += 1
+    return ecrits
+
+
+def supprimer_derives(nom, storage=None):
+    """Supprime les déclinaisons de l'original `nom`. Retourne (fichiers, octets) libérés."""
+    storage = storage or default_storage
+    dossier = posixpath.dirname(chemin_derive(nom, 'miniature', 'webp'))
+    try:
+        _, fichiers = storage.listdir(dossier)
+    except FileNotFoundError:
+        return 0, 0
+    octets = 0
+    for fichier in fichiers:
+        chemin = posixpath.join(dossier, fichier)
+        octets += storage.size(chemin)
+        storage.delete(chemin)
+    try:
+        os.rmdir(storage.path(dossier))
+    except (NotImplementedError, OSError):
+        pass
+    return len(fichiers), octets
+
+
+def _generer(nom, storage):
+    try:
+        generer_derives(nom, storage)
+    except Exception:
+        logger.exception("Échec de la génération des déclinaisons de %s", nom)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.IMAGES_WORKERS, thread_name_prefix='images')
+    return _pool
+
+
+def planifier(fichier):
+    """Génère les déclinaisons d'un `FieldFile` après validation de la transaction en cours."""
+    if not fichier:
+        return
+    nom, storage = fichier.name, fichier.storage
+
+    def soumettre():
+        if settings.IMAGES_WORKERS:
+            get_pool().submit(_generer, nom, storage)
+        else:
+            _generer(nom, storage)
+
+    transaction.on_commit(soumettre)
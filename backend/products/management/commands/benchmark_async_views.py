@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import statistics
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+
+from products.models import Categorie, Produit
+
+HOTE = 'benchmark.local'
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit et la latence (p50, p99) des lectures du catalogue et du panier "
+            "sous WSGI (vues DRF), sous ASGI avec les vues DRF et sous ASGI avec les vues async, "
+            "avec plusieurs clients concurrents. Les applications sont appelées en mémoire, sans "
+            "serveur HTTP : seul le coût de Django est mesuré.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=32,
+                            help="Nombre de clients concurrents (défaut : 32)")
+        parser.add_argument('--requetes', type=int, default=2000,
+                            help="Nombre de requêtes par mode (défaut : 2000)")
+        parser.add_argument('--produits', type=int, default=100,
+                            help="Produits créés pour la mesure, supprimés à la fin (défaut : 100)")
+        parser.add_argument('--sans-cache', action='store_true',
+                            help="Désactiver le cache du catalogue : chaque lecture passe par la base")
+
+    def handle(self, *args, **options):
+        # Pas de transaction annulée ici : les clients WSGI ont chacun leur connexion
+        jeton = uuid.uuid4().hex[:8]
+        categorie = Categorie.objects.create(nom=f"Benchmark {jeton}", slug=f"benchmark-{jeton}")
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f"Benchmark {i}", slug=f"benchmark-{jeton}-{i}", categorie=categorie,
+                    description="", prix=Decimal('10.00'), stock=10)
+            for i in range(max(options['produits'], 1))
+        ])
+        client = User.objects.create_user(f'benchmark-{jeton}')
+        token = Token.objects.create(user=client)
+        try:
+            self.chemins = [
+                '/api/products/',
+                f'/api/products/{produits[0].slug}/',
+                f'/api/products/categories/{categorie.slug}/produits/',
+                '/api/orders/panier/',
+            ]
+            self.autorisation = f'Token {token.key}'
+            reglages = {'ALLOWED_HOSTS': [HOTE]}
+            if options['sans_cache']:
+                reglages['CATALOGUE_CACHE_TIMEOUT'] = 0
+
+            self.stdout.write(
+                f"{'mode':<12} {'requêtes':>9} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'erreurs':>8}"
+            )
+            with override_settings(**reglages):
+                for mode, mesurer, vues_async in (
+                    ('wsgi', self.mesurer_wsgi, False),
+                    ('asgi', self.mesurer_asgi, False),
+                    ('asgi-async', self.mesurer_asgi, True),
+                ):
+                    with override_settings(VUES_ASYNC=vues_async):
+                        mesurer(options['clients'], min(options['requetes'], 4 * len(self.chemins)))  # chauffe
+                        self.afficher(mode, *mesurer(options['clients'], options['requetes']))
+        finally:
+            client.delete()
+            categorie.delete()
+
+    def afficher(self, mode, duree, latences, erreurs):
+        latences = sorted(latences)
+        p99 = latences[min(len(latences) - 1, int(len(latences) * 0.99))]
+        self.stdout.write(
+            f"{mode:<12} {len(latences):>9} {len(latences) / duree:>9.0f} "
+            f"{statistics.median(latences) * 1000:>9.2f} {p99 * 1000:>9.2f} {erreurs:>8}"
+        )
+
+    def mesurer_wsgi(self, clients, requetes):
+        application = WSGIHandler()
+        compteur = itertools.count()
+        latences, erreurs = [], []
+
+        def start_response(statut, en_tetes):
+            if not statut.startswith('200'):
+                erreurs.append(statut)
+
+        def client():
+            while (i := next(compteur)) < requetes:
+                environ = RequestFactory().get(
+                    self.chemins[i % len(self.chemins)], HTTP_HOST=HOTE, HTTP_AUTHORIZATION=self.autorisation,
+                ).environ
+                debut = time.perf_counter()
+                corps = application(environ, start_response)
+                b''.join(corps)
+                corps.close()
+                latences.append(time.perf_counter() - debut)
+
+        debut = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - debut, latences, len(erreurs)
+
+    def mesurer_asgi(self, clients, requetes):
+        return asyncio.run(self._mesurer_asgi(clients, requetes))
+
+    async def _mesurer_asgi(self, clients, requetes):
+        application = ASGIHandler()
+        compteur = itertools.count()
+        latences, erreurs = [], []
+
+        async def requete(chemin):
+            recu = False
+
+            async def receive():
+                nonlocal recu
+                if not recu:
+                    recu = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait()  # jamais de déconnexion
+
+            async def send(message):
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    erreurs.append(message['status'])
+
+            await application({
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': chemin, 'raw_path': chemin.encode(),
+                'query_string': b'', 'root_path': '',
+                'headers': [(b'host', HOTE.encode()), (b'authorization', self.autorisation.encode())],
+                'client': ('127.0.0.1', 0), 'server': (HOTE, 80),
+            }, receive, send)
+
+        async def client():
+            while (i := next(compteur)) < requetes:
+                debut = time.perf_counter()
+                await requete(self.chemins[i % len(self.chemins)])
+                latences.append(time.perf_counter() - debut)
+
+        debut = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return time.perf_counter() - debut, latences, len(erreurs)
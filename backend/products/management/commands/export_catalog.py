@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import transferts
+
+
+class Command(BaseCommand):
+    help = ("Exporte les produits ou les catégories en CSV ou JSON Lines, au fil de l'eau : "
+            "la table est lue par lots, sans être chargée en mémoire. Le fichier produit peut "
+            "être réimporté avec import_catalog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', nargs='?', default='-',
+                            help="Fichier de sortie (défaut : sortie standard)")
+        parser.add_argument('--modele', choices=list(transferts.TRANSFERTS), default='produits',
+                            help="Lignes exportées (défaut : produits)")
+        parser.add_argument('--format', choices=transferts.FORMATS,
+                            help="Format du fichier (défaut : d'après l'extension, sinon csv)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Lignes lues par requête (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        format = options['format'] or transferts.format_du_fichier(options['fichier']) or 'csv'
+        debut = time.monotonic()
+        morceaux = transferts.exporter(options['modele'], format, options['batch_size'])
+        if options['fichier'] == '-':
+            for morceau in morceaux:
+                self.stdout.write(morceau, ending='')
+        else:
+            try:
+                with open(options['fichier'], 'w', encoding='utf-8', newline='') as sortie:
+                    sortie.writelines(morceaux)
+            except OSError as erreur:
+                raise CommandError(erreur)
+        self.stderr.write(f"Export terminé en {time.monotonic() - debut:.2f}s")
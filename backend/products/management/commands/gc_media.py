@@ -0,0 +1,132 @@
+import posixpath
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products import images
+from products.models import CHAMPS_MEDIA, FichierMedia
+from products.stockage import stockage_media
+
+
+def references(noms=None):
+    """Nombre de lignes qui référencent chaque fichier (tous, ou seulement `noms`)."""
+    compte = Counter()
+    for modele, champ in CHAMPS_MEDIA.items():
+        lignes = modele.objects.exclude(**{f'{champ}__isnull': True}).exclude(**{champ: ''})
+        if noms is not None:
+            lignes = lignes.filter(**{f'{champ}__in': noms})
+        compte.update(lignes.values_list(champ, flat=True))
+    return compte
+
+
+class Command(BaseCommand):
+    help = ("Supprime les images téléversées qui ne sont plus référencées par aucun produit, "
+            "image de galerie ou catégorie, avec leurs déclinaisons")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delai', type=int, default=60,
+                            help="Ne pas toucher aux fichiers modifiés depuis moins de N minutes (défaut : 60)")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Nombre de fichiers examinés par lot (défaut : 500)")
+        parser.add_argument('--complet', action='store_true',
+                            help="Parcourir aussi les dossiers du stockage et recompter toutes les références")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Afficher les fichiers à supprimer sans les supprimer")
+
+    def handle(self, *args, **options):
+        self.storage = stockage_media()
+        self.options = options
+        self.limite = timezone.now() - timedelta(minutes=options['delai'])
+        self.fichiers = self.octets = 0
+        debut = time.monotonic()
+
+        self.collecter_orphelins()
+        if options['complet']:
+            self.parcourir_stockage()
+
+        duree = time.monotonic() - debut
+        verbe = "à supprimer" if options['dry_run'] else "supprimés"
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.fichiers} fichiers {verbe} ({self.octets / 1024:.0f} Kio) en {duree:.2f}s"
+        ))
+
+    def collecter_orphelins(self):
+        """Fichiers dont le compteur de références est tombé à zéro."""
+        orphelins = FichierMedia.objects.filter(references__lte=0, date_modification__lt=self.limite)
+        dernier_id = 0
+        while True:
+            lot = list(orphelins.filter(pk__gt=dernier_id).order_by('pk')[:self.options['batch_size']])
+            if not lot:
+                break
+            dernier_id = lot[-1].pk
+            # Le compteur n'est qu'un indice : vérifier qu'aucune ligne ne référence le fichier
+            encore = references([fichier.nom for fichier in lot])
+            for fichier in lot:
+                if encore[fichier.nom]:
+                    FichierMedia.objects.filter(pk=fichier.pk).update(references=encore[fichier.nom])
+                elif self.supprimer(fichier.nom) and not self.options['dry_run']:
+                    FichierMedia.objects.filter(pk=fichier.pk, references__lte=0).delete()
+
+    def parcourir_stockage(self):
+        """Fichiers jamais comptés (téléversés avant le comptage, écritures interrompues) et recomptage."""
+        compte = references()
+        dossiers = {modele._meta.get_field(champ).upload_to for modele, champ in CHAMPS_MEDIA.items()}
+        for dossier in sorted(dossiers):
+            try:
+                _, fichiers = self.storage.listdir(dossier)
+            except FileNotFoundError:
+                continue
+            for fichier in fichiers:
+                nom = posixpath.join(dossier, fichier)
+                if not compte[nom]:
+                    self.supprimer(nom)
+            self.purger_declinaisons(dossier)
+
+        if self.options['dry_run']:
+            return
+        existants = dict(FichierMedia.objects.values_list('nom', 'references'))
+        FichierMedia.objects.bulk_create(
+            [FichierMedia(nom=nom, references=nombre) for nom, nombre in compte.items() if nom not in existants],
+            batch_size=self.options['batch_size'],
+        )
+        for nom, nombre in existants.items():
+            if nombre != compte[nom]:
+                FichierMedia.objects.filter(nom=nom).update(references=compte[nom])
+
+    def purger_declinaisons(self, dossier):
+        """Déclinaisons dont l'original a disparu."""
+        racine = posixpath.join(images.PREFIXE, dossier)
+        try:
+            sous_dossiers, _ = self.storage.listdir(racine)
+            _, originaux = self.storage.listdir(dossier)
+        except FileNotFoundError:
+            return
+        originaux = {posixpath.splitext(nom)[0] for nom in originaux}
+        for sous_dossier in sous_dossiers:
+            if sous_dossier not in originaux:
+                # Nom fictif : seule sa racine compte pour retrouver les déclinaisons
+                self.supprimer_declinaisons(posixpath.join(dossier, sous_dossier))
+
+    def supprimer_declinaisons(self, nom):
+        if self.options['dry_run']:
+            return
+        fichiers, octets = images.supprimer_derives(nom, self.storage)
+        self.fichiers += fichiers
+        self.octets += octets
+
+    def supprimer(self, nom):
+        """Supprime un original et ses déclinaisons ; False s'il est trop récent pour y toucher."""
+        if self.storage.exists(nom):
+            if self.storage.get_modified_time(nom) >= self.limite:
+                return False
+            if self.options['verbosity'] >= 2:
+                self.stdout.write(f"  {nom}")
+            self.fichiers += 1
+            self.octets += self.storage.size(nom)
+            if not self.options['dry_run']:
+                self.storage.delete(nom)
+        self.supprimer_declinaisons(nom)
+        return True
@@ -0,0 +1,63 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+
+from products import images
+from products.models import Categorie, ImageProduit, Produit
+from users.models import Profil
+
+# (modèle, champ image) des médias téléversés
+SOURCES = (
+    (Produit, 'image_principale'),
+    (ImageProduit, 'image'),
+    (Categorie, 'image'),
+    (Profil, 'photo'),
+)
+
+
+def _generer(nom, forcer):
+    try:
+        return nom, images.generer_derives(nom, forcer=forcer), None
+    except Exception as erreur:
+        return nom, 0, erreur
+
+
+class Command(BaseCommand):
+    help = ("Génère les déclinaisons (miniature, carte, zoom en WebP et JPEG) des images "
+            "existantes, réparties sur plusieurs processus")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Nombre de processus (défaut : nombre de cœurs)")
+        parser.add_argument('--forcer', action='store_true',
+                            help="Régénérer les déclinaisons déjà présentes")
+
+    def handle(self, *args, **options):
+        noms = set()
+        for modele, champ in SOURCES:
+            noms.update(
+                modele.objects.exclude(**{f'{champ}__isnull': True}).exclude(**{champ: ''})
+                .values_list(champ, flat=True).distinct()
+            )
+
+        debut = time.monotonic()
+        fichiers = traites = echecs = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            taches = [pool.submit(_generer, nom, options['forcer']) for nom in sorted(noms)]
+            for tache in as_completed(taches):
+                nom, ecrits, erreur = tache.result()
+                if erreur:
+                    echecs += 1
+                    self.stderr.write(f"{nom} : {erreur}")
+                    continue
+                traites += bool(ecrits)
+                fichiers += ecrits
+
+        duree = time.monotonic() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(noms)} images, {traites} traitées ({fichiers} déclinaisons), "
+            f"{echecs} échecs en {duree:.2f}s"
+        ))
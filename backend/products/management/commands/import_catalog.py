@@ -0,0 +1,47 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import transferts
+
+
+class Command(BaseCommand):
+    help = ("Importe des produits ou des catégories depuis un fichier CSV ou JSON Lines, par lots : "
+            "les lignes dont le slug existe déjà modifient le produit, les autres sont créées "
+            "(slug généré depuis le nom s'il est absent). Les catégories sont désignées par leur slug.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Fichier à importer, ou - pour l'entrée standard")
+        parser.add_argument('--modele', choices=list(transferts.TRANSFERTS), default='produits',
+                            help="Lignes importées (défaut : produits)")
+        parser.add_argument('--format', choices=transferts.FORMATS,
+                            help="Format du fichier (défaut : d'après l'extension)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Lignes validées et enregistrées par lot (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        format = options['format'] or transferts.format_du_fichier(options['fichier'])
+        if format is None:
+            raise CommandError("Format inconnu : préciser --format csv ou --format jsonl")
+
+        if options['fichier'] == '-':
+            flux = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                flux = open(options['fichier'], encoding='utf-8-sig', newline='')
+            except OSError as erreur:
+                raise CommandError(erreur)
+
+        with flux:
+            operation = transferts.Import(options['modele'], options['batch_size'])
+            rapport = operation.executer(transferts.lire(flux, format)).rapport()
+
+        for erreur in rapport['details_erreurs']:
+            self.stderr.write(f"Ligne {erreur['ligne']} : {erreur['erreur']}")
+        if rapport['erreurs'] > len(rapport['details_erreurs']):
+            self.stderr.write(f"... et {rapport['erreurs'] - len(rapport['details_erreurs'])} autres erreurs")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport['lignes']} lignes en {rapport['duree']:.2f}s ({rapport['lignes_par_seconde']} lignes/s) : "
+            f"{rapport['crees']} créées, {rapport['modifiees']} modifiées, {rapport['erreurs']} en erreur"
+        ))
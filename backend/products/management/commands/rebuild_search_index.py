@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products import search
+from products.models import Produit
+
+
+class Command(BaseCommand):
+    help = "Reconstruit entièrement l'index de recherche plein texte des produits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Nombre de produits indexés par lot (défaut : 1000)")
+
+    def handle(self, *args, **options):
+        if not search.est_disponible():
+            raise CommandError("L'index FTS5 n'existe pas (base non SQLite ou migrations non appliquées)")
+
+        batch_size = options['batch_size']
+        debut = time.monotonic()
+        total = 0
+        lot = []
+
+        with transaction.atomic():
+            search.vider_index()
+            produits = Produit.objects.only('id', *search.COLONNES).order_by().iterator(chunk_size=batch_size)
+            for produit in produits:
+                lot.append(produit)
+                if len(lot) >= batch_size:
+                    total += search.indexer_produits(lot)
+                    lot = []
+            total += search.indexer_produits(lot)
+
+        duree = time.monotonic() - debut
+        self.stdout.write(self.style.SUCCESS(f"{total} produits indexés en {duree:.2f}s"))
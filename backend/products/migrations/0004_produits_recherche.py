@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from products import search
+
+
+def creer_index(apps, schema_editor):
+    search.creer_table(schema_editor)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Produit = apps.get_model('products', 'Produit')
+    colonnes = ('id',) + search.COLONNES
+    schema_editor.connection.cursor().executemany(
+        f"INSERT INTO {search.TABLE} (rowid, {', '.join(search.COLONNES)}) "
+        f"VALUES ({', '.join(['%s'] * len(colonnes))})",
+        Produit.objects.values_list(*colonnes).iterator(),
+    )
+
+
+def supprimer_index(apps, schema_editor):
+    search.supprimer_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_produit_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_produits_recherche'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['-date_creation', '-id'], name='produit_dispo_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['categorie', '-date_creation'], name='produit_cat_dispo_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['marque', '-date_creation'], name='produit_marque_date_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:35
+
+from collections import Counter
+
+import products.stockage
+from django.db import migrations, models
+
+
+def compter_references(apps, schema_editor):
+    """Références des fichiers déjà téléversés (noms d'origine, non hachés)."""
+    FichierMedia = apps.get_model('products', 'FichierMedia')
+    references = Counter()
+    for modele, champ in (('Produit', 'image_principale'), ('ImageProduit', 'image'), ('Categorie', 'image')):
+        noms = apps.get_model('products', modele).objects.exclude(**{f'{champ}__isnull': True}).exclude(**{champ: ''})
+        references.update(noms.values_list(champ, flat=True))
+    FichierMedia.objects.bulk_create(
+        [FichierMedia(nom=nom, references=nombre) for nom, nombre in references.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categorie',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=products.stockage.stockage_media, upload_to='categories'),
+        ),
+        migrations.AlterField(
+            model_name='imageproduit',
+            name='image',
+            field=models.ImageField(storage=products.stockage.stockage_media, upload_to='produits'),
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='image_principale',
+            field=models.ImageField(blank=True, null=True, storage=products.stockage.stockage_media, upload_to='produits'),
+        ),
+        migrations.CreateModel(
+            name='FichierMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255, unique=True)),
+                ('references', models.IntegerField(default=0)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Fichier média',
+                'verbose_name_plural': 'Fichiers médias',
+                'indexes': [models.Index(fields=['references', 'date_modification'], name='fichier_media_orphelin_idx')],
+            },
+        ),
+        migrations.RunPython(compter_references, migrations.RunPython.noop),
+    ]
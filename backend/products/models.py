@@ -1,11 +1,16 @@
 from django.db import models
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
 from django.utils.text import slugify
+from . import images, search
+from .stockage import compter, stockage_media
+from . import cache as catalogue_cache
 
 class Categorie(models.Model):
     nom = models.CharField(max_length=100)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to='categories', blank=True, null=True)
+    image = models.ImageField(upload_to='categories', storage=stockage_media, blank=True, null=True)
     date_creation = models.DateTimeField(auto_now_add=True)
     date_modification = models.DateTimeField(auto_now=True)
     
@@ -31,7 +36,7 @@ class Produit(models.Model):
     prix = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     disponible = models.BooleanField(default=True)
-    image_principale = models.ImageField(upload_to='produits', null=True, blank=True)
+    image_principale = models.ImageField(upload_to='produits', storage=stockage_media, null=True, blank=True)
     marque = models.CharField(max_length=100, blank=True)
     volume = models.CharField(max_length=50, blank=True, help_text="Ex: 100ml")
     date_creation = models.DateTimeField(auto_now_add=True)
@@ -41,6 +46,22 @@ class Produit(models.Model):
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
         ordering = ['-date_creation']
+        indexes = [
+            # Index composites utilisés par la pagination keyset (tri, id)
+            models.Index(fields=['-date_creation', '-id'], name='produit_date_id_idx'),
+            models.Index(fields=['prix', 'id'], name='produit_prix_id_idx'),
+            models.Index(fields=['nom', 'id'], name='produit_nom_id_idx'),
+            # Filtres fréquents du catalogue public (produits disponibles, les plus récents d'abord)
+            models.Index(
+                fields=['-date_creation', '-id'], name='produit_dispo_date_idx',
+                condition=models.Q(disponible=True),
+            ),
+            models.Index(
+                fields=['categorie', '-date_creation'], name='produit_cat_dispo_date_idx',
+                condition=models.Q(disponible=True),
+            ),
+            models.Index(fields=['marque', '-date_creation'], name='produit_marque_date_idx'),
+        ]
     
     def __str__(self):
         return self.nom
@@ -53,7 +74,7 @@ class Produit(models.Model):
 
 class ImageProduit(models.Model):
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='produits')
+    image = models.ImageField(upload_to='produits', storage=stockage_media)
     
     class Meta:
         verbose_name = "Image produit"
@@ -61,3 +82,137 @@ class ImageProduit(models.Model):
     
     def __str__(self):
         return f"Image de {self.produit.nom}"
+
+
+class FichierMedia(models.Model):
+    """Nombre de références vers un fichier téléversé, pour le ramasse-miettes (`gc_media`)."""
+    nom = models.CharField(max_length=255, unique=True)
+    references = models.IntegerField(default=0)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Fichier média"
+        verbose_name_plural = "Fichiers médias"
+        indexes = [
+            models.Index(fields=['references', 'date_modification'], name='fichier_media_orphelin_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} ({self.references})"
+
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, raw=False, **kwargs):
+    """Tenir l'index de recherche à jour à chaque enregistrement."""
+    if not raw and search.est_disponible():
+        search.indexer_produits([instance])
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    if search.est_disponible():
+        search.retirer_produit(instance.id)
+
+
+@receiver(post_init, sender=Produit)
+def memoriser_etat_initial(sender, instance, **kwargs):
+    """Conserver le slug et la catégorie chargés pour invalider aussi les anciens."""
+    # Passer par __dict__ pour ne pas charger les champs différés (only/defer)
+    instance._slug_initial = instance.__dict__.get('slug')
+    instance._categorie_initiale = instance.__dict__.get('categorie_id')
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+def invalider_cache_produit(sender, instance, **kwargs):
+    portees = {
+        'produits',
+        f'produit:{instance.slug}',
+        f'produit:{instance._slug_initial}',
+        f'categorie:{instance.categorie_id}',
+        f'categorie:{instance._categorie_initiale}',
+    }
+    catalogue_cache.invalider(*portees)
+    # Passer par __dict__ pour ne pas charger les champs différés (only/defer)
+    instance._slug_initial = instance.__dict__.get('slug')
+    instance._categorie_initiale = instance.__dict__.get('categorie_id')
+
+
+@receiver(post_save, sender=ImageProduit)
+@receiver(post_delete, sender=ImageProduit)
+def invalider_cache_image(sender, instance, **kwargs):
+    produit = Produit.objects.filter(id=instance.produit_id).values('slug', 'categorie_id').first()
+    portees = ['produits']
+    if produit:
+        portees += [f"produit:{produit['slug']}", f"categorie:{produit['categorie_id']}"]
+    catalogue_cache.invalider(*portees)
+
+
+@receiver(post_save, sender=Categorie)
+@receiver(post_delete, sender=Categorie)
+def invalider_cache_categorie(sender, instance, **kwargs):
+    # Les produits embarquent leur catégorie : les listes doivent aussi être recalculées
+    catalogue_cache.invalider('categories', 'produits', f'categorie:{instance.id}')
+
+
+@receiver(post_save, sender=Produit)
+def decliner_image_produit(sender, instance, raw=False, **kwargs):
+    """Générer les déclinaisons des images téléversées (hors de la requête)."""
+    if not raw:
+        images.planifier(instance.image_principale)
+
+
+@receiver(post_save, sender=ImageProduit)
+def decliner_image_galerie(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.planifier(instance.image)
+
+
+@receiver(post_save, sender=Categorie)
+def decliner_image_categorie(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.planifier(instance.image)
+
+
+# Champ image de chaque modèle du catalogue, pour le comptage des références
+CHAMPS_MEDIA = {
+    Produit: 'image_principale',
+    ImageProduit: 'image',
+    Categorie: 'image',
+}
+
+
+def _nom_fichier(valeur):
+    return getattr(valeur, 'name', valeur) or None
+
+
+@receiver(post_init, sender=Produit)
+@receiver(post_init, sender=ImageProduit)
+@receiver(post_init, sender=Categorie)
+def memoriser_fichier_initial(sender, instance, **kwargs):
+    # Passer par __dict__ pour ne pas charger les champs différés (only/defer)
+    instance._fichier_initial = _nom_fichier(instance.__dict__.get(CHAMPS_MEDIA[sender]))
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_save, sender=ImageProduit)
+@receiver(post_save, sender=Categorie)
+def compter_references_fichier(sender, instance, raw=False, **kwargs):
+    """Tenir à jour les références quand une image est ajoutée, remplacée ou retirée."""
+    champ = CHAMPS_MEDIA[sender]
+    if champ not in instance.__dict__:
+        return
+    nom = _nom_fichier(instance.__dict__[champ])
+    if nom != instance._fichier_initial:
+        compter(nom, 1)
+        compter(instance._fichier_initial, -1)
+        instance._fichier_initial = nom
+
+
+@receiver(post_delete, sender=Produit)
+@receiver(post_delete, sender=ImageProduit)
+@receiver(post_delete, sender=Categorie)
+def liberer_fichier(sender, instance, **kwargs):
+    # Le fichier n'est pas supprimé ici : d'autres lignes peuvent le partager,
+    # et la transaction peut encore être annulée. `gc_media` s'en charge.
+    compter(instance._fichier_initial, -1)
@@ -0,0 +1,165 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import FloatField, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur (keyset) sur une clé composite (champ de tri, id).
+
+    Chaque page est obtenue par un filtre `WHERE (champ, id) > (valeur, pk)`
+    appuyé sur un index composite : son coût ne dépend pas de la profondeur.
+    Le mode est activé dès que le client envoie `cursor` ou `page_size`, afin
+    que les clients existants qui attendent une liste complète continuent
+    de fonctionner.
+
+    Sans `ordering` explicite, un queryset annoté par la recherche
+    (`relevance_field`) est paginé par pertinence, comme la liste complète.
+    """
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    default_ordering = '-date_creation'
+    tie_breaker = 'id'
+    relevance_field = 'rang_recherche'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def is_enabled(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_orderings(self, view):
+        return [field for field in getattr(view, 'ordering_fields', []) if field != self.tie_breaker]
+
+    def get_ordering(self, request, view, queryset=None):
+        """Retourne (champ, descendant) à partir du paramètre `ordering`."""
+        params = request.query_params.get(self.ordering_query_param, '')
+        if not params.strip() and queryset is not None and self.relevance_field in queryset.query.annotations:
+            return self.relevance_field, False
+        term = params.split(',')[0].strip() or self.default_ordering
+        field = term.lstrip('-')
+        if field not in self.get_orderings(view):
+            term = self.default_ordering
+            field = term.lstrip('-')
+        return field, term.startswith('-')
+
+    def encode_cursor(self, values):
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            field, value, pk, reverse = cursor['f'], cursor['v'], int(cursor['pk']), bool(cursor['r'])
+            if field != self.field or value is None:
+                raise ValueError
+            value = self.model_field.to_python(value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, reverse
+
+    def serialize_value(self, obj):
+        value = getattr(obj, self.field)
+        if value is None or self.field == self.relevance_field:
+            return value
+        return self.model_field.value_to_string(obj)
+
+    def build_cursor(self, obj, reverse):
+        return self.encode_cursor({
+            'f': self.field,
+            'v': self.serialize_value(obj),
+            'pk': obj.pk,
+            'r': reverse,
+        })
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_enabled(request):
+            return None
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view, queryset)
+        if self.field == self.relevance_field:
+            self.model_field = FloatField()
+        else:
+            self.model_field = queryset.model._meta.get_field(self.field)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor[2] if cursor else False
+
+        # Parcourir à rebours pour la page précédente, puis remettre dans l'ordre
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}{self.tie_breaker}')
+
+        if cursor:
+            value, pk, _ = cursor
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'{self.tie_breaker}__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.build_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.build_cursor(self.page[0], True))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,131 @@
+"""
+Index de recherche plein texte des produits.
+
+Sous SQLite, l'index est une table virtuelle FTS5 (`produits_recherche`) dont
+le `rowid` est l'id du produit. Le tokenizer `unicode61` avec
+`remove_diacritics 2` rend la recherche insensible aux accents ("creme"
+trouve "Crème") et les index de préfixes accélèrent la saisie semi-automatique.
+Pour les autres bases, on retombe sur le `SearchFilter` de DRF.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+TABLE = 'produits_recherche'
+COLONNES = ('nom', 'marque', 'description')
+# Poids bm25 par colonne : le nom compte plus que la marque, puis la description
+POIDS = (10.0, 5.0, 1.0)
+
+MOT_RE = re.compile(r'\w+', re.UNICODE)
+
+
+_disponible = {}
+
+
+def est_disponible():
+    """Indique si l'index FTS5 existe (résultat mis en cache une fois trouvé)."""
+    if connection.vendor != 'sqlite':
+        return False
+    if _disponible.get(connection.alias):
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+        _disponible[connection.alias] = cursor.fetchone() is not None
+    return _disponible[connection.alias]
+
+
+def creer_table(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        f"{', '.join(COLONNES)}, "
+        "tokenize = 'unicode61 remove_diacritics 2', "
+        "prefix = '2 3')"
+    )
+
+
+def supprimer_table(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def construire_requete(texte):
+    """
+    Transforme la saisie utilisateur en requête FTS5 : chaque mot est cité
+    (aucun opérateur FTS ne peut être injecté) et suivi de `*` pour la
+    recherche par préfixe. Les mots sont combinés par un ET implicite.
+    """
+    mots = MOT_RE.findall(texte or '')
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+
+def _valeurs(produit):
+    return [produit.id] + [getattr(produit, colonne) or '' for colonne in COLONNES]
+
+
+def indexer_produits(produits):
+    """Ajoute ou remplace les produits donnés dans l'index."""
+    lignes = [_valeurs(produit) for produit in produits]
+    if not lignes:
+        return 0
+    ids = [ligne[0] for ligne in lignes]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids
+        )
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, {', '.join(COLONNES)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(COLONNES))})",
+            lignes,
+        )
+    return len(lignes)
+
+
+def retirer_produit(produit_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [produit_id])
+
+
+def vider_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+
+def rechercher(queryset, texte):
+    """
+    Filtre le queryset sur l'index et l'annote avec `rang_recherche`
+    (score bm25, plus petit = plus pertinent).
+    """
+    requete = construire_requete(texte)
+    if not requete:
+        return queryset
+    table_produit = queryset.model._meta.db_table
+    poids = ', '.join(str(p) for p in POIDS)
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [requete])
+    ).annotate(
+        rang_recherche=RawSQL(
+            f"SELECT bm25({TABLE}, {poids}) FROM {TABLE} "
+            f'WHERE {TABLE} MATCH %s AND rowid = "{table_produit}"."id"',
+            [requete],
+        )
+    )
+
+
+class ProduitSearchFilter(filters.SearchFilter):
+    """
+    `SearchFilter` adossé à l'index FTS5 : les résultats sont triés par
+    pertinence, sauf si le client demande un autre tri via `ordering`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        texte = ' '.join(self.get_search_terms(request))
+        if not construire_requete(texte):
+            return queryset
+        if not est_disponible():
+            return super().filter_queryset(request, queryset, view)
+        return rechercher(queryset, texte).order_by('rang_recherche', '-date_creation')
@@ -1,40 +1,113 @@
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from .models import Categorie, Produit, ImageProduit
+from . import images
 
-class CategorieSerializer(serializers.ModelSerializer):
+
+class EagerLoadingMixin:
+    """
+    Déclare le plan de chargement (select_related / prefetch_related) dont un
+    serializer a besoin pour s'exécuter sans requête par ligne.
+
+    Le plan des serializers imbriqués est ajouté automatiquement : une
+    relation simple est jointe et préfixée par le nom du champ, une relation
+    `many=True` devient un `Prefetch` dont le queryset applique le plan du
+    serializer enfant.
+    """
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def get_eager_loading_plan(cls):
+        select = list(cls.select_related_fields)
+        prefetch = list(cls.prefetch_related_fields)
+
+        for name, field in cls._declared_fields.items():
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, EagerLoadingMixin):
+                continue
+            source = field.source or name
+            if many:
+                queryset = nested.setup_eager_loading(nested.Meta.model._default_manager.all())
+                prefetch.append(Prefetch(source, queryset=queryset))
+                continue
+            nested_select, nested_prefetch = nested.get_eager_loading_plan()
+            select.append(source)
+            select.extend(f'{source}__{lookup}' for lookup in nested_select)
+            for lookup in nested_prefetch:
+                if isinstance(lookup, Prefetch):
+                    lookup = Prefetch(f'{source}__{lookup.prefetch_through}', queryset=lookup.queryset)
+                else:
+                    lookup = f'{source}__{lookup}'
+                prefetch.append(lookup)
+
+        return select, prefetch
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select, prefetch = cls.get_eager_loading_plan()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    @classmethod
+    def prefetch_instance(cls, instance):
+        """Applique le plan à une instance déjà chargée."""
+        select, prefetch = cls.get_eager_loading_plan()
+        prefetch_related_objects([instance], *select, *prefetch)
+        return instance
+
+
+class CategorieSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Categorie
         fields = ['id', 'nom', 'slug', 'description', 'image', 'date_creation']
 
 
-class ImageProduitSerializer(serializers.ModelSerializer):
+class ImageProduitSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    derives = serializers.SerializerMethodField()
+    
     class Meta:
         model = ImageProduit
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'derives']
+    
+    def get_derives(self, image):
+        return images.urls_derives(image.image, self.context.get('request'))
 
 
-class ProduitSerializer(serializers.ModelSerializer):
+class ProduitSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     categorie = CategorieSerializer(read_only=True)
     categorie_id = serializers.PrimaryKeyRelatedField(write_only=True, queryset=Categorie.objects.all(), source='categorie')
     images = ImageProduitSerializer(many=True, read_only=True)
+    image_principale_derives = serializers.SerializerMethodField()
     
     class Meta:
         model = Produit
         fields = [
             'id', 'nom', 'slug', 'categorie', 'categorie_id', 'description',
-            'prix', 'stock', 'disponible', 'image_principale', 'images',
+            'prix', 'stock', 'disponible', 'image_principale', 'image_principale_derives', 'images',
             'marque', 'volume', 'date_creation'
         ]
+    
+    def get_image_principale_derives(self, produit):
+        return images.urls_derives(produit.image_principale, self.context.get('request'))
 
 
-class ProduitDetailSerializer(serializers.ModelSerializer):
+class ProduitDetailSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     categorie = CategorieSerializer(read_only=True)
     images = ImageProduitSerializer(many=True, read_only=True)
+    image_principale_derives = serializers.SerializerMethodField()
     
     class Meta:
         model = Produit
         fields = [
             'id', 'nom', 'slug', 'categorie', 'description',
-            'prix', 'stock', 'disponible', 'image_principale', 'images',
+            'prix', 'stock', 'disponible', 'image_principale', 'image_principale_derives', 'images',
             'marque', 'volume', 'date_creation', 'date_modification'
-        ] 
\ No newline at end of file
+        ]
+    
+    def get_image_principale_derives(self, produit):
+        return images.urls_derives(produit.image_principale, self.context.get('request')) 
\ No newline at end of file
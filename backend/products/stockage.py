@@ -0,0 +1,90 @@
+"""
+Stockage des images téléversées, nommées d'après leur contenu.
+
+`StockageContenuHache` enregistre `produits/flacon.JPG` sous
+`produits/<sha256>.jpg` : deux téléversements identiques (le même visuel
+pour chaque variante d'un parfum) partagent un seul fichier. Un nom ne
+désigne donc jamais qu'un seul contenu, et les originaux comme leurs
+déclinaisons peuvent être servis avec un `Cache-Control` immuable.
+
+Les références des modèles vers chaque fichier sont comptées dans
+`FichierMedia` ; la commande `gc_media` supprime les fichiers qui ne sont
+plus référencés (produit ou image supprimé, image remplacée).
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .images import PREFIXE
+
+CACHE_IMMUABLE = 'public, max-age=31536000, immutable'
+
+# `<dossier>/<sha256>.<ext>` et les déclinaisons `derives/<dossier>/<sha256>/<taille>.<ext>`
+_NOM_HACHE = re.compile(r'(?:^|/)[0-9a-f]{64}(?:\.[\w]+|/[\w-]+\.[\w]+)$')
+
+
+def est_immuable(nom):
+    """Vrai si le contenu du fichier `nom` ne peut pas changer."""
+    return bool(_NOM_HACHE.search(nom))
+
+
+@deconstructible
+class StockageContenuHache(FileSystemStorage):
+    """`FileSystemStorage` qui nomme les fichiers par l'empreinte SHA-256 de leur contenu."""
+
+    def __init__(self, **kwargs):
+        # Réécrire un nom déjà pris, c'est réécrire les mêmes octets
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def nom_hache(self, name, content):
+        empreinte = hashlib.sha256()
+        for morceau in content.chunks():
+            empreinte.update(morceau)
+        content.seek(0)
+        dossier, base = posixpath.split(name)
+        extension = posixpath.splitext(base)[1].lower()
+        return posixpath.join(dossier, empreinte.hexdigest() + extension)
+
+    def _save(self, name, content):
+        if name.startswith(PREFIXE + '/'):
+            # Déclinaisons : leur chemin dérive déjà de l'original haché
+            return super()._save(name, content)
+        name = self.nom_hache(name, content)
+        if self.exists(name):
+            # Rafraîchir la date du fichier : `gc_media` épargne les fichiers récents,
+            # le temps que la ligne qui va le référencer soit enregistrée
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+
+_stockage = StockageContenuHache()
+
+
+def stockage_media():
+    """Stockage des champs image du catalogue (appelable, pour les migrations)."""
+    return _stockage
+
+
+def compter(nom, delta):
+    """Ajoute `delta` au nombre de références du fichier `nom`."""
+    from .models import FichierMedia
+
+    if not nom or not delta:
+        return
+    fichiers = FichierMedia.objects.filter(nom=nom)
+    if fichiers.update(references=F('references') + delta):
+        return
+    try:
+        with transaction.atomic():
+            FichierMedia.objects.create(nom=nom, references=max(delta, 0))
+    except IntegrityError:
+        # Créé entre-temps par une requête concurrente
+        fichiers.update(references=F('references') + delta)
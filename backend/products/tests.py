@@ -1,3 +1,760 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import os
+import posixpath
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from nkcommerce.fichiers import CACHE_REVALIDER, Fichiers, FichiersASGI, FichiersWSGI
+from orders.models import Panier
+
+from . import cache as catalogue_cache, images, transferts, views_async
+from .models import Categorie, FichierMedia, Produit, ImageProduit
+from .pagination import KeysetPagination
+from .stockage import CACHE_IMMUABLE, stockage_media
+from .views import CategorieViewSet
+
+
+def creer_produits(categorie, nombre, debut=0, **kwargs):
+    return Produit.objects.bulk_create([
+        Produit(
+            nom=f"Produit {i:04d}",
+            slug=f"produit-{categorie.slug}-{i:04d}",
+            categorie=categorie,
+            description="Description",
+            prix=Decimal(i % 7) + Decimal('9.99'),
+            stock=10,
+            **kwargs
+        )
+        for i in range(debut, debut + nombre)
+    ])
+
+
+class QueryCountMixin:
+    """
+    Vérifie qu'un endpoint exécute le même nombre de requêtes quel que soit
+    le volume de données (absence de N+1).
+    """
+    tailles = (10, 100, 1000)
+
+    def assertConstantQueries(self, url, remplir, tailles=None):
+        comptes = {}
+        deja_crees = 0
+        for taille in tailles or self.tailles:
+            remplir(deja_crees, taille - deja_crees)
+            deja_crees = taille
+            # Mesurer le chemin base de données, pas le cache du catalogue
+            catalogue_cache.get_cache().clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            comptes[taille] = len(ctx.captured_queries)
+        self.assertEqual(len(set(comptes.values())), 1, f"Requêtes par taille : {comptes}")
+        return comptes
+
+
+class CatalogueTestCase(TestCase):
+    def setUp(self):
+        catalogue_cache.get_cache().clear()
+
+
+class KeysetPaginationTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        creer_produits(self.categorie, 25)
+
+    def parcourir(self, params):
+        ids = []
+        response = self.client.get('/api/products/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(p['id'] for p in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_liste_sans_curseur_reste_une_liste(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data), 25)
+
+    def test_parcours_complet_sans_doublon(self):
+        for ordering in ['-date_creation', 'prix', '-prix', 'nom']:
+            ids, _ = self.parcourir({'page_size': 4, 'ordering': ordering})
+            self.assertEqual(len(ids), 25, ordering)
+            self.assertEqual(len(set(ids)), 25, ordering)
+
+    def test_ordre_respecte_avec_egalites(self):
+        ids, _ = self.parcourir({'page_size': 4, 'ordering': 'prix'})
+        attendu = list(Produit.objects.order_by('prix', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, attendu)
+
+    def test_page_precedente(self):
+        premiere = self.client.get('/api/products/', {'page_size': 5, 'ordering': 'nom'})
+        seconde = self.client.get(premiere.data['next'])
+        retour = self.client.get(seconde.data['previous'])
+        self.assertEqual(
+            [p['id'] for p in retour.data['results']],
+            [p['id'] for p in premiere.data['results']],
+        )
+        self.assertIsNone(retour.data['previous'])
+
+    def test_curseur_invalide(self):
+        response = self.client.get('/api/products/', {'cursor': 'pas-un-curseur'})
+        self.assertEqual(response.status_code, 404)
+        # Curseur bien formé mais valeur invalide pour le champ de tri
+        pagination = KeysetPagination()
+        for ordering, valeur in [('prix', 'abc'), ('-date_creation', 'zzz'), ('nom', None), ('prix', [1])]:
+            pagination.field = ordering.lstrip('-')
+            curseur = pagination.encode_cursor({'f': pagination.field, 'v': valeur, 'pk': 1, 'r': False})
+            response = self.client.get('/api/products/', {'cursor': curseur, 'ordering': ordering})
+            self.assertEqual(response.status_code, 404, (ordering, valeur))
+
+
+class EagerLoadingTests(QueryCountMixin, CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.categorie = Categorie.objects.create(nom="Soins", slug="soins")
+        # Les actions personnalisées sont réservées aux administrateurs
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def remplir(self, debut, nombre):
+        produits = creer_produits(self.categorie, nombre, debut=debut)
+        ImageProduit.objects.bulk_create([
+            ImageProduit(produit=produit, image=f"produits/{produit.slug}.jpg")
+            for produit in produits
+        ])
+
+    def test_liste_produits(self):
+        comptes = self.assertConstantQueries('/api/products/', self.remplir)
+        self.assertEqual(comptes[10], 2)
+
+    def test_produits_par_categorie(self):
+        self.assertConstantQueries('/api/products/categories/soins/produits/', self.remplir)
+
+    def test_nouveautes(self):
+        self.assertConstantQueries('/api/products/nouveautes/', self.remplir, tailles=(10, 100))
+
+
+class RechercheTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.categorie = Categorie.objects.create(nom="Soins", slug="soins")
+        self.creme = Produit.objects.create(
+            nom="Crème hydratante", categorie=self.categorie, marque="Élégance",
+            description="Texture légère", prix=Decimal('20.00'),
+        )
+        self.savon = Produit.objects.create(
+            nom="Savon doux", categorie=self.categorie, marque="Nature",
+            description="Enrichi en crème de karité", prix=Decimal('5.00'),
+        )
+
+    def rechercher(self, texte):
+        response = self.client.get('/api/products/', {'search': texte})
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data]
+
+    def test_insensible_aux_accents(self):
+        self.assertEqual(self.rechercher("elegance"), [self.creme.id])
+
+    def test_prefixe_et_pertinence(self):
+        # Le nom pèse plus que la description dans le classement
+        self.assertEqual(self.rechercher("cre"), [self.creme.id, self.savon.id])
+
+    def test_pagination_par_pertinence(self):
+        # Le savon, plus récent, vient en premier dans l'ordre par défaut
+        premiere = self.client.get('/api/products/', {'search': "cre", 'page_size': 1}).data
+        self.assertEqual([p['id'] for p in premiere['results']], [self.creme.id])
+        seconde = self.client.get(premiere['next']).data
+        self.assertEqual([p['id'] for p in seconde['results']], [self.savon.id])
+        self.assertIsNone(seconde['next'])
+        precedente = self.client.get(seconde['previous']).data
+        self.assertEqual([p['id'] for p in precedente['results']], [self.creme.id])
+
+        par_date = self.client.get('/api/products/', {'search': "cre", 'page_size': 2, 'ordering': '-date_creation'})
+        self.assertEqual([p['id'] for p in par_date.data['results']], [self.savon.id, self.creme.id])
+
+    def test_mise_a_jour_incrementale(self):
+        self.savon.nom = "Savon à l'argile"
+        self.savon.save()
+        self.assertEqual(self.rechercher("argile"), [self.savon.id])
+        self.savon.delete()
+        self.assertEqual(self.rechercher("savon"), [])
+
+    def test_caracteres_speciaux_ignores(self):
+        self.assertEqual(self.rechercher('"crème* ^('), [self.creme.id, self.savon.id])
+
+    def test_reconstruction(self):
+        Produit.objects.filter(id=self.creme.id).update(nom="Lotion")
+        call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.rechercher("lotion"), [self.creme.id])
+
+
+class CatalogueCacheTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.parfums = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.soins = Categorie.objects.create(nom="Soins", slug="soins")
+        self.parfum = Produit.objects.create(
+            nom="Eau de parfum", categorie=self.parfums, description="", prix=Decimal('50.00')
+        )
+        self.creme = Produit.objects.create(
+            nom="Crème", categorie=self.soins, description="", prix=Decimal('20.00')
+        )
+
+    def test_deuxieme_lecture_sans_requete(self):
+        self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data), 2)
+
+    def test_query_string_normalisee(self):
+        self.client.get('/api/products/', {'marque': '', 'ordering': 'prix'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/?ordering=prix&marque=')
+
+    def test_invalidation_sur_modification(self):
+        self.client.get(f'/api/products/{self.parfum.slug}/')
+        self.parfum.prix = Decimal('45.00')
+        self.parfum.save()
+        response = self.client.get(f'/api/products/{self.parfum.slug}/')
+        self.assertEqual(response.data['prix'], '45.00')
+
+    def test_invalidation_par_categorie(self):
+        self.client.get('/api/products/categories/parfums/produits/')
+        self.client.get('/api/products/categories/soins/produits/')
+        self.creme.stock = 3
+        self.creme.save()
+        # Seule la recherche de la catégorie reste, la liste des parfums est servie du cache
+        with self.assertNumQueries(1):
+            self.client.get('/api/products/categories/parfums/produits/')
+        response = self.client.get('/api/products/categories/soins/produits/')
+        self.assertEqual(response.data[0]['stock'], 3)
+
+    def test_changement_de_categorie(self):
+        self.client.get('/api/products/categories/soins/produits/')
+        self.creme.categorie = self.parfums
+        self.creme.save()
+        response = self.client.get('/api/products/categories/soins/produits/')
+        self.assertEqual(response.data, [])
+
+    def test_invalidation_sur_ajout_image(self):
+        self.client.get(f'/api/products/{self.parfum.slug}/')
+        ImageProduit.objects.create(produit=self.parfum, image='produits/flacon.jpg')
+        response = self.client.get(f'/api/products/{self.parfum.slug}/')
+        self.assertEqual(len(response.data['images']), 1)
+
+    def test_en_tetes_http(self):
+        response = self.client.get('/api/products/categories/')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('Accept', response['Vary'])
+
+    def test_requete_conditionnelle_sans_travail(self):
+        etag = self.client.get(f'/api/products/{self.parfum.slug}/')['ETag']
+        # Ni lecture du cache de réponses, ni requête SQL, ni sérialisation
+        cache = catalogue_cache.get_cache()
+        with mock.patch.object(cache, 'get', wraps=cache.get) as lecture, self.assertNumQueries(0):
+            response = self.client.get(f'/api/products/{self.parfum.slug}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([appel for appel in lecture.call_args_list if ':reponse:' in appel.args[0]])
+        self.assertEqual(response['ETag'], etag)
+
+        self.parfum.prix = Decimal('45.00')
+        self.parfum.save()
+        response = self.client.get(f'/api/products/{self.parfum.slug}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Un autre produit garde son ETag
+        etag = self.client.get(f'/api/products/{self.creme.slug}/')['ETag']
+        self.parfum.save()
+        response = self.client.get(f'/api/products/{self.creme.slug}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        derniere_modification = self.client.get('/api/products/')['Last-Modified']
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=derniere_modification)
+        self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_change_a_chaque_invalidation(self):
+        # Deux invalidations dans la même seconde, de portées différentes d'une même réponse
+        with mock.patch('products.cache.time.time_ns', return_value=catalogue_cache.generations(['produits'])[0]):
+            catalogue_cache.invalider('produits')
+            derniere_modification = self.client.get('/api/products/')['Last-Modified']
+            catalogue_cache.invalider('categories')
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=derniere_modification)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], derniere_modification)
+
+
+class VuesAsyncTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.produits = creer_produits(self.categorie, 3)
+        ImageProduit.objects.create(produit=self.produits[0], image='produits/flacon.jpg')
+
+    def comparer(self, url):
+        """Même réponse JSON par la vue DRF (WSGI) et par la vue async (ASGI)."""
+        attendu = self.client.get(url)
+        catalogue_cache.get_cache().clear()
+        response = async_to_sync(self.async_client.get)(url)
+        self.assertEqual(response.status_code, attendu.status_code)
+        self.assertEqual(response.json(), attendu.json())
+        return response
+
+    @mock.patch.multiple(
+        views_async, liste_produits_drf=mock.DEFAULT, detail_produit_drf=mock.DEFAULT,
+        produits_categorie_drf=mock.DEFAULT,
+    )
+    def test_memes_reponses_sans_vue_drf(self, **vues_drf):
+        for vue in vues_drf.values():
+            vue.side_effect = AssertionError("délégation inattendue")
+        self.comparer('/api/products/')
+        response = self.comparer(f'/api/products/{self.produits[0].slug}/')
+        self.assertEqual(len(response.json()['images']), 1)
+        self.comparer('/api/products/categories/parfums/produits/')
+        self.comparer('/api/products/inconnu/')
+        self.comparer('/api/products/categories/inconnue/produits/')
+
+    def test_requete_conditionnelle(self):
+        url = f'/api/products/{self.produits[0].slug}/'
+        etag = async_to_sync(self.async_client.get)(url)['ETag']
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+        response = async_to_sync(self.async_client.get)(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_delegation_aux_vues_drf(self):
+        # Pagination, écriture et routes voisines restent aux vues DRF
+        response = async_to_sync(self.async_client.get)('/api/products/', {'page_size': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        response = async_to_sync(self.async_client.post)('/api/products/', {})
+        self.assertIn(response.status_code, (401, 403))
+        response = async_to_sync(self.async_client.get)('/api/products/categories/')
+        self.assertEqual(response.json()[0]['slug'], 'parfums')
+
+    @override_settings(VUES_ASYNC=False)
+    @mock.patch.object(views_async, 'produits_categorie_drf')
+    def test_desactivation(self, vue_drf):
+        async_to_sync(self.async_client.get)('/api/products/categories/parfums/produits/')
+        vue_drf.assert_not_called()
+        catalogue_cache.get_cache().clear()
+        with mock.patch.object(CategorieViewSet, 'produits', side_effect=AssertionError) as produits:
+            with self.assertRaises(AssertionError):
+                async_to_sync(self.async_client.get)('/api/products/categories/parfums/produits/')
+        produits.assert_called_once()
+
+
+class BenchmarkVuesAsyncTests(TransactionTestCase):
+    def test_trois_modes_sans_erreur(self):
+        sortie = StringIO()
+        call_command('benchmark_async_views', clients=2, requetes=8, produits=2, stdout=sortie)
+        lignes = sortie.getvalue().splitlines()[1:]
+        self.assertEqual([ligne.split()[0] for ligne in lignes], ['wsgi', 'asgi', 'asgi-async'])
+        self.assertEqual([ligne.split()[-1] for ligne in lignes], ['0', '0', '0'])
+        self.assertFalse(Produit.objects.exists())
+
+
+def image_televersee(nom='flacon.png', taille=(2000, 1000), mode='RGBA'):
+    tampon = BytesIO()
+    Image.new(mode, taille, (200, 30, 30, 128)[:len(mode)]).save(tampon, 'PNG')
+    return SimpleUploadedFile(nom, tampon.getvalue(), content_type='image/png')
+
+
+class DeclinaisonsImagesTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        reglages = override_settings(MEDIA_ROOT=media, IMAGES_WORKERS=0)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+
+    def creer_produit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Produit.objects.create(
+                nom="Flacon", categorie=self.categorie, description="", prix=Decimal('10'),
+                image_principale=image_televersee(),
+            )
+
+    def test_declinaisons_apres_televersement(self):
+        produit = self.creer_produit()
+        nom = produit.image_principale.name
+        for taille, boite in images.TAILLES.items():
+            for extension in images.FORMATS:
+                with default_storage.open(images.chemin_derive(nom, taille, extension)) as fichier:
+                    image = Image.open(fichier)
+                    self.assertEqual(image.size, (boite[0], boite[0] // 2))
+                    self.assertEqual(image.format, images.FORMATS[extension]['format'])
+
+        response = APIClient().get(f'/api/products/{produit.slug}/')
+        derives = response.data['image_principale_derives']
+        self.assertTrue(derives['miniature']['webp'].endswith(
+            images.chemin_derive(nom, 'miniature', 'webp')
+        ))
+
+    def test_pas_de_declinaison_sans_image(self):
+        produit, = creer_produits(self.categorie, 1)
+        response = APIClient().get(f'/api/products/{produit.slug}/')
+        self.assertIsNone(response.data['image_principale_derives'])
+
+    def test_rattrapage_en_parallele(self):
+        produit = self.creer_produit()
+        galerie = ImageProduit(produit=produit, image=image_televersee('galerie.png', (300, 300), 'RGB'))
+        ImageProduit.objects.bulk_create([galerie])  # sans signal : aucune déclinaison
+        shutil.rmtree(os.path.join(default_storage.location, images.PREFIXE))
+
+        sortie = StringIO()
+        call_command('generate_image_derivatives', workers=2, stdout=sortie)
+        self.assertIn("2 images, 2 traitées (12 déclinaisons), 0 échecs", sortie.getvalue())
+        self.assertTrue(default_storage.exists(images.chemin_derive(galerie.image.name, 'zoom', 'jpeg')))
+
+
+class StockageContenuHacheTests(CatalogueTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        reglages = override_settings(MEDIA_ROOT=media_root, IMAGES_WORKERS=0)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.storage = stockage_media()
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+
+    def creer_produit(self, nom, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Produit.objects.create(
+                nom=nom, categorie=self.categorie, description="", prix=Decimal('10'),
+                image_principale=image,
+            )
+
+    def references(self, nom):
+        return FichierMedia.objects.get(nom=nom).references
+
+    def gc(self, **options):
+        sortie = StringIO()
+        call_command('gc_media', delai=0, stdout=sortie, **options)
+        return sortie.getvalue()
+
+    def test_televersements_identiques_dedupliques(self):
+        premier = self.creer_produit("Flacon 50ml", image_televersee('flacon-50.PNG'))
+        second = self.creer_produit("Flacon 100ml", image_televersee('flacon-100.png'))
+
+        nom = premier.image_principale.name
+        self.assertEqual(nom, second.image_principale.name)
+        self.assertRegex(nom, r'^produits/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.storage.listdir('produits')[1], [posixpath.basename(nom)])
+        self.assertEqual(self.references(nom), 2)
+
+        autre = self.creer_produit("Coffret", image_televersee('coffret.png', (300, 300), 'RGB'))
+        self.assertNotEqual(autre.image_principale.name, nom)
+
+    def test_gc_apres_suppression(self):
+        premier = self.creer_produit("Flacon 50ml", image_televersee())
+        second = self.creer_produit("Flacon 100ml", image_televersee())
+        nom = premier.image_principale.name
+        miniature = images.chemin_derive(nom, 'miniature', 'webp')
+        self.assertTrue(self.storage.exists(miniature))
+
+        premier.delete()
+        self.assertEqual(self.references(nom), 1)
+        self.assertIn("0 fichiers supprimés", self.gc())
+        self.assertTrue(self.storage.exists(nom))
+
+        second.delete()
+        self.assertIn("1 fichiers à supprimer", self.gc(dry_run=True))
+        self.assertTrue(self.storage.exists(nom))
+        self.assertIn("7 fichiers supprimés", self.gc())
+        self.assertFalse(self.storage.exists(nom))
+        self.assertFalse(self.storage.exists(miniature))
+        self.assertFalse(FichierMedia.objects.filter(nom=nom).exists())
+
+    def test_image_remplacee_et_galerie(self):
+        produit = self.creer_produit("Flacon", image_televersee())
+        ancien = produit.image_principale.name
+        galerie = ImageProduit.objects.create(produit=produit, image=image_televersee())
+        self.assertEqual(self.references(ancien), 2)
+
+        produit.image_principale = image_televersee('nouveau.png', (300, 300), 'RGB')
+        produit.save()
+        self.assertEqual(self.references(ancien), 1)
+        self.assertEqual(self.references(produit.image_principale.name), 1)
+
+        # Supprimer le produit emporte sa galerie : plus aucune référence
+        produit.delete()
+        self.gc()
+        self.assertFalse(self.storage.exists(ancien))
+        self.assertFalse(self.storage.exists(galerie.image.name))
+        self.assertFalse(FichierMedia.objects.exists())
+
+    def test_fichiers_recents_epargnes(self):
+        produit = self.creer_produit("Flacon", image_televersee())
+        nom = produit.image_principale.name
+        produit.delete()
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(self.storage.exists(nom))
+
+    def test_parcours_complet(self):
+        produit = self.creer_produit("Flacon", image_televersee())
+        perdu = default_storage.save('produits/ancien-nom.png', image_televersee())
+        images.generer_derives(perdu)
+        FichierMedia.objects.all().delete()
+
+        self.assertIn("7 fichiers supprimés", self.gc(complet=True))
+        self.assertFalse(default_storage.exists(perdu))
+        self.assertTrue(self.storage.exists(produit.image_principale.name))
+        self.assertEqual(self.references(produit.image_principale.name), 1)
+
+    def test_cache_immuable(self):
+        produit = self.creer_produit("Flacon", image_televersee())
+        fichiers = Fichiers.depuis_reglages()
+        for nom in (produit.image_principale.name, images.chemin_derive(produit.image_principale.name, 'carte', 'webp')):
+            reponse = fichiers.repondre('GET', f'/media/{nom}', {})
+            self.assertEqual(dict(reponse.en_tetes)['Cache-Control'], CACHE_IMMUABLE)
+
+        ancien = default_storage.save('produits/ancien-nom.png', image_televersee())
+        reponse = fichiers.repondre('GET', f'/media/{ancien}', {})
+        self.assertEqual(dict(reponse.en_tetes)['Cache-Control'], CACHE_REVALIDER)
+
+
+class ServiceFichiersTests(TestCase):
+    def setUp(self):
+        self.statiques = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.statiques)
+        self.contenu = b'body { color: #c03; }\n' * 200
+        self.chemin = os.path.join(self.statiques, 'css', 'site.css')
+        os.makedirs(os.path.dirname(self.chemin))
+        with open(self.chemin, 'wb') as fichier:
+            fichier.write(self.contenu)
+        self.fichiers = Fichiers([('/static/', self.statiques, lambda nom: False)])
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'django']
+        self.application = FichiersWSGI(application, self.fichiers)
+
+    def get(self, path, methode='GET', file_wrapper=None, **en_tetes):
+        environ = RequestFactory().generic(methode, path, **en_tetes).environ
+        if file_wrapper:
+            environ['wsgi.file_wrapper'] = file_wrapper
+        reponse = {}
+
+        def start_response(statut, en_tetes):
+            reponse['statut'] = int(statut.split()[0])
+            reponse['en_tetes'] = dict(en_tetes)
+        corps = self.application(environ, start_response)
+        reponse['corps'] = b''.join(corps)
+        getattr(corps, 'close', lambda: None)()
+        return reponse
+
+    def test_fichier_complet_sans_copie(self):
+        envois = []
+
+        def file_wrapper(fichier, taille_bloc):
+            envois.append(fichier.name)
+            return iter(lambda: fichier.read(taille_bloc), b'')
+
+        reponse = self.get('/static/css/site.css', file_wrapper=file_wrapper)
+        self.assertEqual(reponse['statut'], 200)
+        self.assertEqual(reponse['corps'], self.contenu)
+        self.assertEqual(envois, [self.chemin])
+        self.assertEqual(reponse['en_tetes']['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(reponse['en_tetes']['Content-Length'], str(len(self.contenu)))
+
+        self.assertEqual(self.get('/api/products/')['corps'], b'django')
+        self.assertEqual(self.get('/static/css/absent.css')['statut'], 404)
+        self.assertEqual(self.get('/static/../../etc/passwd')['statut'], 404)
+        self.assertEqual(self.get('/static/css/site.css', methode='POST')['statut'], 405)
+        tete = self.get('/static/css/site.css', methode='HEAD')
+        self.assertEqual((tete['corps'], tete['en_tetes']['Content-Length']), (b'', str(len(self.contenu))))
+
+    def test_requetes_conditionnelles(self):
+        en_tetes = self.get('/static/css/site.css')['en_tetes']
+        reponse = self.get('/static/css/site.css', HTTP_IF_NONE_MATCH=en_tetes['ETag'])
+        self.assertEqual((reponse['statut'], reponse['corps']), (304, b''))
+        self.assertEqual(reponse['en_tetes']['ETag'], en_tetes['ETag'])
+        reponse = self.get('/static/css/site.css', HTTP_IF_MODIFIED_SINCE=en_tetes['Last-Modified'])
+        self.assertEqual(reponse['statut'], 304)
+        self.assertEqual(self.get('/static/css/site.css', HTTP_IF_NONE_MATCH='"autre"')['statut'], 200)
+
+    def test_plages(self):
+        reponse = self.get('/static/css/site.css', HTTP_RANGE='bytes=5-14')
+        self.assertEqual(reponse['statut'], 206)
+        self.assertEqual(reponse['corps'], self.contenu[5:15])
+        self.assertEqual(reponse['en_tetes']['Content-Range'], f'bytes 5-14/{len(self.contenu)}')
+
+        self.assertEqual(self.get('/static/css/site.css', HTTP_RANGE='bytes=-4')['corps'], self.contenu[-4:])
+        self.assertEqual(self.get('/static/css/site.css', HTTP_RANGE='bytes=100000-')['statut'], 416)
+        # Copie du client périmée : fichier complet
+        reponse = self.get('/static/css/site.css', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"perime"')
+        self.assertEqual((reponse['statut'], reponse['corps']), (200, self.contenu))
+
+    def test_variantes_precompressees(self):
+        with override_settings(STATIC_ROOT=self.statiques):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertTrue(os.path.exists(self.chemin + '.gz'))
+        self.assertTrue(os.path.exists(os.path.join(self.statiques, 'admin', 'css', 'base.css.gz')))
+
+        reponse = self.get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(reponse['en_tetes']['Content-Encoding'], 'gzip')
+        self.assertEqual(reponse['en_tetes']['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(reponse['corps']), self.contenu)
+
+        reponse = self.get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', reponse['en_tetes'])
+        self.assertEqual(reponse['corps'], self.contenu)
+        reponse = self.get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_RANGE='bytes=0-3')
+        self.assertEqual(reponse['corps'], self.contenu[:4])
+
+    def test_asgi(self):
+        async def application(scope, receive, send):
+            raise AssertionError("requête transmise à Django")
+
+        async def appeler(extensions=None, **en_tetes):
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': '/static/css/site.css',
+                'headers': [(cle.encode(), valeur.encode()) for cle, valeur in en_tetes.items()],
+                'extensions': extensions or {},
+            }
+            await FichiersASGI(application, self.fichiers)(scope, None, send)
+            return messages
+
+        messages = asyncio.run(appeler(range='bytes=10-19'))
+        self.assertEqual(messages[0]['status'], 206)
+        self.assertEqual(b''.join(message.get('body', b'') for message in messages[1:]), self.contenu[10:20])
+        self.assertFalse(messages[-1].get('more_body', False))
+
+        messages = asyncio.run(appeler(extensions={'http.response.zerocopy': {}}))
+        self.assertEqual(messages[1]['type'], 'http.response.zerocopy')
+        self.assertEqual((messages[1]['offset'], messages[1]['count']), (0, len(self.contenu)))
+
+
+class TransfertsCatalogueTests(CatalogueTestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        super().setUp()
+        self.categorie = Categorie.objects.create(nom="Parfums", slug="parfums")
+        self.existant = Produit.objects.create(
+            nom="Crème", slug="creme", categorie=self.categorie, description="Ancienne", prix=Decimal('10.00'), stock=3,
+        )
+        self.admin = User.objects.create_user('admin', is_staff=True)
+
+    def importer(self, contenu, format='csv', **kwargs):
+        lignes = transferts.lire(StringIO(contenu), format)
+        return transferts.Import(**kwargs).executer(lignes).rapport()
+
+    def test_slugs_uniques_par_lot(self):
+        Produit.objects.create(nom="Crème", slug="creme-3", categorie=self.categorie, description="", prix=1)
+        with self.assertNumQueries(2):
+            slugs = transferts.slugs_uniques(Produit, ["Crème", "Neuf", "CRÈME", "Neuf"], reserves={'neuf-2'})
+        self.assertEqual(slugs, ['creme-4', 'neuf', 'creme-5', 'neuf-3'])
+
+    def test_import_prix_recalcule_paniers(self):
+        panier = Panier.objects.create(session_id='invite')
+        panier.ajouter_article(self.existant, 2)
+        self.importer("slug,prix\ncreme,50\n")
+        panier.refresh_from_db()
+        self.assertEqual((panier.nombre_articles, panier.montant_total), (2, Decimal('100.00')))
+
+    def test_import_csv(self):
+        rapport = self.importer(
+            "slug,nom,categorie,prix,stock,description\n"
+            "creme,,,12.50,,\n"                          # modification partielle
+            ",Crème,parfums,5,1,Nouvelle\n"              # slug généré
+            "eau-neuve,Eau neuve,parfums,7.90,,\n"
+            ",Sans prix,parfums,,,\n"
+            ",Inconnue,inconnue,1,,\n"
+            "eau-neuve,Doublon,parfums,1,,\n"
+        )
+        self.assertEqual((rapport['lignes'], rapport['crees'], rapport['modifiees'], rapport['erreurs']), (6, 2, 1, 3))
+        self.assertEqual([erreur['ligne'] for erreur in rapport['details_erreurs']], [5, 6, 7])
+
+        self.existant.refresh_from_db()
+        self.assertEqual((self.existant.prix, self.existant.stock, self.existant.description), (Decimal('12.50'), 3, "Ancienne"))
+        self.assertEqual(Produit.objects.get(slug='creme-2').description, "Nouvelle")
+        self.assertEqual(Produit.objects.get(slug='eau-neuve').categorie, self.categorie)
+
+    def test_requetes_par_lot(self):
+        def contenu(nom, nombre):
+            return ''.join(f'{{"nom": "{nom} {i}", "categorie": "parfums", "prix": 1}}\n' for i in range(nombre))
+
+        with CaptureQueriesContext(connection) as petit:
+            self.importer(contenu("Petit", 5), format='jsonl', taille_lot=100)
+        with CaptureQueriesContext(connection) as grand:
+            self.importer(contenu("Grand", 80), format='jsonl', taille_lot=100)
+        self.assertEqual(len(petit), len(grand))
+        self.assertEqual(Produit.objects.count(), 86)
+
+    def test_import_invalide_le_cache(self):
+        self.assertEqual(len(self.client.get('/api/products/').data), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.importer('{"nom": "Nouveau", "categorie": "parfums", "prix": 3}\n', format='jsonl')
+        self.assertEqual(len(self.client.get('/api/products/').data), 2)
+
+    def test_categories(self):
+        rapport = self.importer(
+            '{"nom": "Soins"}\n{"slug": "parfums", "description": "Mise à jour"}\nnon json\n',
+            format='jsonl', modele='categories',
+        )
+        self.assertEqual((rapport['crees'], rapport['modifiees'], rapport['erreurs']), (1, 1, 1))
+        self.assertEqual(Categorie.objects.get(slug='parfums').description, "Mise à jour")
+        self.assertTrue(Categorie.objects.filter(slug='soins').exists())
+
+    def test_api(self):
+        fichier = SimpleUploadedFile('catalogue.csv', b'\xef\xbb\xbfnom,categorie,prix\nSavon,parfums,2.50\n')
+        self.assertEqual(self.client.post('/api/products/import/', {'fichier': fichier}).status_code, 401)
+
+        self.client.force_authenticate(self.admin)
+        fichier.seek(0)
+        response = self.client.post('/api/products/import/', {'fichier': fichier})
+        self.assertEqual((response.status_code, response.data['crees']), (200, 1))
+
+        response = self.client.get('/api/products/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(response.streaming)
+        contenu = b''.join(response.streaming_content).decode()
+        self.assertEqual(contenu.splitlines()[0], ','.join(transferts.TRANSFERTS['produits'].colonnes))
+        self.assertIn('savon,Savon,parfums,,2.50,0,True,,', contenu)
+
+        response = self.client.get('/api/products/categories/export/', {'type': 'jsonl'})
+        self.assertEqual(b''.join(response.streaming_content), b'{"slug": "parfums", "nom": "Parfums", "description": ""}\n')
+        self.assertEqual(self.client.get('/api/products/export/', {'type': 'xml'}).status_code, 400)
+
+    def test_commandes_aller_retour(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'produits.jsonl')
+            call_command('export_catalog', chemin, stderr=StringIO())
+            Produit.objects.update(prix=0)
+            sortie = StringIO()
+            call_command('import_catalog', chemin, stdout=sortie)
+        self.assertIn("0 créées, 1 modifiées, 0 en erreur", sortie.getvalue())
+        self.existant.refresh_from_db()
+        self.assertEqual(self.existant.prix, Decimal('10.00'))
@@ -0,0 +1,350 @@
+"""
+Import et export en masse du catalogue (produits ou catégories), en CSV ou
+JSON Lines.
+
+L'import lit le fichier ligne à ligne et le traite par lots de
+`taille_lot` lignes : validation de chaque ligne, catégories résolues par
+slug dans un dictionnaire chargé une seule fois, slugs manquants générés
+pour tout le lot (`slugs_uniques`), puis `bulk_create` des nouvelles lignes
+et `bulk_update` des existantes (même slug), dans une transaction par lot.
+Une ligne ne porte que les colonnes à modifier : les autres gardent leur
+valeur. `bulk_create` et `bulk_update` n'émettant pas de signaux, l'index
+de recherche et le cache du catalogue sont mis à jour lot par lot.
+
+L'export parcourt la table avec `iterator(chunk_size=...)` et produit le
+fichier au fil de l'eau : la mémoire ne dépend pas du nombre de lignes.
+"""
+import csv
+import json
+import operator
+import time
+from decimal import Decimal
+from functools import reduce
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from orders.models import Panier
+from . import cache as catalogue_cache
+from . import search
+from .models import Categorie, Produit
+
+FORMATS = ('csv', 'jsonl')
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+# Erreurs détaillées dans le rapport (les suivantes sont seulement comptées)
+ERREURS_MAX = 100
+
+
+class ProduitLigneSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=200, required=False, allow_blank=True)
+    nom = serializers.CharField(max_length=200, required=False)
+    categorie = serializers.SlugField(max_length=100, required=False)
+    description = serializers.CharField(required=False, allow_blank=True)
+    prix = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    disponible = serializers.BooleanField(required=False)
+    marque = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    volume = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+
+class CategorieLigneSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=100, required=False, allow_blank=True)
+    nom = serializers.CharField(max_length=100, required=False)
+    description = serializers.CharField(required=False, allow_blank=True)
+
+
+class Transfert:
+    """Description d'un modèle importable : colonnes du fichier et champs en base."""
+
+    def __init__(self, modele, serializer_class, colonnes, requis, defauts=None, champs=None):
+        self.modele = modele
+        self.serializer_class = serializer_class
+        self.colonnes = colonnes
+        # Colonnes obligatoires pour créer une ligne (pas pour la modifier)
+        self.requis = requis
+        self.defauts = defauts or {}
+        # Expression de `values_list` de chaque colonne, pour l'export
+        self.champs = [(champs or {}).get(colonne, colonne) for colonne in colonnes]
+
+
+TRANSFERTS = {
+    'produits': Transfert(
+        Produit, ProduitLigneSerializer,
+        colonnes=('slug', 'nom', 'categorie', 'description', 'prix', 'stock', 'disponible', 'marque', 'volume'),
+        requis=('nom', 'categorie', 'prix'),
+        defauts={'description': ''},
+        champs={'categorie': 'categorie__slug'},
+    ),
+    'categories': Transfert(
+        Categorie, CategorieLigneSerializer,
+        colonnes=('slug', 'nom', 'description'),
+        requis=('nom',),
+    ),
+}
+
+
+def format_du_fichier(nom):
+    """Format déduit de l'extension du fichier, ou None."""
+    for extension, format in EXTENSIONS.items():
+        if str(nom).lower().endswith(extension):
+            return format
+    return None
+
+
+def lire(flux, format):
+    """(numéro de ligne, données) de chaque ligne d'un flux texte ; données None si illisibles."""
+    if format == 'csv':
+        lecteur = csv.DictReader(flux)
+        for ligne in lecteur:
+            # Cellule vide : colonne absente, la valeur en base (ou par défaut) est conservée
+            yield lecteur.line_num, {cle: valeur for cle, valeur in ligne.items() if cle and valeur not in ('', None)}
+    else:
+        for numero, texte in enumerate(flux, 1):
+            if not texte.strip():
+                continue
+            try:
+                ligne = json.loads(texte)
+            except ValueError:
+                ligne = None
+            yield numero, ligne if isinstance(ligne, dict) else None
+
+
+def _commence_par(base):
+    # Sous SQLite, `LIKE ... ESCAPE` n'utilise pas l'index unique du slug, un
+    # intervalle si (les slugs ne contiennent pas de caractère entre '-' et '.')
+    if connection.vendor == 'sqlite':
+        return Q(slug__gt=f'{base}-', slug__lt=f'{base}.')
+    return Q(slug__startswith=f'{base}-')
+
+
+def slugs_uniques(modele, noms, reserves=()):
+    """
+    Slugs libres pour de nouvelles lignes, tirés de leurs noms : `base`, puis
+    `base-2`, `base-3`... au-delà du plus grand suffixe déjà en base. Une
+    requête pour tout le lot, plus une par centaine de noms déjà pris.
+    """
+    # Place pour le suffixe numérique
+    longueur = modele._meta.get_field('slug').max_length - 8
+    bases = [slugify(nom)[:longueur].strip('-') or modele._meta.model_name for nom in noms]
+    derniers = dict.fromkeys(bases, 0)
+    pris = list(modele.objects.filter(slug__in=derniers).values_list('slug', flat=True))
+    for base in pris:
+        derniers[base] = 1
+    # Par groupes : SQLite limite la profondeur des expressions
+    for debut in range(0, len(pris), 100):
+        groupe = pris[debut:debut + 100]
+        filtre = reduce(operator.or_, (_commence_par(base) for base in groupe))
+        for slug in modele.objects.filter(filtre).values_list('slug', flat=True):
+            base, _, suffixe = slug.rpartition('-')
+            if base in groupe and suffixe.isdigit():
+                derniers[base] = max(derniers[base], int(suffixe))
+
+    slugs = []
+    for base in bases:
+        while True:
+            derniers[base] += 1
+            slug = base if derniers[base] == 1 else f'{base}-{derniers[base]}'
+            if slug not in reserves:
+                break
+        slugs.append(slug)
+    return slugs
+
+
+def par_lots(lignes, taille):
+    """Listes successives de `taille` éléments d'un itérable."""
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def _message(erreurs):
+    return '; '.join(
+        f"{champ} : {' '.join(str(message) for message in messages)}"
+        for champ, messages in erreurs.items()
+    )
+
+
+class Import:
+    """
+    Import d'un fichier dans le modèle `modele` (clé de `TRANSFERTS`).
+
+    `executer` consomme les lignes de `lire` ; `rapport` résume le résultat
+    (lignes créées, modifiées, en erreur et débit).
+    """
+
+    def __init__(self, modele='produits', taille_lot=1000):
+        self.transfert = TRANSFERTS[modele]
+        self.taille_lot = taille_lot
+        self.lignes = self.crees = self.modifiees = 0
+        # Une seule instance : DRF copie ses champs à chaque instanciation
+        self.serializer = self.transfert.serializer_class()
+        self.erreurs = []
+        self.nombre_erreurs = 0
+        self.duree = 0
+        self.categories = None
+        if self.transfert.modele is Produit:
+            self.categories = dict(Categorie.objects.values_list('slug', 'id'))
+
+    def erreur(self, numero, message):
+        self.nombre_erreurs += 1
+        if len(self.erreurs) < ERREURS_MAX:
+            self.erreurs.append({'ligne': numero, 'erreur': message})
+
+    def executer(self, lignes):
+        debut = time.monotonic()
+        for lot in par_lots(lignes, self.taille_lot):
+            self.lignes += len(lot)
+            self.importer_lot(lot)
+        self.duree = time.monotonic() - debut
+        return self
+
+    def valider(self, lot):
+        valides = []
+        for numero, ligne in lot:
+            if ligne is None:
+                self.erreur(numero, "Ligne illisible")
+                continue
+            try:
+                donnees = dict(self.serializer.run_validation(ligne))
+            except serializers.ValidationError as erreur:
+                self.erreur(numero, _message(erreur.detail))
+                continue
+            if self.categories is not None and 'categorie' in donnees:
+                categorie_id = self.categories.get(donnees.pop('categorie'))
+                if categorie_id is None:
+                    self.erreur(numero, "categorie : catégorie inconnue")
+                    continue
+                donnees['categorie_id'] = categorie_id
+            valides.append((numero, donnees))
+        return valides
+
+    def importer_lot(self, lot):
+        modele = self.transfert.modele
+        valides = self.valider(lot)
+        explicites = {donnees['slug'] for _, donnees in valides if donnees.get('slug')}
+        existantes = modele.objects.in_bulk(explicites, field_name='slug') if explicites else {}
+
+        nouvelles, modifiees, champs = [], {}, set()
+        vus = set()
+        for numero, donnees in valides:
+            slug = donnees.pop('slug', '')
+            if slug in vus:
+                self.erreur(numero, "slug : en double dans le lot")
+                continue
+            instance = existantes.get(slug)
+            if instance is not None:
+                for champ, valeur in donnees.items():
+                    setattr(instance, champ, valeur)
+                champs.update(donnees)
+                modifiees[slug] = instance
+            else:
+                manquants = [
+                    champ for champ in self.transfert.requis
+                    if champ not in donnees and f'{champ}_id' not in donnees
+                ]
+                if manquants:
+                    self.erreur(numero, '; '.join(f"{champ} : requis pour une création" for champ in manquants))
+                    continue
+                nouvelles.append(modele(slug=slug, **{**self.transfert.defauts, **donnees}))
+            if slug:
+                vus.add(slug)
+
+        sans_slug = [instance for instance in nouvelles if not instance.slug]
+        for instance, slug in zip(sans_slug, slugs_uniques(modele, [i.nom for i in sans_slug], reserves=vus)):
+            instance.slug = slug
+
+        modifiees = list(modifiees.values())
+        maintenant = timezone.now()
+        for instance in modifiees:
+            # `bulk_update` ne renseigne pas les champs auto_now
+            instance.date_modification = maintenant
+        try:
+            with transaction.atomic():
+                nouvelles = modele.objects.bulk_create(nouvelles, batch_size=self.taille_lot)
+                if modifiees:
+                    modele.objects.bulk_update(
+                        modifiees, [*champs, 'date_modification'], batch_size=self.taille_lot
+                    )
+                self.apres_enregistrement(nouvelles, modifiees, champs)
+        except IntegrityError as erreur:
+            # Slug créé entre-temps par une autre écriture : le lot est ignoré
+            self.erreur(lot[0][0], f"Lot de {len(lot)} lignes ignoré : {erreur}")
+            return
+        self.crees += len(nouvelles)
+        self.modifiees += len(modifiees)
+
+    def apres_enregistrement(self, nouvelles, modifiees, champs):
+        """
+        Ce que feraient les signaux `post_save` : index de recherche, cache du
+        catalogue et, si les prix changent, totaux des paniers concernés.
+        """
+        instances = nouvelles + modifiees
+        if self.transfert.modele is Categorie:
+            portees = {'categories', 'produits', *(f'categorie:{instance.id}' for instance in instances)}
+        else:
+            if search.est_disponible():
+                search.indexer_produits(instances)
+            if modifiees and 'prix' in champs:
+                Panier.objects.filter(articles__produit__in=modifiees).distinct().recalculer_totaux()
+            portees = {'produits'}
+            for instance in instances:
+                portees.update((
+                    f'produit:{instance.slug}',
+                    f'categorie:{instance.categorie_id}',
+                    f'categorie:{instance._categorie_initiale}',
+                ))
+        transaction.on_commit(lambda: catalogue_cache.invalider(*portees), robust=True)
+
+    @property
+    def lignes_par_seconde(self):
+        return self.lignes / self.duree if self.duree else 0
+
+    def rapport(self):
+        return {
+            'lignes': self.lignes,
+            'crees': self.crees,
+            'modifiees': self.modifiees,
+            'erreurs': self.nombre_erreurs,
+            'duree': round(self.duree, 3),
+            'lignes_par_seconde': round(self.lignes_par_seconde),
+            'details_erreurs': sorted(self.erreurs, key=lambda erreur: erreur['ligne']),
+        }
+
+
+class TamponCSV:
+    """Pseudo-fichier pour `csv.writer` : `write` rend la ligne au lieu de l'écrire."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def exporter(modele='produits', format='csv', taille_lot=1000):
+    """
+    Générateur des morceaux (str) du fichier d'export, un par lot de
+    `taille_lot` lignes, pour `StreamingHttpResponse` ou un fichier.
+    """
+    transfert = TRANSFERTS[modele]
+    lignes = (
+        transfert.modele.objects.order_by('pk')
+        .values_list(*transfert.champs)
+        .iterator(chunk_size=taille_lot)
+    )
+    if format == 'csv':
+        ecrivain = csv.writer(TamponCSV())
+        yield ecrivain.writerow(transfert.colonnes)
+        encoder = ecrivain.writerow
+    else:
+        def encoder(ligne):
+            return json.dumps(dict(zip(transfert.colonnes, ligne)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    for lot in par_lots(lignes, taille_lot):
+        yield ''.join(encoder(ligne) for ligne in lot)
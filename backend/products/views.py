@@ -1,41 +1,121 @@
+import io
+
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from .models import Categorie, Produit, ImageProduit
 from .serializers import CategorieSerializer, ProduitSerializer, ProduitDetailSerializer, ImageProduitSerializer
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from .pagination import KeysetPagination
+from .search import ProduitSearchFilter
+from . import cache as catalogue_cache
+from . import transferts
+from nkcommerce.routeurs import LectureRepliqueMixin
 
 # Create your views here.
 
-class CategorieViewSet(viewsets.ModelViewSet):
+TYPES_FICHIER = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+
+class TransfertMixin:
+    """
+    Import (`POST import/`, fichier en multipart) et export en flux
+    (`GET export/`) du modèle `transfert` de `transferts.TRANSFERTS`.
+    Le format (`type`) est `csv` ou `jsonl`, déduit du nom du fichier importé.
+    """
+    transfert = None
+
+    def get_taille_lot(self, valeur):
+        try:
+            taille_lot = int(valeur or 1000)
+        except ValueError:
+            taille_lot = 0
+        if not 1 <= taille_lot <= 10000:
+            raise ValidationError({'taille_lot': 'Entier entre 1 et 10000 attendu'})
+        return taille_lot
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def importer(self, request, *args, **kwargs):
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            raise ValidationError({'fichier': 'Fichier CSV ou JSON Lines attendu'})
+        format = request.data.get('type') or transferts.format_du_fichier(fichier.name)
+        if format not in transferts.FORMATS:
+            raise ValidationError({'type': f"Format attendu : {', '.join(transferts.FORMATS)}"})
+        taille_lot = self.get_taille_lot(request.data.get('taille_lot'))
+        # Lecture au fil de l'eau du fichier téléversé (sur disque au-delà de FILE_UPLOAD_MAX_MEMORY_SIZE)
+        flux = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+        rapport = transferts.Import(self.transfert, taille_lot).executer(transferts.lire(flux, format)).rapport()
+        return Response(rapport)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def exporter(self, request, *args, **kwargs):
+        format = request.query_params.get('type', 'csv')
+        if format not in transferts.FORMATS:
+            raise ValidationError({'type': f"Format attendu : {', '.join(transferts.FORMATS)}"})
+        response = StreamingHttpResponse(
+            transferts.exporter(self.transfert, format, self.get_taille_lot(request.query_params.get('taille_lot'))),
+            content_type=TYPES_FICHIER[format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.transfert}.{format}"'
+        return response
+
+
+class CategorieViewSet(TransfertMixin, LectureRepliqueMixin, viewsets.ModelViewSet):
     queryset = Categorie.objects.all()
     serializer_class = CategorieSerializer
     lookup_field = 'slug'
+    actions_replique = ('list', 'retrieve', 'produits')
+    transfert = 'categories'
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'produits']:
             permission_classes = [permissions.AllowAny]
         else:
             permission_classes = [permissions.IsAdminUser]
         return [permission() for permission in permission_classes]
     
+    def list(self, request, *args, **kwargs):
+        return catalogue_cache.reponse_en_cache(
+            request, ['categories'], lambda: super(CategorieViewSet, self).list(request, *args, **kwargs)
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        return catalogue_cache.reponse_en_cache(
+            request, ['categories'], lambda: super(CategorieViewSet, self).retrieve(request, *args, **kwargs)
+        )
+    
     @action(detail=True, methods=['get'])
     def produits(self, request, slug=None):
         categorie = self.get_object()
-        produits = Produit.objects.filter(categorie=categorie, disponible=True)
-        serializer = ProduitSerializer(produits, many=True)
-        return Response(serializer.data)
+        
+        def construire():
+            produits = ProduitSerializer.setup_eager_loading(
+                Produit.objects.filter(categorie=categorie, disponible=True)
+            )
+            serializer = ProduitSerializer(produits, many=True)
+            return Response(serializer.data)
+        
+        return catalogue_cache.reponse_en_cache(
+            request, ['categories', f'categorie:{categorie.id}'], construire
+        )
 
 
-class ProduitViewSet(viewsets.ModelViewSet):
+class ProduitViewSet(TransfertMixin, LectureRepliqueMixin, viewsets.ModelViewSet):
     queryset = Produit.objects.all()
     serializer_class = ProduitSerializer
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    actions_replique = ('list', 'retrieve', 'nouveautes')
+    transfert = 'produits'
+    filter_backends = [DjangoFilterBackend, ProduitSearchFilter, filters.OrderingFilter]
     filterset_fields = ['categorie', 'marque', 'disponible']
     search_fields = ['nom', 'description', 'marque']
     ordering_fields = ['prix', 'date_creation', 'nom']
+    pagination_class = KeysetPagination
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -49,8 +129,27 @@ class ProduitViewSet(viewsets.ModelViewSet):
             return ProduitDetailSerializer
         return ProduitSerializer
     
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(super().get_queryset())
+    
+    def list(self, request, *args, **kwargs):
+        return catalogue_cache.reponse_en_cache(
+            request, ['produits', 'categories'], lambda: super(ProduitViewSet, self).list(request, *args, **kwargs)
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        return catalogue_cache.reponse_en_cache(
+            request, ['categories', f"produit:{kwargs['slug']}"],
+            lambda: super(ProduitViewSet, self).retrieve(request, *args, **kwargs)
+        )
+    
     @action(detail=False, methods=['get'])
     def nouveautes(self, request):
-        nouveautes = Produit.objects.filter(disponible=True).order_by('-date_creation')[:8]
-        serializer = ProduitSerializer(nouveautes, many=True)
-        return Response(serializer.data)
+        def construire():
+            nouveautes = ProduitSerializer.setup_eager_loading(
+                Produit.objects.filter(disponible=True).order_by('-date_creation')
+            )[:8]
+            serializer = ProduitSerializer(nouveautes, many=True)
+            return Response(serializer.data)
+        
+        return catalogue_cache.reponse_en_cache(request, ['produits', 'categories'], construire)
@@ -0,0 +1,98 @@
+"""
+Variantes async des lectures les plus fréquentes du catalogue.
+
+Sous ASGI, `nkcommerce.middleware.vues_async_middleware` route les URL de
+`nkcommerce/urls_asgi.py` vers ces vues Django natives : elles s'exécutent
+sur la boucle d'événements, lisent la base avec l'ORM async (`aget`,
+`async for`) et partagent le cache et les validateurs HTTP des vues DRF.
+Les requêtes qu'elles ne couvrent pas (écritures, filtres, pagination,
+API navigable) sont confiées à la vue DRF d'origine. Comme elles, les vues
+lisent sur une réplique quand il y en a (`nkcommerce.routeurs`).
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+
+from nkcommerce.routeurs import alecture_replique
+
+from . import cache as catalogue_cache
+from .models import Categorie, Produit
+from .serializers import ProduitDetailSerializer, ProduitSerializer
+from .views import CategorieViewSet, ProduitViewSet
+
+# Actions des routes du routeur DRF, pour la délégation
+liste_produits_drf = ProduitViewSet.as_view({'get': 'list', 'post': 'create'})
+detail_produit_drf = ProduitViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+})
+produits_categorie_drf = CategorieViewSet.as_view({'get': 'produits'})
+
+
+def prise_en_charge(request, parametres=False):
+    """Vrai si la vue async sait répondre : lecture JSON, sans paramètres de requête."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if 'text/html' in request.headers.get('Accept', ''):
+        return False  # API navigable de DRF
+    return parametres or not request.GET
+
+
+def introuvable(modele):
+    # Message de `get_object_or_404`, tel que renvoyé par DRF
+    return catalogue_cache.reponse_json(
+        {'detail': f"No {modele._meta.object_name} matches the given query."}, status=404
+    )
+
+
+@csrf_exempt
+async def liste_produits(request):
+    if not prise_en_charge(request):
+        return await sync_to_async(liste_produits_drf)(request)
+
+    async def construire():
+        produits = ProduitSerializer.setup_eager_loading(Produit.objects.all())
+        produits = [produit async for produit in produits]
+        return ProduitSerializer(produits, many=True, context={'request': request}).data
+
+    async with alecture_replique(request):
+        return await catalogue_cache.areponse_en_cache(request, ['produits', 'categories'], construire)
+
+
+@csrf_exempt
+async def detail_produit(request, slug):
+    if not prise_en_charge(request):
+        return await sync_to_async(detail_produit_drf)(request, slug=slug)
+
+    async def construire():
+        produits = ProduitDetailSerializer.setup_eager_loading(Produit.objects.all())
+        produit = await produits.aget(slug=slug)
+        return ProduitDetailSerializer(produit, context={'request': request}).data
+
+    try:
+        async with alecture_replique(request):
+            return await catalogue_cache.areponse_en_cache(
+                request, ['categories', f'produit:{slug}'], construire
+            )
+    except Produit.DoesNotExist:
+        return introuvable(Produit)
+
+
+@csrf_exempt
+async def produits_categorie(request, slug):
+    if not prise_en_charge(request):
+        return await sync_to_async(produits_categorie_drf)(request, slug=slug)
+
+    async with alecture_replique(request):
+        categorie_id = await Categorie.objects.filter(slug=slug).values_list('id', flat=True).afirst()
+        if categorie_id is None:
+            return introuvable(Categorie)
+
+        async def construire():
+            produits = ProduitSerializer.setup_eager_loading(
+                Produit.objects.filter(categorie_id=categorie_id, disponible=True)
+            )
+            produits = [produit async for produit in produits]
+            return ProduitSerializer(produits, many=True).data
+
+        return await catalogue_cache.areponse_en_cache(
+            request, ['categories', f'categorie:{categorie_id}'], construire
+        )
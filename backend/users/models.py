@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from products import images
 
 # Create your models here.
 
@@ -27,3 +28,9 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profil.save()
+
+
+@receiver(post_save, sender=Profil)
+def decliner_photo_profil(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.planifier(instance.photo)
@@ -11,6 +11,7 @@ from django.http import JsonResponse, HttpResponse
 import json
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
+from orders.paniers import fusionner_panier_invite
 
 
 @api_view(['POST'])
@@ -20,6 +21,8 @@ def register_user(request):
     serializer = UserCreateSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
+        # Reprendre le panier constitué avant l'inscription
+        fusionner_panier_invite(request, user)
         # Créer un token pour l'utilisateur
         token, created = Token.objects.get_or_create(user=user)
         return Response({
@@ -55,6 +58,9 @@ def test_register(request):
                 last_name=data.get('last_name', '')
             )
             
+            # Reprendre le panier constitué avant l'inscription
+            fusionner_panier_invite(request, user)
+            
             # Create token for the user
             token, created = Token.objects.get_or_create(user=user)
             
@@ -128,6 +134,8 @@ def obtain_token(request):
                     status=401
                 )
             
+            # Reprendre le panier constitué avant la connexion
+            fusionner_panier_invite(request, user)
             token, created = Token.objects.get_or_create(user=user)
             
             return HttpResponse(